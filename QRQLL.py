@@ -1,22 +1,203 @@
 import os
 import sys
 import time
+import gzip
+import io
 import json
-from shutil import copy2
-from threading import Thread
+import random
+import signal
+import struct
+import mmap
+import heapq
+import bisect
+import uuid
+import argparse
+import tempfile
+import mimetypes
+import threading
+import multiprocessing
+import multiprocessing.connection
+from shutil import copyfileobj
+from queue import Queue
+from itertools import islice
+from collections import OrderedDict, deque
+from threading import Thread, Lock, Event
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
-from typing import Dict
-from tkinter import filedialog, messagebox, StringVar, Text
-from socket import socket, AF_INET, SOCK_DGRAM
-import ttkbootstrap as ttk
-from flask import Flask, jsonify, request, send_from_directory
-from ttkbootstrap.constants import *
-from ttkbootstrap.utility import *
-from PIL import Image
-from PIL.ImageTk import PhotoImage
-from waitress import serve
-
-HOMEWORK_DATA = [
+from typing import Dict, Optional
+from socket import socket, AF_INET, AF_INET6, SOCK_DGRAM, SOL_SOCKET, SO_REUSEADDR
+from urllib.parse import quote
+from flask import Flask, abort, jsonify, request
+from werkzeug.http import parse_range_header
+from werkzeug.security import safe_join
+from waitress import create_server
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    from socket import SO_REUSEPORT
+except ImportError:
+    SO_REUSEPORT = None
+from qrqll_core import (HomeworkSnapshot, HomeworkStore, ResourceIndex, ConfigDB, ContentStore, fast_copy, make_writable,
+                        import_homework, format_import_result, UNMATCHED_ROUTE, RequestMetrics, MetricsMiddleware,
+                        FILE_BLOCK_SIZE, FileSlice, MultipartRanges, ChangeFeed)
+
+class DeviceStats:
+    __slots__ = ("ip", "first_seen", "last_seen", "last_path", "requests", "bytes", "latencies", "online")
+
+    def __init__(self, ip: str, now: float, window: int):
+        self.ip, self.first_seen, self.last_seen, self.last_path = ip, now, now, ""
+        self.requests, self.bytes, self.online = 0, 0, True
+        self.latencies = deque(maxlen=window)
+
+class PresenceTracker:
+    """设备在线状态：请求侧加锁 O(1) 更新；离线判定用按到期时间排序的堆（惰性更新，O(log n)）；
+    超过 max_devices 时淘汰最久未活动的设备（LRU）"""
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+    def __init__(self, max_devices: int = 1024, offline_after: float = 300.0, latency_window: int = 128):
+        self.max_devices = max_devices
+        self.offline_after = offline_after
+        self.latency_window = latency_window
+        self._lock = Lock()
+        self._devices: "OrderedDict[str, DeviceStats]" = OrderedDict()
+        self._expiry = []
+        self.evicted = 0
+        self.changes = 0
+
+    def __len__(self): return len(self._devices)
+
+    def _device(self, ip: str, now: float) -> DeviceStats:
+        """调用方持有锁：取出（不存在时新建）设备记录，移到 LRU 末尾并标记在线"""
+        dev = self._devices.get(ip)
+        if dev is None:
+            dev = self._devices[ip] = DeviceStats(ip, now, self.latency_window)
+            while len(self._devices) > self.max_devices:
+                self._devices.popitem(last=False)
+                self.evicted += 1
+            heapq.heappush(self._expiry, (now + self.offline_after, ip))
+        else:
+            self._devices.move_to_end(ip)
+            if not dev.online:
+                dev.online = True
+                heapq.heappush(self._expiry, (now + self.offline_after, ip))
+        return dev
+
+    def touch(self, ip: str, path: str, nbytes: int = 0, latency: float = None, now: float = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            dev = self._device(ip, now)
+            dev.last_seen, dev.last_path = now, path
+            dev.requests += 1
+            dev.bytes += nbytes
+            self.changes += 1
+            if latency is not None: dev.latencies.append(latency)
+
+    def merge(self, ip: str, last_seen: float, last_path: str, requests: int, nbytes: int, latencies):
+        """合并工作进程上报的一段时间内某设备的请求汇总（多进程模式）"""
+        with self._lock:
+            dev = self._device(ip, last_seen)
+            # 各进程的上报先后不定，只让更晚的活动覆盖最近路径
+            if last_seen >= dev.last_seen: dev.last_seen, dev.last_path = last_seen, last_path
+            dev.requests += requests
+            dev.bytes += nbytes
+            dev.latencies.extend(latencies)
+            self.changes += 1
+
+    def sweep(self, now: float = None) -> list:
+        """把到期的设备标记为离线，返回本次转为离线的 IP；只处理堆顶已到期的条目"""
+        now = time.time() if now is None else now
+        went_offline = []
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                _, ip = heapq.heappop(self._expiry)
+                dev = self._devices.get(ip)
+                if dev is None or not dev.online: continue
+                due = dev.last_seen + self.offline_after
+                # 期间有过新请求：按最新活动时间重新入堆
+                if due > now: heapq.heappush(self._expiry, (due, ip))
+                else:
+                    dev.online = False
+                    went_offline.append(ip)
+        return went_offline
+
+    def histogram(self, dev: DeviceStats) -> list:
+        counts = [0] * (len(self.LATENCY_BUCKETS) + 1)
+        for v in list(dev.latencies): counts[bisect.bisect_left(self.LATENCY_BUCKETS, v)] += 1
+        return counts
+
+    def snapshot(self) -> list:
+        with self._lock: devices = list(self._devices.values())
+        result = []
+        for d in devices:
+            lat = sorted(d.latencies)
+            result.append({"ip": d.ip, "time": d.last_seen, "first_seen": d.first_seen, "path": d.last_path, "online": d.online, "requests": d.requests, "bytes": d.bytes,
+                           "latency_p50": lat[len(lat) // 2] if lat else None, "latency_hist": self.histogram(d)})
+        return result
+
+    def remove_offline(self):
+        self.sweep()
+        with self._lock:
+            for ip in [ip for ip, d in self._devices.items() if not d.online]: del self._devices[ip]
+            self.changes += 1
+
+    def clear(self):
+        with self._lock:
+            self._devices.clear()
+            self._expiry.clear()
+            self.changes += 1
+
+    def history(self):
+        """返回 (变更计数, [(ip, first_seen, last_seen, last_path, requests, bytes), ...])，供持久化"""
+        with self._lock: return self.changes, [(d.ip, d.first_seen, d.last_seen, d.last_path, d.requests, d.bytes) for d in self._devices.values()]
+
+    def restore(self, rows):
+        """载入持久化的设备历史（均视为离线）；本次启动后已出现过的 IP 保留当前记录"""
+        with self._lock:
+            # 按 last_seen 从新到旧逐个插到最前，最久未活动的排在 LRU 头部
+            for ip, first_seen, last_seen, last_path, requests, nbytes in sorted(rows, key=lambda r: r[2], reverse=True):
+                if ip in self._devices: continue
+                dev = self._devices[ip] = DeviceStats(ip, first_seen, self.latency_window)
+                dev.last_seen, dev.last_path, dev.requests, dev.bytes, dev.online = last_seen, last_path or "", requests, nbytes, False
+                self._devices.move_to_end(ip, last=False)
+            while len(self._devices) > self.max_devices: self._devices.popitem(last=False)
+
+class LogQueue:
+    """请求日志队列：请求线程只做 deque.append（GIL 下原子，无需加锁），
+    界面线程定时批量取出再格式化；队列满时丢弃最旧的记录并计数"""
+    def __init__(self, maxlen: int = 5000):
+        self._items = deque(maxlen=maxlen)
+        self.dropped = 0
+
+    def __len__(self): return len(self._items)
+
+    def push(self, record):
+        # 计数不加锁，并发时可能少计几条，仅用于提示
+        if len(self._items) >= self._items.maxlen: self.dropped += 1
+        self._items.append(record)
+
+    def drain(self, limit: int) -> list:
+        batch, pop = [], self._items.popleft
+        try:
+            for _ in range(limit): batch.append(pop())
+        except IndexError: pass
+        return batch
+
+    def clear(self):
+        self._items.clear()
+        self.dropped = 0
+
+def format_log_record(record) -> str:
+    ts, addr, method, path, status, headers = record
+    msg = f"[{datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')}] {addr} - \"{method} {path}\" {status}"
+    if headers is None: return msg
+    lines = [msg, "-" * 20 + " HEADERS " + "-" * 20]
+    lines.extend(f"{k}: {v}" for k, v in headers)
+    lines.append("-" * 49)
+    return "\n".join(lines)
+
+HOMEWORK_STORE = HomeworkStore([
     {
         "id": "1867975578577879042",
         "name": "百度搜索（横屏版）",
@@ -33,37 +214,183 @@ HOMEWORK_DATA = [
         "scale": 0.5,
         "orientation": "portrait"
     }
-]
+])
 ENABLE_CLOSE_HW = False
 ENABLE_LOGGING = False
 ENABLE_LOG_HEADERS = False
 LAST_SHUTDOWN_CLICK = 0
 
-CONNECTED_DEVICES = {}
+CONNECTED_DEVICES = PresenceTracker(max_devices=1024, offline_after=300)
+LOG_QUEUE = LogQueue(maxlen=5000)
+LOG_DRAIN_MS = 100
+LOG_BATCH_MAX = 500
+LOG_MAX_LINES = 2000
+
+# ------------------------------------------------------------------
+# 监控：qrqll_core.MetricsMiddleware 在 WSGI 层统计每个路由的请求数、耗时、响应大小与状态码，以 Prometheus 文本格式从 /metrics 导出
+# ------------------------------------------------------------------
+
+METRICS_REFRESH_MS = 2000
+METRICS = RequestMetrics("/resources/")
+
+# ------------------------------------------------------------------
+# 性能剖析（按需开启，关闭时每个请求只多一次属性判断）：
+# 按比例抽样请求用 cProfile 剖析并按路由汇总；后台线程定时采样所有线程的调用栈，输出火焰图用的折叠栈；
+# tracemalloc 快照之间做差，找出持续增长的内存
+# ------------------------------------------------------------------
+
+PROFILE_SAMPLE_RATE = 0.1
+STACK_SAMPLE_INTERVAL = 0.01
+STACK_MAX_DISTINCT = 20000
+TRACEMALLOC_FRAMES = 10
 
-gui_instance = None
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = PROFILE_SAMPLE_RATE
+        self.profiled = 0
+        self.stack_samples = 0
+        self.stacks_dropped = 0
+        self._lock = Lock()
+        # cProfile 同一时刻只剖析一个请求：3.12 起解释器全局只允许一个剖析器，并发的请求直接跳过
+        self._profile_lock = Lock()
+        self._routes: Dict[str, object] = {}  # 路由 -> pstats.Stats
+        self._stacks: Dict[str, int] = {}
+        self._sampler: Optional[Thread] = None
+        self._snapshot = None
+
+    def start(self, sample_rate: Optional[float] = None):
+        if sample_rate is not None: self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        with self._lock:
+            if self.enabled: return
+            self.enabled = True
+            self._sampler = Thread(target=self._sample_stacks, daemon=True, name="qrqll-stack-sampler")
+            self._sampler.start()
+
+    def stop(self):
+        with self._lock: self.enabled, sampler = False, self._sampler
+        if sampler is not None: sampler.join()
+
+    def reset(self):
+        with self._lock:
+            self._routes, self._stacks = {}, {}
+            self.profiled = self.stack_samples = self.stacks_dropped = 0
+
+    def status(self) -> dict:
+        with self._lock: routes = sorted(self._routes)
+        import tracemalloc
+        return {"enabled": self.enabled, "sampleRate": self.sample_rate, "profiled": self.profiled, "routes": routes,
+                "stackSamples": self.stack_samples, "distinctStacks": len(self._stacks), "stacksDropped": self.stacks_dropped, "tracemalloc": tracemalloc.is_tracing()}
+
+    def should_profile(self) -> bool: return random.random() < self.sample_rate and self._profile_lock.acquire(blocking=False)
+
+    def profile(self, fn, *args):
+        """在 cProfile 下调用 fn；调用方须已通过 should_profile 取得锁。返回 (结果, Profile)"""
+        import cProfile
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+            try: return fn(*args), prof
+            finally: prof.disable()
+        finally: self._profile_lock.release()
+
+    def record(self, route: str, prof):
+        import pstats
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None: self._routes[route] = pstats.Stats(prof)
+            else: stats.add(prof)
+            self.profiled += 1
+
+    def stats_text(self, route: Optional[str] = None, sort: str = "cumulative", limit: int = 40) -> str:
+        """按路由（不指定时合并全部路由）输出 pstats 报告"""
+        import pstats
+        out = io.StringIO()
+        with self._lock:
+            selected = [s for r, s in self._routes.items() if route is None or r == route]
+            if not selected: return "暂无剖析数据\n"
+            merged = pstats.Stats(stream=out)
+            merged.add(*selected)
+            merged.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def _sample_stacks(self):
+        me = threading.get_ident()
+        while self.enabled:
+            time.sleep(STACK_SAMPLE_INTERVAL)
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me: continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                parts.append(names.get(ident, str(ident)))
+                key = ";".join(reversed(parts))
+                with self._lock:
+                    if key in self._stacks: self._stacks[key] += 1
+                    elif len(self._stacks) < STACK_MAX_DISTINCT: self._stacks[key] = 1
+                    else: self.stacks_dropped += 1
+            self.stack_samples += 1
+
+    def collapsed_stacks(self) -> str:
+        """Brendan Gregg 折叠栈格式（线程名;外层;...;内层 次数），可直接交给 flamegraph.pl / speedscope"""
+        with self._lock: stacks = sorted(self._stacks.items())
+        return "".join(f"{k} {n}\n" for k, n in stacks)
+
+    def memory_start(self):
+        import tracemalloc
+        if not tracemalloc.is_tracing(): tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._snapshot = None
+
+    def memory_stop(self):
+        import tracemalloc
+        tracemalloc.stop()
+        self._snapshot = None
+
+    def memory_snapshot(self, limit: int = 25, key_type: str = "lineno") -> str:
+        """拍一张快照并与上一张做差（首次与空快照比较），返回增长最多的分配位置"""
+        import tracemalloc
+        if not tracemalloc.is_tracing(): self.memory_start()
+        snap = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")])
+        prev, self._snapshot = self._snapshot, snap
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"当前 {format_size(current)}，峰值 {format_size(peak)}" + ("" if prev else "（首张快照，以下为全部分配）")]
+        stats = snap.compare_to(prev, key_type) if prev else snap.statistics(key_type)
+        lines += [str(s) for s in stats[:limit]]
+        return "\n".join(lines) + "\n"
+
+class ProfilerMiddleware:
+    def __init__(self, wsgi_app, profiler: Profiler):
+        self.wsgi_app, self.profiler = wsgi_app, profiler
+
+    def __call__(self, environ, start_response):
+        profiler = self.profiler
+        if not profiler.enabled or not profiler.should_profile(): return self.wsgi_app(environ, start_response)
+        body, prof = profiler.profile(self.wsgi_app, environ, start_response)
+        profiler.record(environ.get("qrqll.route") or UNMATCHED_ROUTE, prof)
+        return body
+
+PROFILER = Profiler()
 
 app = Flask(__name__)
+app.wsgi_app = MetricsMiddleware(ProfilerMiddleware(app.wsgi_app, PROFILER), METRICS)
+
+@app.before_request
+def mark_request_start():
+    request.environ["qrqll.start"] = time.perf_counter()
+    if request.url_rule is not None: request.environ["qrqll.route"] = request.url_rule.rule
 
 @app.after_request
 def log_request(response):
-    CONNECTED_DEVICES[request.remote_addr] = {
-        "time": time.time(),
-        "path": request.path
-    }
+    start = request.environ.get("qrqll.start")
+    CONNECTED_DEVICES.touch(request.remote_addr, request.path, response.content_length or 0, time.perf_counter() - start if start else None)
     
     if ENABLE_LOGGING:
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        msg = f"[{now}] {request.remote_addr} - \"{request.method} {request.path}\" {response.status_code}"
-        if gui_instance:
-            gui_instance.append_log(msg)
-        if ENABLE_LOG_HEADERS:
-            h_msg = "-" * 20 + " HEADERS " + "-" * 20 + "\n"
-            for k, v in request.headers.items():
-                h_msg += f"{k}: {v}\n"
-            h_msg += "-" * 49
-            if gui_instance:
-                gui_instance.append_log(h_msg)
+        # 只记录原始字段，字符串格式化留给界面线程批量处理
+        LOG_QUEUE.push((time.time(), request.remote_addr, request.method, request.path, response.status_code,
+                        list(request.headers.items()) if ENABLE_LOG_HEADERS else None))
     return response
 
 def get_app_dir():
@@ -75,25 +402,66 @@ APP_DIR = get_app_dir()
 RESOURCES_DIR = os.path.join(APP_DIR, "resources")
 if not os.path.exists(RESOURCES_DIR):
     os.makedirs(RESOURCES_DIR)
+RESOURCE_INDEX = ResourceIndex(RESOURCES_DIR)
 
 def ok(result=None, message: str = ""):
     return jsonify({"status": 0, "message": message, "result": result if result is not None else {}})
 
+def format_size(size: float) -> str:
+    for u in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024.0: break
+        size /= 1024.0
+    return f"{size:.1f} {u}"
+
 def get_param(name: str, default: str = "") -> str:
     if request.args.get(name) is not None:
         return request.args.get(name, default)
     return request.form.get(name, default)
 
-def build_homework_list_dynamic(page_index: int, page_size: int) -> Dict:
+# 进程启动标识，避免重启后版本号从 0 重新计数时与旧 ETag 撞车
+BOOT_ID = format(int(time.time() * 1000), "x")
+
+def is_not_modified(etag: str, last_modified: float = None) -> bool:
+    if request.method not in ("GET", "HEAD"): return False
+    if request.if_none_match: return request.if_none_match.contains(etag)
+    if last_modified is not None and request.if_modified_since: return int(last_modified) <= request.if_modified_since.timestamp()
+    return False
+
+def conditional_response(etag: str, last_modified: float, build, compressible: bool = False):
+    """条件请求命中时在构建响应体之前直接返回 304；build 为生成完整响应的回调。
+    compressible 时按协商出的编码区分 ETag，压缩结果按 (ETag, host) 缓存"""
+    encoding = negotiate_encoding() if compressible else None
+    if encoding: etag = f"{etag}-{encoding}"
+    if is_not_modified(etag, last_modified): resp = app.response_class(status=304)
+    else:
+        resp = build()
+        if encoding: resp = compress_response(resp, encoding, (etag, request.host))
+    if resp.status_code in (200, 206, 304):
+        resp.set_etag(etag)
+        resp.last_modified = int(last_modified)
+        resp.headers["Cache-Control"] = "no-cache"
+    if compressible: resp.vary.add("Accept-Encoding")
+    return resp
+
+def resource_etag(entry: dict) -> str:
+    # 内容哈希已算出时按内容给 ETag：同一内容换名、重新复制都不会让客户端缓存失效
+    digest = CONTENT_STORE.lookup(entry)
+    return f"sha256-{digest}" if digest else f"{entry['fileId']}-{entry['size']:x}-{int(entry['mtime'] * 1e6):x}"
+
+def build_homework_list_dynamic(page_index: int, page_size: int, snap: HomeworkSnapshot = None) -> Dict:
     data_list = []
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    source_data = list(HOMEWORK_DATA)
-    if ENABLE_CLOSE_HW:
-        source_data.append({"id": "SYS_CLOSE_001", "name": "🔴 关闭服务端", "lessonName": "系统", "url": f"http://{request.host}/api/shutdown", "scale": 1.0, "orientation": "landscape"})
+    snap = snap or HOMEWORK_STORE.snapshot()
+    # 时间取配置最后修改时间，同一版本的响应体逐字节一致，ETag 才能成立
+    now = datetime.fromtimestamp(snap.updated_at).strftime("%Y-%m-%d %H:%M:%S")
+    entries = snap.entries
+    total = len(entries) + (1 if ENABLE_CLOSE_HW else 0)
     
     start = (page_index - 1) * page_size
     end = start + page_size
-    sliced_data = source_data[start:end]
+    # 快照是不可变元组，只切出当前页；「关闭程序」作业虚拟地排在末尾
+    sliced_data = entries[start:end]
+    if ENABLE_CLOSE_HW and start <= len(entries) < end:
+        sliced_data += ({"id": "SYS_CLOSE_001", "name": "🔴 关闭服务端", "lessonName": "系统", "url": f"http://{request.host}/api/shutdown", "scale": 1.0, "orientation": "landscape"},)
 
     for hw in sliced_data:
         data_list.append({
@@ -104,18 +472,17 @@ def build_homework_list_dynamic(page_index: int, page_size: int) -> Dict:
 
     return {
         "pageIndex": page_index, "pageSize": page_size,
-        "pageCount": (len(source_data) + page_size - 1) // page_size,
-        "recordCount": len(source_data), "data": data_list
+        "pageCount": (total + page_size - 1) // page_size,
+        "recordCount": total, "data": data_list
     }
 
-def build_homework_detail_dynamic(homework_id: str) -> Dict:
+def build_homework_detail_dynamic(homework_id: str, host: str = None, snap: HomeworkSnapshot = None) -> Dict:
     if homework_id == "SYS_CLOSE_001":
-        target_hw = {"id": "SYS_CLOSE_001", "name": "🔴 关闭服务端", "url": f"http://{request.host}/api/shutdown", "scale": 1.0, "orientation": "landscape"}
+        target_hw = {"id": "SYS_CLOSE_001", "name": "🔴 关闭服务端", "url": f"http://{host or request.host}/api/shutdown", "scale": 1.0, "orientation": "landscape"}
     else:
-        target_hw = next((item for item in HOMEWORK_DATA if item["id"] == homework_id), None)
-        if not target_hw:
-            target_hw = HOMEWORK_DATA[0] if HOMEWORK_DATA else {}
-            if not target_hw: return {}
+        snap = snap or HOMEWORK_STORE.snapshot()
+        target_hw = snap.index.get(homework_id) or (snap.entries[0] if snap.entries else None)
+        if not target_hw: return {}
     
     iframe_url = target_hw.get("url", "")
     hw_name = target_hw.get("name", "")
@@ -157,14 +524,288 @@ def build_homework_detail_dynamic(homework_id: str) -> Dict:
         }], "trajectoryPageDTOs": None
     }
 
+# ------------------------------------------------------------------
+# 作业详情缓存：按 (配置版本, homeworkId) 缓存编码后的完整响应体，ETag 与响应体取自同一快照
+# 配置变更时在修改线程中同步清空，只为改动过的作业在后台预热，其余条目等请求到来时再渲染。
+# 普通作业的详情与请求的 Host 无关；只有“关闭服务端”条目含 Host，每次现渲染，不进缓存——
+# Host 头由客户端随意填写，按它建缓存会无限增长
+# ------------------------------------------------------------------
+
+DETAIL_WARM_MAX = 100  # 批量导入时只预热前这么多条
+
+_DETAIL_CACHE: Dict[tuple, bytes] = {}
+_DETAIL_LOCK = Lock()
+_DETAIL_GEN = 0
+
+def render_homework_detail(homework_id: str, host: str, snap: HomeworkSnapshot = None) -> bytes:
+    payload = {"status": 0, "message": "", "result": build_homework_detail_dynamic(homework_id, host, snap)}
+    return (app.json.dumps(payload, separators=(",", ":")) + "\n").encode("utf-8")
+
+def get_homework_detail_bytes(homework_id: str, host: str = None, snap: HomeworkSnapshot = None) -> bytes:
+    snap = snap or HOMEWORK_STORE.snapshot()
+    key = (snap.version, homework_id)
+    body = _DETAIL_CACHE.get(key)
+    if body is not None: return body
+    body = render_homework_detail(homework_id, host, snap)
+    # 未知 ID 会回退到第一条作业，不缓存，避免任意 ID 撑大缓存
+    if homework_id in snap.index:
+        with _DETAIL_LOCK:
+            # 构建期间配置被修改过则丢弃，缓存里只留当前快照的内容
+            if snap is HOMEWORK_STORE.snapshot(): _DETAIL_CACHE[key] = body
+    return body
+
+def invalidate_detail_cache(ids=(), warm: bool = True):
+    """丢弃旧版本的缓存；ids 为改动过的作业，只为它们预热"""
+    global _DETAIL_GEN
+    with _DETAIL_LOCK:
+        _DETAIL_GEN += 1
+        _DETAIL_CACHE.clear()
+        gen = _DETAIL_GEN
+    ids = list(islice(ids, DETAIL_WARM_MAX))
+    if warm and ids: Thread(target=warm_detail_cache, args=(ids, gen), daemon=True).start()
+
+def warm_detail_cache(ids, gen: int):
+    snap = HOMEWORK_STORE.snapshot()
+    for hw_id in ids:
+        # 预热期间又有修改：本轮作废，交给新一轮
+        if gen != _DETAIL_GEN: return
+        try: get_homework_detail_bytes(hw_id, snap=snap)
+        except Exception: pass
+
+HOMEWORK_STORE.subscribe(lambda action, ids: invalidate_detail_cache(ids if action == "upsert" else ()))
+
+# ------------------------------------------------------------------
+# 资源文件发送：单/多区间 Range（206），优先交给服务器的 wsgi.file_wrapper
+# （Waitress 会在 I/O 线程里直接从文件推送，不占用工作线程），否则用 mmap 切片
+# ------------------------------------------------------------------
+
+MAX_RANGES = 16
+
+def parse_byte_ranges(size: int):
+    """返回 [(start, end_exclusive), ...]；无 Range 头或应忽略时返回 None，全部不可满足时返回 []"""
+    header = request.headers.get("Range")
+    if not header: return None
+    rng = parse_range_header(header)
+    if rng is None or rng.units != "bytes" or len(rng.ranges) > MAX_RANGES: return None
+    result = []
+    for start, stop in rng.ranges:
+        if start < 0: start, stop = max(size + start, 0), size
+        else: stop = size if stop is None else min(stop, size)
+        if start < stop: result.append((start, stop))
+    return result
+
+def if_range_matches(etag: str, mtime: float) -> bool:
+    if_range = request.if_range
+    if if_range.etag: return if_range.etag == etag
+    if if_range.date: return int(mtime) <= if_range.date.timestamp()
+    return True
+
+def send_file_ranges(path: str, etag: str, mimetype: str = None, download_name: str = None):
+    f = open(path, "rb")
+    try:
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        mimetype = mimetype or mimetypes.guess_type(path)[0] or "application/octet-stream"
+        ranges = parse_byte_ranges(size) if "Range" in request.headers and if_range_matches(etag, st.st_mtime) else None
+        headers = {"Accept-Ranges": "bytes"}
+        if download_name: headers["Content-Disposition"] = f'attachment; filename="{download_name.replace(chr(34), "")}"' if download_name.isascii() else f"attachment; filename*=UTF-8''{quote(download_name)}"
+        if ranges == []:
+            f.close()
+            headers["Content-Range"] = f"bytes */{size}"
+            return app.response_class(status=416, headers=headers)
+        if ranges and len(ranges) > 1:
+            boundary = uuid.uuid4().hex
+            parts = [(f"--{boundary}\r\nContent-Type: {mimetype}\r\nContent-Range: bytes {a}-{b - 1}/{size}\r\n\r\n".encode("ascii"), a, b) for a, b in ranges]
+            tail = f"\r\n--{boundary}--\r\n".encode("ascii")
+            length = sum(len(h) + (b - a) for h, a, b in parts) + 2 * (len(parts) - 1) + len(tail)
+            headers["Content-Length"] = str(length)
+            return app.response_class(MultipartRanges(f, parts, tail), status=206, headers=headers, mimetype=f"multipart/byteranges; boundary={boundary}", direct_passthrough=True)
+        start, stop = ranges[0] if ranges else (0, size)
+        if ranges: headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        headers["Content-Length"] = str(stop - start)
+        wrapper = request.environ.get("wsgi.file_wrapper")
+        # Waitress 与 qrqll_async 的 file_wrapper 按当前读写位置和 Content-Length 截取，其余实现会一直读到文件末尾
+        if wrapper is not None and (stop == size or request.environ.get("SERVER_SOFTWARE", "").startswith(("waitress", "qrqll-async"))):
+            f.seek(start)
+            body = wrapper(f, FILE_BLOCK_SIZE)
+        else: body = FileSlice(f, start, stop - start)
+        return app.response_class(body, status=206 if ranges else 200, headers=headers, mimetype=mimetype, direct_passthrough=True)
+    except Exception:
+        f.close()
+        raise
+
+# ------------------------------------------------------------------
+# 压缩：按 Accept-Encoding 协商 gzip / br（需安装 brotli）
+# 动态接口按 (ETag, host, 编码) 只压缩一次并缓存；文本类静态资源由后台生成预压缩副本
+# ------------------------------------------------------------------
+
+COMPRESS_MIN_SIZE = 1024
+COMPRESSIBLE_SUFFIXES = {"html", "htm", "js", "mjs", "css", "json", "svg", "txt", "xml", "csv", "md"}
+_COMPRESSED: "OrderedDict[tuple, bytes]" = OrderedDict()
+_COMPRESSED_LOCK = Lock()
+_COMPRESSED_MAX = 256
+
+def negotiate_encoding() -> Optional[str]:
+    return request.accept_encodings.best_match(["br", "gzip"] if brotli else ["gzip"])
+
+def compress_bytes(data: bytes, encoding: str) -> bytes:
+    # mtime=0 让同一内容的 gzip 输出逐字节一致
+    return brotli.compress(data, quality=9) if encoding == "br" else gzip.compress(data, 6, mtime=0)
+
+def compress_response(resp, encoding: str, key: tuple):
+    if resp.status_code != 200 or resp.direct_passthrough or "Content-Encoding" in resp.headers: return resp
+    body = _COMPRESSED.get(key)
+    if body is None:
+        data = resp.get_data()
+        if len(data) < COMPRESS_MIN_SIZE: return resp
+        body = compress_bytes(data, encoding)
+        with _COMPRESSED_LOCK:
+            _COMPRESSED[key] = body
+            while len(_COMPRESSED) > _COMPRESSED_MAX: _COMPRESSED.popitem(last=False)
+    resp.set_data(body)
+    resp.headers["Content-Encoding"] = encoding
+    return resp
+
+class SidecarCompressor:
+    """为 RESOURCES_DIR 中的文本类资源在后台生成 .gz/.br 副本（存放在独立目录，不出现在资源列表里），随资源索引增删同步"""
+
+    def __init__(self, index: ResourceIndex, root: str):
+        self.index, self.root = index, root
+        self.encodings = ["br", "gzip"] if brotli else ["gzip"]
+        self.version = 0
+        self._ready: Dict[str, float] = {}
+        self._queue = Queue()
+        self._started = False
+
+    def sidecar_path(self, rel_path: str, encoding: str) -> str:
+        return os.path.join(self.root, *rel_path.split("/")) + (".br" if encoding == "br" else ".gz")
+
+    def lookup(self, entry: dict, encoding: str) -> Optional[str]:
+        """预压缩副本已生成且与源文件同步时返回其路径"""
+        if self._ready.get(entry["path"]) != entry["mtime"]: return None
+        return self.sidecar_path(entry["path"], encoding)
+
+    def start(self):
+        if self._started: return
+        self._started = True
+        self.index.subscribe(lambda changed, removed: [self._queue.put(rel) for rel in changed + removed])
+        for e in self.index.items(): self._queue.put(e["path"])
+        Thread(target=self._worker, daemon=True).start()
+
+    def _worker(self):
+        while True:
+            rel = self._queue.get()
+            try: self._sync(rel)
+            except Exception: pass
+
+    def _sync(self, rel: str):
+        entry = self.index.get(rel)
+        if entry is None or entry["suffix"] not in COMPRESSIBLE_SUFFIXES or entry["size"] < COMPRESS_MIN_SIZE:
+            if self._ready.pop(rel, None) is not None: self.version += 1
+            for enc in self.encodings:
+                try: os.remove(self.sidecar_path(rel, enc))
+                except OSError: pass
+            return
+        if self._ready.get(rel) == entry["mtime"]: return
+        if self._ready.pop(rel, None) is not None: self.version += 1
+        src = self.index.abspath(rel)
+        for enc in self.encodings:
+            dest = self.sidecar_path(rel, enc)
+            # 上次运行留下的副本，mtime 与源文件一致即可直接复用
+            try:
+                if os.stat(dest).st_mtime == entry["mtime"]: continue
+            except OSError: pass
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            tmp = f"{dest}.{os.getpid()}.tmp"
+            with open(src, "rb") as fin, open(tmp, "wb") as fout:
+                if enc == "br":
+                    comp = brotli.Compressor(quality=9)
+                    for chunk in iter(lambda: fin.read(FILE_BLOCK_SIZE), b""): fout.write(comp.process(chunk))
+                    fout.write(comp.finish())
+                else:
+                    with gzip.GzipFile(fileobj=fout, mode="wb", compresslevel=6, mtime=0) as gz: copyfileobj(fin, gz, FILE_BLOCK_SIZE)
+            os.utime(tmp, (entry["mtime"], entry["mtime"]))
+            os.replace(tmp, dest)
+        # 压缩期间源文件又被修改时不标记就绪，等待下一次变更通知
+        cur = self.index.get(rel)
+        if cur is not None and cur["mtime"] == entry["mtime"]:
+            self._ready[rel] = entry["mtime"]
+            self.version += 1
+
+    def dump(self) -> dict: return {"version": self.version, "ready": dict(self._ready)}
+
+    def restore(self, state: dict):
+        self._ready, self.version = state["ready"], state["version"]
+
+SIDECARS = SidecarCompressor(RESOURCE_INDEX, os.path.join(APP_DIR, ".qrqll_cache", "sidecars"))
+
+# 内容寻址存储（qrqll_core.ContentStore）：内容相同的大文件合并为同一对象的硬链接，对象与哈希缓存放在 .qrqll_cache；
+# 被多个名字共用的对象是只读的，界面打开文件前先换成独立副本（detach）
+CONTENT_STORE = ContentStore(RESOURCE_INDEX, os.path.join(APP_DIR, ".qrqll_cache"))
+
+# 剖析接口只接受本机访问：报告里有源码路径和内存内容
+ADMIN_HOSTS = ("127.0.0.1", "::1")
+
+def admin_only(view):
+    def wrapper(*args, **kwargs):
+        if request.remote_addr not in ADMIN_HOSTS: abort(403)
+        return view(*args, **kwargs)
+    wrapper.__name__ = view.__name__
+    return wrapper
+
+def text_response(text: str): return app.response_class(text, mimetype="text/plain; charset=utf-8", headers={"Cache-Control": "no-store"})
+
+@app.route("/admin/profile", methods=["GET"])
+@admin_only
+def admin_profile_status(): return ok(PROFILER.status())
+
+@app.route("/admin/profile/<action>", methods=["POST"])
+@admin_only
+def admin_profile_control(action: str):
+    if action == "start":
+        # 不用 args.get(type=float)：非数字会被静默当作未指定
+        rate = request.args.get("rate")
+        if rate is not None:
+            try: rate = float(rate)
+            except ValueError: rate = None
+            if rate is None or not 0.0 <= rate <= 1.0: abort(400, "rate 须为 0~1 之间的数字")
+        PROFILER.start(rate)
+    elif action == "stop": PROFILER.stop()
+    elif action == "reset": PROFILER.reset()
+    else: abort(404)
+    return ok(PROFILER.status())
+
+@app.route("/admin/profile/stats", methods=["GET"])
+@admin_only
+def admin_profile_stats():
+    try: return text_response(PROFILER.stats_text(request.args.get("route"), request.args.get("sort", "cumulative"), request.args.get("limit", 40, type=int)))
+    except KeyError as e: return ok(message=f"不支持的排序字段：{e}")
+
+@app.route("/admin/profile/stacks", methods=["GET"])
+@admin_only
+def admin_profile_stacks(): return text_response(PROFILER.collapsed_stacks())
+
+# 拍快照会替换对比基准（未开启时还会开启 tracemalloc），同 start/stop 一样只接受 POST
+@app.route("/admin/memory/<action>", methods=["POST"])
+@admin_only
+def admin_memory(action: str):
+    if action == "snapshot": return text_response(PROFILER.memory_snapshot(request.args.get("limit", 25, type=int), "traceback" if request.args.get("by") == "traceback" else "lineno"))
+    if action == "start": PROFILER.memory_start()
+    elif action == "stop": PROFILER.memory_stop()
+    else: abort(404)
+    return ok(PROFILER.status())
+
 @app.route("/api/shutdown", methods=["GET"])
 def api_shutdown():
     global LAST_SHUTDOWN_CLICK
     now = time.time()
-    if now - LAST_SHUTDOWN_CLICK < 3.0:
-        Thread(target=lambda: (time.sleep(1), os._exit(0)), daemon=True).start()
+    # 多进程模式下两次点击可能落到不同的工作进程，上次点击时间放在共享内存里
+    last = SHARED_SHUTDOWN_CLICK.value if SHARED_SHUTDOWN_CLICK is not None else LAST_SHUTDOWN_CLICK
+    if now - last < 3.0:
+        Thread(target=lambda: (time.sleep(1), shutdown_process()), daemon=True).start()
         return "<h2 style='text-align:center;margin-top:20%;font-family:sans-serif;'>服务端已断开，程序退出中...</h2>"
     else:
+        if SHARED_SHUTDOWN_CLICK is not None: SHARED_SHUTDOWN_CLICK.value = now
         LAST_SHUTDOWN_CLICK = now
         return """
         <h2 style='text-align:center; margin-top:20%;'>
@@ -185,35 +826,211 @@ def auth_mock(): return ok({"userId": "student001", "schoolKey": "LOCAL_SCHOOL",
 @app.route("/classInApp/serv-teachplatform/pub/alive", methods=["POST", "GET"])
 def ping_alive(): return ok({"alive": True})
 
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint(): return app.response_class(METRICS.render(), mimetype="text/plain; version=0.0.4", headers={"Cache-Control": "no-store"})
+
+def build_file_item(entry: dict) -> Dict:
+    return {"fileId": entry["fileId"], "fileName": entry["name"], "shareTime": "2024-01-01", "size": str(entry["size"]), "lessonName": "Mock Course", "suffix": entry["suffix"], "fileUrl": f"resources/{entry['path']}", "teacherName": "Mock Teacher", "sha256": CONTENT_STORE.lookup(entry)}
+
+def build_file_list_dynamic(page_index: int, page_size: int) -> Dict:
+    entries = RESOURCE_INDEX.items()
+    total, start = len(entries), (page_index - 1) * page_size
+    items = [build_file_item(e) for e in entries[start:start + page_size]]
+    return {"data": items, "pageCount": (total + page_size - 1) // page_size, "pageIndex": page_index, "pageSize": page_size, "recordCount": total}
+
 @app.route("/serv-teachplatform/courseware/student/selectShareFileList", methods=["GET", "POST"])
 @app.route("/classInApp/serv-teachplatform/courseware/student/selectShareFileList", methods=["GET", "POST"])
 def teacher_file_list():
     page_index, page_size = int(get_param("pageIndex", "1")), int(get_param("pageSize", "20"))
-    files, items = [], []
-    for root, _, filenames in os.walk(RESOURCES_DIR):
-        for name in filenames: files.append(os.path.relpath(os.path.join(root, name), RESOURCES_DIR).replace("\\", "/"))
-    for idx, rel_path in enumerate(sorted(files), start=1):
-        abs_path = os.path.join(RESOURCES_DIR, rel_path)
-        items.append({"fileId": f"file-{idx}", "fileName": os.path.basename(rel_path), "shareTime": "2024-01-01", "size": str(os.path.getsize(abs_path)) if os.path.exists(abs_path) else "0", "lessonName": "Mock Course", "suffix": os.path.splitext(rel_path)[1].lower().lstrip("."), "fileUrl": f"resources/{rel_path}", "teacherName": "Mock Teacher"})
-    total, start = len(items), (page_index - 1) * page_size
-    return ok({"data": items[start:start + page_size], "pageCount": (total + page_size - 1) // page_size, "pageIndex": page_index, "pageSize": page_size, "recordCount": total})
+    etag = f"res-{BOOT_ID}-{RESOURCE_INDEX.version}-{CONTENT_STORE.version}-{page_index}-{page_size}"
+    return conditional_response(etag, RESOURCE_INDEX.updated_at, lambda: ok(build_file_list_dynamic(page_index, page_size)), compressible=True)
 
 @app.route("/resources/<path:filename>")
-def serve_resource(filename: str): return send_from_directory(RESOURCES_DIR, filename, as_attachment=False)
+def serve_resource(filename: str):
+    path = safe_join(RESOURCES_DIR, filename)
+    if path is None or not os.path.isfile(path): abort(404)
+    # 索引键用 safe_join 规范化后的相对路径，URL 里的 ./、../、// 写法不会产生多余条目
+    rel = RESOURCE_INDEX.relpath(path)
+    entry = RESOURCE_INDEX.get(rel)
+    if entry is None:
+        # 监听线程尚未收录的新文件，先补进索引
+        RESOURCE_INDEX.touch(rel)
+        entry = RESOURCE_INDEX.get(rel)
+        if entry is None: abort(404)
+    etag = resource_etag(entry)
+    if entry["suffix"] not in COMPRESSIBLE_SUFFIXES: return conditional_response(etag, entry["mtime"], lambda: send_file_ranges(path, etag))
+    # 文本类资源：整文件请求且预压缩副本就绪时直接发送副本；Range 请求始终按原文件处理
+    encoding = negotiate_encoding() if "Range" not in request.headers else None
+    sidecar = SIDECARS.lookup(entry, encoding) if encoding else None
+    if sidecar is None: resp = conditional_response(etag, entry["mtime"], lambda: send_file_ranges(path, etag))
+    else:
+        etag = f"{etag}-{encoding}"
+        resp = conditional_response(etag, entry["mtime"], lambda: send_file_ranges(sidecar, etag, mimetype=mimetypes.guess_type(path)[0]))
+        if resp.status_code == 200: resp.headers["Content-Encoding"] = encoding
+    resp.vary.add("Accept-Encoding")
+    return resp
 
 @app.route("/classInApp/serv-teachplatform/hw/basicInfo/student/selectPadHomeworkList", methods=["GET", "POST"])
-def homework_list(): return ok(build_homework_list_dynamic(int(get_param("pageIndex", "1")), int(get_param("pageSize", "20"))))
+def homework_list():
+    page_index, page_size = int(get_param("pageIndex", "1")), int(get_param("pageSize", "20"))
+    snap = HOMEWORK_STORE.snapshot()
+    etag = f"hwl-{BOOT_ID}-{snap.version}-{int(ENABLE_CLOSE_HW)}-{page_index}-{page_size}"
+    return conditional_response(etag, snap.updated_at, lambda: ok(build_homework_list_dynamic(page_index, page_size, snap)), compressible=True)
 
 @app.route("/classInApp/serv-teachplatform/hw/basicInfo/student/selectPadHomeworkDetail", methods=["GET", "POST"])
-def homework_detail(): return ok(build_homework_detail_dynamic(get_param("homeworkId")))
+def homework_detail():
+    homework_id = get_param("homeworkId")
+    snap = HOMEWORK_STORE.snapshot()
+    etag = f"hwd-{BOOT_ID}-{snap.version}-{homework_id}"
+    return conditional_response(etag, snap.updated_at, lambda: app.response_class(get_homework_detail_bytes(homework_id, request.host, snap), mimetype=app.json.mimetype), compressible=True)
 
 @app.route("/classInApp/serv-teachplatform/appMenuInfo/list", methods=["GET"])
 @app.route("/serv-teachplatform/appMenuInfo/list", methods=["GET"])
 def app_menu_list(): return ok([{"id": "pkg_001", "appName": "应用卸载", "appKey": "local.app.uninstall"}])
 
+# ------------------------------------------------------------------
+# 变更流：作业配置与资源目录的每次变更记一条事件并递增全局版本号
+# 客户端带上已知版本长轮询 /api/v1/changes（或以 Accept: text/event-stream 订阅 SSE），
+# 版本落后时立即返回，否则阻塞到下一次变更或超时
+# ------------------------------------------------------------------
+
+CHANGES_DEFAULT_WAIT = 25
+CHANGES_MAX_WAIT = 60
+CHANGES_HEARTBEAT = 15
+CHANGES_STREAM_MAX = 300  # SSE 连接持续这么久后让客户端重连，释放工作线程
+CHANGES_RETRY_MS = 5000
+
+CHANGE_FEED = ChangeFeed()
+HOMEWORK_STORE.subscribe(lambda action, ids: CHANGE_FEED.publish("homework", action, ids))
+
+def on_resource_change(changed, removed):
+    if changed: CHANGE_FEED.publish("resources", "upsert", changed)
+    if removed: CHANGE_FEED.publish("resources", "delete", removed)
+
+RESOURCE_INDEX.subscribe(on_resource_change)
+
+def change_cursor() -> Optional[int]:
+    """客户端已知的版本：SSE 重连时取 Last-Event-ID（boot-version），否则取 since/boot 参数；来自上一次启动的版本视为未知"""
+    last = request.headers.get("Last-Event-ID", "")
+    if last: boot, _, since = last.rpartition("-")
+    else: boot, since = get_param("boot"), get_param("since")
+    if boot and boot != BOOT_ID: return None
+    try: return int(since)
+    except ValueError: return None
+
+def sse_event(name: str, data, version: int) -> str:
+    return f"id: {BOOT_ID}-{version}\nevent: {name}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+def change_stream(since: Optional[int]):
+    yield f"retry: {CHANGES_RETRY_MS}\n\n"
+    deadline = time.monotonic() + CHANGES_STREAM_MAX
+    while time.monotonic() < deadline:
+        version, events, busy = CHANGE_FEED.wait(since, CHANGES_HEARTBEAT)
+        # 等待者已满：结束本次连接，客户端按 retry 间隔重连
+        if busy: return
+        if events is None: yield sse_event("reset", {"boot": BOOT_ID, "version": version}, version)
+        elif events:
+            for e in events: yield sse_event("change", e, e["version"])
+        else: yield ": ping\n\n"
+        since = version
+
+@app.route("/api/v1/changes", methods=["GET"])
+def api_changes():
+    since = change_cursor()
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        return app.response_class(change_stream(since), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    try: timeout = min(max(float(get_param("timeout", CHANGES_DEFAULT_WAIT)), 0), CHANGES_MAX_WAIT)
+    except ValueError: timeout = CHANGES_DEFAULT_WAIT
+    version, events, busy = CHANGE_FEED.wait(since, timeout)
+    resp = ok({"boot": BOOT_ID, "version": version, "reset": events is None, "events": events or [], "retry": CHANGES_RETRY_MS if busy else 0})
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+# ------------------------------------------------------------------
+# 后台任务：界面上的耗时操作交给线程池，进度/取消通过 BackgroundTask 共享，
+# 结果经队列回到 Tk 线程处理
+# ------------------------------------------------------------------
+
+GUI_WORKERS = 2
+COPY_WORKERS = 4
+
+class TaskCancelled(Exception): pass
+
+class BackgroundTask:
+    """工作线程累加 done，界面线程定时读取显示；cancel() 后下一次 advance/check 抛出 TaskCancelled"""
+    def __init__(self, label: str, total: int = 0):
+        self.label, self.total, self.done = label, total, 0
+        self._cancel = Event()
+        self._lock = Lock()
+
+    @property
+    def cancelled(self) -> bool: return self._cancel.is_set()
+
+    def cancel(self): self._cancel.set()
+
+    def check(self):
+        if self._cancel.is_set(): raise TaskCancelled()
+
+    def advance(self, n: int):
+        with self._lock: self.done += n
+        self.check()
+
+    def fraction(self) -> Optional[float]:
+        return min(1.0, self.done / self.total) if self.total else None
+
+def _import_gui():
+    """按需加载界面依赖；无界面模式下不会导入 tkinter / ttkbootstrap / PIL"""
+    global ttk, filedialog, messagebox, StringVar, Text, Image, PhotoImage, enable_high_dpi_awareness
+    global BOTH, X, Y, LEFT, RIGHT, W, END, NORMAL, DISABLED, SUNKEN, HORIZONTAL
+    global PRIMARY, SECONDARY, SUCCESS, INFO, WARNING, DANGER, OUTLINE
+    from tkinter import filedialog, messagebox, StringVar, Text
+    import ttkbootstrap as ttk
+    from ttkbootstrap.constants import BOTH, X, Y, LEFT, RIGHT, W, END, NORMAL, DISABLED, SUNKEN, HORIZONTAL
+    from ttkbootstrap.constants import PRIMARY, SECONDARY, SUCCESS, INFO, WARNING, DANGER, OUTLINE
+    from ttkbootstrap.utility import enable_high_dpi_awareness
+    from PIL import Image
+    from PIL.ImageTk import PhotoImage
+
+def get_host_ip():
+    try:
+        s = socket(AF_INET, SOCK_DGRAM)
+        s.connect(('8.8.8.8', 80))
+        ip = s.getsockname()[0]
+        s.close()
+        return ip
+    except: return '127.0.0.1'
+
+class TreeSync:
+    """Treeview 差量刷新：以 iid 为键记住上次各行的值，只删除、插入、修改有变化的行，
+    选中状态和滚动位置因此得以保留"""
+    def __init__(self, tree):
+        self.tree = tree
+        self._rows: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def sync(self, rows):
+        """rows: 按显示顺序排列的 (iid, values) 序列"""
+        tree, old = self.tree, self._rows
+        new = OrderedDict((str(iid), tuple(values)) for iid, values in rows)
+        gone = [iid for iid in old if iid not in new]
+        if gone: tree.delete(*gone)
+        # 保留下来的行相对顺序变了才逐行移动
+        kept = [iid for iid in new if iid in old]
+        if kept != [iid for iid in old if iid in new]:
+            for i, iid in enumerate(kept): tree.move(iid, "", i)
+        for i, (iid, values) in enumerate(new.items()):
+            prev = old.get(iid)
+            if prev is None: tree.insert("", i, iid=iid, values=values)
+            elif prev != values: tree.item(iid, values=values)
+        self._rows = new
+
+    def clear(self):
+        self.tree.delete(*self.tree.get_children())
+        self._rows = OrderedDict()
+
 class MockServerApp:
-    def __init__(self, root):
+    def __init__(self, root, port: int = 2417):
         self.root = root
+        self.port = port
         self.root.title("QRQLL Mock 服务端")
         self.root.geometry("950x650")
         self.target_dir = RESOURCES_DIR
@@ -226,34 +1043,77 @@ class MockServerApp:
         self.init_homework_tab()
         self.init_device_tab()
         self.init_settings_tab()
+        self.init_metrics_tab()
         self.init_log_tab()
 
         self.status_var = StringVar()
         self.status_var.set("服务器运行中...")
-        ttk.Label(self.root, textvariable=self.status_var, relief=SUNKEN, padding=5).pack(fill=X)
+        status_frame = ttk.Frame(self.root)
+        status_frame.pack(fill=X)
+        ttk.Label(status_frame, textvariable=self.status_var, relief=SUNKEN, padding=5).pack(side=LEFT, fill=X, expand=True)
+        self.task_frame = ttk.Frame(status_frame)
+        self.task_var = StringVar()
+        ttk.Label(self.task_frame, textvariable=self.task_var, padding=(5, 0)).pack(side=LEFT)
+        self.task_bar = ttk.Progressbar(self.task_frame, length=160, bootstyle=SUCCESS)
+        self.task_bar.pack(side=LEFT, padx=5)
+        ttk.Button(self.task_frame, text="取消", command=self.cancel_tasks, bootstyle=(DANGER, OUTLINE)).pack(side=LEFT)
+
+        self.pool = ThreadPoolExecutor(GUI_WORKERS, thread_name_prefix="qrqll-gui")
+        self.copy_pool = ThreadPoolExecutor(COPY_WORKERS, thread_name_prefix="qrqll-copy")
+        self.ui_queue = Queue()
+        self.tasks = []
+        self.poll_tasks_loop()
         
         self.refresh_devices_loop()
 
-    def get_host_ip(self):
-        try:
-            s = socket(AF_INET, SOCK_DGRAM)
-            s.connect(('8.8.8.8', 80))
-            ip = s.getsockname()[0]
-            s.close()
-            return ip
-        except: return '127.0.0.1'
-
     def set_app_icon(self):
         try:
             icon_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "icon.png")
             if os.path.exists(icon_path): self.root.iconphoto(False, PhotoImage(Image.open(icon_path)))
         except: pass
 
+    def run_task(self, task: BackgroundTask, fn, *args, on_done=None):
+        """在线程池里执行 fn(task, *args)；完成后在 Tk 线程调用 on_done(result)"""
+        self.tasks.append(task)
+        future = self.pool.submit(fn, task, *args)
+        future.add_done_callback(lambda f: self.ui_queue.put((self.finish_task, (task, f, on_done))))
+        return future
+
+    def finish_task(self, task, future, on_done):
+        self.tasks.remove(task)
+        err = future.exception()
+        if isinstance(err, TaskCancelled): self.status_var.set(f"{task.label}：已取消")
+        elif err is not None: messagebox.showerror("错误", f"{task.label}失败：{err}")
+        elif on_done: on_done(future.result())
+
+    def cancel_tasks(self):
+        for t in self.tasks: t.cancel()
+
+    def poll_tasks_loop(self):
+        while not self.ui_queue.empty():
+            fn, args = self.ui_queue.get_nowait()
+            fn(*args)
+        if self.tasks:
+            t = self.tasks[0]
+            frac = t.fraction()
+            more = f" 等 {len(self.tasks)} 项" if len(self.tasks) > 1 else ""
+            self.task_var.set(f"{t.label}{more}" + (f" {frac:.0%}" if frac is not None else "..."))
+            if frac is None:
+                if str(self.task_bar.cget("mode")) != "indeterminate": self.task_bar.config(mode="indeterminate"); self.task_bar.start(50)
+            else:
+                if str(self.task_bar.cget("mode")) != "determinate": self.task_bar.stop(); self.task_bar.config(mode="determinate")
+                self.task_bar["value"] = frac * 100
+            if not self.task_frame.winfo_ismapped(): self.task_frame.pack(side=RIGHT, padx=5)
+        elif self.task_frame.winfo_ismapped():
+            self.task_bar.stop()
+            self.task_frame.pack_forget()
+        self.root.after(100, self.poll_tasks_loop)
+
     def create_header(self):
         header = ttk.Frame(self.root, padding=10)
         header.pack(fill=X)
         ttk.Label(header, text="QRQLL Mock 控制台", font=("Arial", 16, "bold")).pack(side=LEFT)
-        ttk.Label(header, text=f"Local IP: {self.get_host_ip()}:2417", font=("Consolas", 12, "bold"), bootstyle="inverse-primary", padding=5).pack(side=LEFT, padx=20)
+        ttk.Label(header, text=f"Local IP: {get_host_ip()}:{self.port}", font=("Consolas", 12, "bold"), bootstyle="inverse-primary", padding=5).pack(side=LEFT, padx=20)
 
     def init_device_tab(self):
         tab = ttk.Frame(self.notebook)
@@ -265,38 +1125,41 @@ class MockServerApp:
         ttk.Button(tool_frame, text="🚫 清空全部", bootstyle=DANGER, command=self.clear_all_devices).pack(side=LEFT, padx=2)
         ttk.Label(tool_frame, text="💡 列表每 3 秒自动刷新。超过 5 分钟无响应视为离线。", bootstyle=SECONDARY).pack(side=RIGHT, padx=10)
         
-        cols = ("ip", "time", "path", "status")
+        cols = ("ip", "time", "path", "status", "requests", "bytes", "latency")
         self.dev_tree = ttk.Treeview(tab, columns=cols, show="headings", bootstyle=INFO)
         self.dev_tree.heading("ip", text="设备 IP")
         self.dev_tree.heading("time", text="最后活跃时间")
         self.dev_tree.heading("path", text="最后请求接口")
         self.dev_tree.heading("status", text="状态")
+        self.dev_tree.heading("requests", text="请求数")
+        self.dev_tree.heading("bytes", text="流量")
+        self.dev_tree.heading("latency", text="延迟 P50")
         
-        self.dev_tree.column("ip", width=150)
-        self.dev_tree.column("time", width=180)
-        self.dev_tree.column("path", width=350)
-        self.dev_tree.column("status", width=100)
+        self.dev_tree.column("ip", width=130)
+        self.dev_tree.column("time", width=160)
+        self.dev_tree.column("path", width=300)
+        self.dev_tree.column("status", width=80)
+        self.dev_tree.column("requests", width=70)
+        self.dev_tree.column("bytes", width=90)
+        self.dev_tree.column("latency", width=80)
         self.dev_tree.pack(fill=BOTH, expand=True, padx=5, pady=5)
+        self.dev_sync = TreeSync(self.dev_tree)
+
+    def device_row(self, info):
+        dt_str = datetime.fromtimestamp(info["time"]).strftime("%Y-%m-%d %H:%M:%S")
+        status = "🟢 在线" if info["online"] else "⚪ 离线"
+        latency = f"{info['latency_p50'] * 1000:.1f} ms" if info["latency_p50"] is not None else "-"
+        return info["ip"], (info["ip"], dt_str, info["path"], status, info["requests"], format_size(info["bytes"]), latency)
 
     def refresh_devices_loop(self):
-        for item in self.dev_tree.get_children():
-            self.dev_tree.delete(item)
-            
-        now = time.time()
-        for ip, info in list(CONNECTED_DEVICES.items()):
-            t = info["time"]
-            dt_str = datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M:%S")
-            status = "🟢 在线" if now - t < 300 else "⚪ 离线"
-            self.dev_tree.insert("", "end", values=(ip, dt_str, info["path"], status))
-            
+        CONNECTED_DEVICES.sweep()
+        # 按首次出现排序，行位置不随每次请求跳动
+        devices = sorted(CONNECTED_DEVICES.snapshot(), key=lambda d: d["first_seen"])
+        self.dev_sync.sync(self.device_row(d) for d in devices)
         self.root.after(3000, self.refresh_devices_loop)
 
     def clear_offline_devices(self):
-        now = time.time()
-        offline_ips = [ip for ip, info in list(CONNECTED_DEVICES.items()) if now - info["time"] >= 300]
-        for ip in offline_ips:
-            if ip in CONNECTED_DEVICES:
-                del CONNECTED_DEVICES[ip]
+        CONNECTED_DEVICES.remove_offline()
 
     def clear_all_devices(self):
         CONNECTED_DEVICES.clear()
@@ -313,19 +1176,73 @@ class MockServerApp:
         ttk.Checkbutton(f, text="启用面板请求日志输出", variable=self.var_enable_log, bootstyle="round-toggle", command=self.toggle_setting).pack(anchor=W, pady=5)
         ttk.Checkbutton(f, text="日志中包含 HTTP Headers", variable=self.var_enable_headers, bootstyle="round-toggle", command=self.toggle_setting).pack(anchor=W, padx=20, pady=0)
 
+        ttk.Separator(f).pack(fill=X, pady=15)
+        self.var_profile = ttk.BooleanVar(value=PROFILER.enabled)
+        self.var_profile_rate = StringVar(value=str(PROFILER.sample_rate))
+        self.var_tracemalloc = ttk.BooleanVar(value=False)
+        row = ttk.Frame(f)
+        row.pack(anchor=W, pady=5)
+        ttk.Checkbutton(row, text="启用性能剖析（按比例抽样请求 + 调用栈采样）", variable=self.var_profile, bootstyle="round-toggle", command=self.toggle_profiling).pack(side=LEFT)
+        ttk.Label(row, text="  抽样比例").pack(side=LEFT)
+        ttk.Spinbox(row, from_=0.01, to=1.0, increment=0.05, width=6, textvariable=self.var_profile_rate, command=self.toggle_profiling).pack(side=LEFT, padx=5)
+        ttk.Checkbutton(f, text="内存追踪（tracemalloc，开启后明显变慢）", variable=self.var_tracemalloc, bootstyle="round-toggle", command=self.toggle_tracemalloc).pack(anchor=W, pady=5)
+        row = ttk.Frame(f)
+        row.pack(anchor=W, pady=5)
+        ttk.Button(row, text="💾 导出剖析结果", command=self.export_profile, bootstyle=(INFO, OUTLINE)).pack(side=LEFT, padx=2)
+        ttk.Button(row, text="📸 内存快照对比", command=self.show_memory_diff, bootstyle=(INFO, OUTLINE)).pack(side=LEFT, padx=2)
+        ttk.Button(row, text="🧹 清空剖析数据", command=PROFILER.reset, bootstyle=(SECONDARY, OUTLINE)).pack(side=LEFT, padx=2)
+        ttk.Label(f, text="💡 本机也可通过 /admin/profile、/admin/profile/stats、/admin/profile/stacks、POST /admin/memory/snapshot 查看", bootstyle=SECONDARY).pack(anchor=W, pady=5)
+
     def toggle_setting(self):
         global ENABLE_CLOSE_HW, ENABLE_LOGGING, ENABLE_LOG_HEADERS
-        ENABLE_CLOSE_HW = self.var_close_hw.get()
+        if ENABLE_CLOSE_HW != self.var_close_hw.get():
+            ENABLE_CLOSE_HW = self.var_close_hw.get()
+            # 「关闭程序」作业出现在作业列表里，开关变化也要推送给客户端
+            CHANGE_FEED.publish("homework", "upsert" if ENABLE_CLOSE_HW else "delete", ["SYS_CLOSE_001"])
         ENABLE_LOGGING = self.var_enable_log.get()
         ENABLE_LOG_HEADERS = self.var_enable_headers.get()
 
+    def toggle_profiling(self):
+        try: rate = float(self.var_profile_rate.get())
+        except ValueError: return messagebox.showwarning("错误", "抽样比例需为 0~1 之间的数字")
+        if self.var_profile.get(): PROFILER.start(rate)
+        else:
+            PROFILER.sample_rate = min(max(rate, 0.0), 1.0)
+            PROFILER.stop()
+
+    def toggle_tracemalloc(self):
+        if self.var_tracemalloc.get(): PROFILER.memory_start()
+        else: PROFILER.memory_stop()
+
+    def export_profile(self):
+        d = filedialog.askdirectory(title="选择导出目录")
+        if not d: return
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+        def write(task):
+            with open(os.path.join(d, f"profile-{stamp}.txt"), "w", encoding="utf-8") as fp: fp.write(PROFILER.stats_text(limit=200))
+            with open(os.path.join(d, f"stacks-{stamp}.folded"), "w", encoding="utf-8") as fp: fp.write(PROFILER.collapsed_stacks())
+        self.run_task(BackgroundTask("导出剖析结果"), write, on_done=lambda _: messagebox.showinfo("成功", f"已导出 profile-{stamp}.txt 与 stacks-{stamp}.folded\n折叠栈可用 flamegraph.pl 或 speedscope 生成火焰图"))
+
+    def show_memory_diff(self):
+        self.var_tracemalloc.set(True)
+        self.run_task(BackgroundTask("内存快照"), lambda task: PROFILER.memory_snapshot(), on_done=lambda text: self.show_text_window("内存快照对比", text))
+
+    def show_text_window(self, title: str, text: str):
+        win = ttk.Toplevel(title=title)
+        win.geometry("900x500")
+        box = Text(win, font=("Consolas", 10), wrap="none")
+        box.insert(END, text)
+        box.config(state=DISABLED)
+        box.pack(fill=BOTH, expand=True)
+
     def init_resource_tab(self):
         tab = ttk.Frame(self.notebook)
         self.notebook.add(tab, text="📂 资源文件管理")
         tool_frame = ttk.Frame(tab, padding=5)
         tool_frame.pack(fill=X)
         ttk.Button(tool_frame, text="📁 添加文件", command=self.add_files, bootstyle=SUCCESS).pack(side=LEFT, padx=2)
-        ttk.Button(tool_frame, text="🔄 刷新", command=self.refresh_files, bootstyle=INFO).pack(side=LEFT, padx=2)
+        ttk.Button(tool_frame, text="🔄 刷新", command=lambda: self.run_task(BackgroundTask("扫描资源"), lambda task: RESOURCE_INDEX.scan()), bootstyle=INFO).pack(side=LEFT, padx=2)
         ttk.Button(tool_frame, text="🗑️ 删除选中", command=self.del_files, bootstyle=DANGER).pack(side=LEFT, padx=2)
         ttk.Button(tool_frame, text="📂 打开文件夹", command=lambda: self.open_dir(self.target_dir), bootstyle=SECONDARY).pack(side=RIGHT, padx=2)
         
@@ -337,44 +1254,75 @@ class MockServerApp:
         self.file_tree.column("path", width=0, stretch=False)
         self.file_tree.pack(fill=BOTH, expand=True, padx=5, pady=5)
         self.file_tree.bind("<Double-1>", self.on_double_click)
+        self.file_sync = TreeSync(self.file_tree)
+        self._files_refresh_pending = False
+        RESOURCE_INDEX.subscribe(self.on_resources_changed)
         self.refresh_files()
 
+    def on_resources_changed(self, changed, removed):
+        # 索引变更可能来自监听线程且成批到达，合并为一次界面刷新
+        if self._files_refresh_pending: return
+        self._files_refresh_pending = True
+        self.root.after(100, self.refresh_files)
+
     def refresh_files(self):
-        self.file_tree.delete(*self.file_tree.get_children())
-        if not os.path.exists(self.target_dir): return
-        for root, _, files in os.walk(self.target_dir):
-            for f in files:
-                p = os.path.join(root, f)
-                size = os.stat(p).st_size
-                for u in ['B', 'KB', 'MB', 'GB']:
-                    if size < 1024.0: break
-                    size /= 1024.0
-                self.file_tree.insert("", "end", values=(f, f"{size:.1f} {u}", p))
+        self._files_refresh_pending = False
+        self.file_sync.sync((e["path"], (e["name"], format_size(e["size"]), RESOURCE_INDEX.abspath(e["path"]))) for e in RESOURCE_INDEX.items())
 
     def add_files(self):
         files = filedialog.askopenfilenames(title="选择文件", filetypes=[("所有文件", "*.*")])
-        count = 0
+        jobs = []
         for f in files:
             dest = os.path.join(self.target_dir, os.path.basename(f))
-            if os.path.exists(dest) and not messagebox.askyesno("覆盖", f"文件已存在，覆盖吗？"): continue
-            copy2(f, dest)
-            count += 1
-        if count:
-            self.refresh_files()
-            self.status_var.set(f"已添加 {count} 个文件")
+            if os.path.exists(dest) and not messagebox.askyesno("覆盖", f"文件 {os.path.basename(f)} 已存在，覆盖吗？"): continue
+            jobs.append((f, dest))
+        if not jobs: return
+        try: total = sum(os.path.getsize(f) for f, _ in jobs)
+        except OSError: total = 0
+        self.run_task(BackgroundTask(f"复制 {len(jobs)} 个文件", total), self.copy_files, jobs, on_done=self.on_files_copied)
+
+    def copy_files(self, task, jobs):
+        """多个文件并行复制；单个失败不影响其余文件，取消时等待已开始的复制清理临时文件"""
+        def one(src, dest):
+            task.check()
+            fast_copy(src, dest, task.advance)
+            RESOURCE_INDEX.touch(dest)
+        futures = {self.copy_pool.submit(one, src, dest): src for src, dest in jobs}
+        wait(futures)
+        task.check()
+        errors = [f"{os.path.basename(futures[f])}: {f.exception()}" for f in futures if f.exception() and not isinstance(f.exception(), TaskCancelled)]
+        return len(jobs) - len(errors), errors
+
+    def on_files_copied(self, result):
+        count, errors = result
+        if count: self.status_var.set(f"已添加 {count} 个文件")
+        if errors: messagebox.showerror("错误", "以下文件复制失败：\n" + "\n".join(errors))
 
     def del_files(self):
         sel = self.file_tree.selection()
         if not sel: return messagebox.showwarning("提示", "请选择文件")
         if not messagebox.askyesno("确认", "确定删除？"): return
-        for item in sel:
-            try: os.remove(self.file_tree.item(item)["values"][2])
-            except: pass
-        self.refresh_files()
+        self.run_task(BackgroundTask(f"删除 {len(sel)} 个文件", len(sel)), self.remove_files, [RESOURCE_INDEX.abspath(item) for item in sel],
+                      on_done=lambda n: self.status_var.set(f"已删除 {n} 个文件"))
+
+    def remove_files(self, task, paths):
+        count = 0
+        for p in paths:
+            try:
+                make_writable(p)
+                os.remove(p)
+                count += 1
+            except OSError: pass
+            RESOURCE_INDEX.touch(p)
+            task.advance(1)
+        return count
 
     def on_double_click(self, event):
         sel = self.file_tree.selection()
-        if sel: self.open_dir(self.file_tree.item(sel[0])["values"][2])
+        if not sel: return
+        path = RESOURCE_INDEX.abspath(sel[0])
+        # 与其他文件共用内容（去重硬链接）时先换成独立副本，外部程序的修改不会牵连其他文件
+        self.run_task(BackgroundTask(f"打开 {os.path.basename(path)}"), lambda task, p: CONTENT_STORE.detach(p), path, on_done=lambda _: self.open_dir(path))
 
     def open_dir(self, path):
         try:
@@ -399,6 +1347,7 @@ class MockServerApp:
         self.hw_tree.column("name", width=200)
         self.hw_tree.pack(fill=BOTH, expand=True)
         self.hw_tree.bind("<<TreeviewSelect>>", self.on_hw_select)
+        self.hw_sync = TreeSync(self.hw_tree)
 
         btn_frame = ttk.Frame(left_frame, padding=5)
         btn_frame.pack(fill=X)
@@ -434,19 +1383,13 @@ class MockServerApp:
         self.refresh_hw()
 
     def refresh_hw(self):
-        sel_id = self.hw_tree.item(self.hw_tree.selection()[0])["values"][0] if self.hw_tree.selection() else None
-        self.hw_tree.delete(*self.hw_tree.get_children())
-        for hw in HOMEWORK_DATA: self.hw_tree.insert("", "end", values=(hw["id"], hw["name"]))
-        if sel_id:
-            for item in self.hw_tree.get_children():
-                if str(self.hw_tree.item(item)["values"][0]) == str(sel_id):
-                    self.hw_tree.selection_set(item)
-                    break
+        # iid 即作业 id，选中项未被删除时自然保留
+        self.hw_sync.sync((hw["id"], (hw["id"], hw["name"])) for hw in HOMEWORK_STORE.items())
 
     def on_hw_select(self, event):
         sel = self.hw_tree.selection()
         if not sel: return
-        hw = next((h for h in HOMEWORK_DATA if h["id"] == str(self.hw_tree.item(sel[0])["values"][0])), None)
+        hw = HOMEWORK_STORE.get(sel[0])
         if hw:
             self.var_id.set(hw["id"]); self.var_name.set(hw["name"]); self.var_url.set(hw["url"])
             self.var_scale.set(f"{int(hw.get('scale', 0.5) * 100)}%")
@@ -454,37 +1397,39 @@ class MockServerApp:
 
     def add_hw(self):
         new_id = str(int(time.time() * 1000))
-        HOMEWORK_DATA.append({"id": new_id, "name": f"作业 {new_id[-4:]}", "lessonName": "通用", "url": "https://baidu.com", "scale": 0.5, "orientation": "landscape"})
+        HOMEWORK_STORE.upsert({"id": new_id, "name": f"作业 {new_id[-4:]}", "lessonName": "通用", "url": "https://baidu.com", "scale": 0.5, "orientation": "landscape"})
         self.refresh_hw()
 
     def del_hw(self):
         sel = self.hw_tree.selection()
         if sel and messagebox.askyesno("确认", "确定删除？"):
-            global HOMEWORK_DATA
-            HOMEWORK_DATA = [h for h in HOMEWORK_DATA if h["id"] != str(self.hw_tree.item(sel[0])["values"][0])]
+            HOMEWORK_STORE.delete(sel[0])
             self.var_id.set(""); self.var_name.set(""); self.var_url.set(""); self.var_scale.set(""); self.var_orientation.set("")
             self.refresh_hw()
 
     def import_hw(self):
         p = filedialog.askopenfilename(filetypes=[("JSON", "*.json")])
         if not p: return
-        try:
-            with open(p, 'r', encoding='utf-8') as f: d = json.load(f)
-            if not isinstance(d, list): return messagebox.showerror("错误", "数据格式错误")
-            global HOMEWORK_DATA
-            if messagebox.askyesno("导入", "是否覆盖当前配置？\n(选'否'将追加到末尾)"): HOMEWORK_DATA = d
-            else: HOMEWORK_DATA.extend(d)
-            self.refresh_hw()
-            messagebox.showinfo("成功", "导入成功")
-        except Exception as e: messagebox.showerror("错误", str(e))
+        merge = not messagebox.askyesno("导入", "是否覆盖当前配置？\n(选'否'将按 ID 合并，重复 ID 覆盖原条目)")
+        try: size = os.path.getsize(p)
+        except OSError as e: return messagebox.showerror("错误", str(e))
+        self.run_task(BackgroundTask("导入作业配置", total=size), self.read_hw_file, p, merge, on_done=self.apply_imported_hw)
+
+    def read_hw_file(self, task, p, merge):
+        # 解析与校验都在工作线程里完成，最后一次性换入；中途取消或出错时现有配置保持不变
+        with open(p, 'rb') as f: return import_homework(HOMEWORK_STORE, f, merge=merge, progress=task.advance)
+
+    def apply_imported_hw(self, result):
+        self.refresh_hw()
+        messagebox.showinfo("成功", "导入完成\n" + format_import_result(result))
 
     def export_hw(self):
         p = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON", "*.json")], initialfile="hw_config.json")
         if not p: return
-        try:
-            with open(p, 'w', encoding='utf-8') as f: json.dump(HOMEWORK_DATA, f, ensure_ascii=False, indent=2)
-            messagebox.showinfo("成功", "导出成功")
-        except Exception as e: messagebox.showerror("错误", str(e))
+        self.run_task(BackgroundTask("导出作业配置"), self.write_hw_file, p, HOMEWORK_STORE.to_list(), on_done=lambda _: messagebox.showinfo("成功", "导出成功"))
+
+    def write_hw_file(self, task, p, data):
+        with open(p, 'w', encoding='utf-8') as f: json.dump(data, f, ensure_ascii=False, indent=2)
 
     def save_hw(self):
         if not self.var_id.get(): return
@@ -496,17 +1441,51 @@ class MockServerApp:
 
         ori_val = "portrait" if "竖屏" in self.var_orientation.get() else "landscape"
 
-        for hw in HOMEWORK_DATA:
-            if hw["id"] == self.var_id.get():
-                hw["name"] = self.var_name.get()
-                hw["url"] = self.var_url.get()
-                hw["scale"] = round(fs, 2)
-                hw["orientation"] = ori_val
-                break
+        hw = HOMEWORK_STORE.get(self.var_id.get())
+        if hw: HOMEWORK_STORE.upsert(dict(hw, name=self.var_name.get(), url=self.var_url.get(), scale=round(fs, 2), orientation=ori_val))
         self.refresh_hw()
         self.var_scale.set(f"{int(fs * 100)}%")
         messagebox.showinfo("成功", "保存成功")
 
+    def init_metrics_tab(self):
+        tab = ttk.Frame(self.notebook)
+        self.notebook.add(tab, text="📈 性能监控")
+
+        tool_frame = ttk.Frame(tab, padding=5)
+        tool_frame.pack(fill=X)
+        self.metrics_var = StringVar()
+        ttk.Label(tool_frame, textvariable=self.metrics_var).pack(side=LEFT, padx=5)
+        ttk.Label(tool_frame, text=f"💡 每 {METRICS_REFRESH_MS // 1000} 秒刷新，完整数据见 /metrics", bootstyle=SECONDARY).pack(side=RIGHT, padx=10)
+
+        cols = ("route", "count", "rate", "avg", "p95", "errors", "bytes")
+        self.metrics_tree = ttk.Treeview(tab, columns=cols, show="headings", bootstyle=INFO)
+        for col, text, width in (("route", "路由", 360), ("count", "请求数", 80), ("rate", "请求/秒", 80), ("avg", "平均耗时", 90),
+                                 ("p95", "P95 ≤", 80), ("errors", "5xx", 60), ("bytes", "流量", 90)):
+            self.metrics_tree.heading(col, text=text)
+            self.metrics_tree.column(col, width=width)
+        self.metrics_tree.pack(fill=BOTH, expand=True, padx=5, pady=5)
+        self.metrics_sync = TreeSync(self.metrics_tree)
+        self._metrics_prev = ({}, time.perf_counter())
+        self.refresh_metrics_loop()
+
+    def refresh_metrics_loop(self):
+        prev, prev_t = self._metrics_prev
+        now, routes = time.perf_counter(), METRICS.summary()
+        elapsed = max(now - prev_t, 1e-3)
+        # 按最近一个刷新周期的请求速率排序，最先饱和的路由排在最前
+        rates = {r["route"]: (r["count"] - prev.get(r["route"], 0)) / elapsed for r in routes}
+        routes.sort(key=lambda r: (-rates[r["route"]], -r["count"]))
+        self.metrics_sync.sync((r["route"], (r["route"], r["count"], f"{rates[r['route']]:.1f}", f"{r['avg'] * 1000:.1f} ms" if r["avg"] is not None else "-",
+                                             f"{r['p95'] * 1000:g} ms" if r["p95"] is not None else "-", r["errors"], format_size(r["bytes"]))) for r in routes)
+        self._metrics_prev = ({r["route"]: r["count"] for r in routes}, now)
+        gauges = {name: value for name, _, value in METRICS.gauges()}
+        parts = [f"在途 {gauges['qrqll_http_requests_in_flight']}"]
+        if "qrqll_server_queue_depth" in gauges: parts.append(f"排队 {gauges['qrqll_server_queue_depth']}")
+        if "qrqll_server_connections" in gauges: parts.append(f"连接 {gauges['qrqll_server_connections']}")
+        parts += [f"总计 {sum(rates.values()):.1f} 请求/秒", f"资源发送 {format_size(METRICS.resource_bytes)}"]
+        self.metrics_var.set(" | ".join(parts))
+        self.root.after(METRICS_REFRESH_MS, self.refresh_metrics_loop)
+
     def init_log_tab(self):
         tab = ttk.Frame(self.notebook)
         self.notebook.add(tab, text="📄 运行日志")
@@ -514,6 +1493,8 @@ class MockServerApp:
         tool_frame = ttk.Frame(tab, padding=5)
         tool_frame.pack(fill=X)
         ttk.Button(tool_frame, text="🗑️ 清空日志", command=self.clear_logs, bootstyle=DANGER).pack(side=LEFT)
+        self.log_stat_var = StringVar()
+        ttk.Label(tool_frame, textvariable=self.log_stat_var, bootstyle=SECONDARY).pack(side=RIGHT, padx=5)
 
         self.log_text = Text(tab, state=DISABLED, bg="#ffffff", fg="#333333", font=("Consolas", 10))
         scroll = ttk.Scrollbar(tab, command=self.log_text.yview)
@@ -521,25 +1502,447 @@ class MockServerApp:
         
         scroll.pack(side=RIGHT, fill=Y, pady=5)
         self.log_text.pack(side=LEFT, fill=BOTH, expand=True, padx=5, pady=5)
+        self.drain_logs_loop()
 
-    def append_log(self, message):
-        self.root.after(0, self._safe_append_log, message)
-
-    def _safe_append_log(self, message):
-        self.log_text.config(state=NORMAL)
-        self.log_text.insert(END, message + "\n")
-        self.log_text.see(END)
-        self.log_text.config(state=DISABLED)
+    def drain_logs_loop(self):
+        batch = LOG_QUEUE.drain(LOG_BATCH_MAX)
+        if batch:
+            # 用户往上翻看时不强制滚到底部
+            at_bottom = self.log_text.yview()[1] >= 0.999
+            self.log_text.config(state=NORMAL)
+            self.log_text.insert(END, "\n".join(format_log_record(r) for r in batch) + "\n")
+            # 只保留最近 LOG_MAX_LINES 行
+            lines = int(self.log_text.index("end-1c").split(".")[0]) - 1
+            if lines > LOG_MAX_LINES: self.log_text.delete("1.0", f"{lines - LOG_MAX_LINES + 1}.0")
+            if at_bottom: self.log_text.see(END)
+            self.log_text.config(state=DISABLED)
+        self.log_stat_var.set(f"待显示 {len(LOG_QUEUE)} 条 | 已丢弃 {LOG_QUEUE.dropped} 条" if LOG_QUEUE.dropped or len(LOG_QUEUE) else "")
+        self.root.after(LOG_DRAIN_MS, self.drain_logs_loop)
 
     def clear_logs(self):
+        LOG_QUEUE.clear()
         self.log_text.config(state=NORMAL)
         self.log_text.delete("1.0", END)
         self.log_text.config(state=DISABLED)
 
-if __name__ == "__main__":
-    Thread(target=lambda: serve(app, host="0.0.0.0", port=2417), daemon=True).start()
+# ------------------------------------------------------------------
+# 多进程模式（--workers，仅 Linux）：N 个工作进程各自绑定同一端口（SO_REUSEPORT，由内核在进程间分配连接），
+# 各有独立的 GIL；主进程负责界面、配置库与资源扫描，把配置发布为共享内存快照，并汇总工作进程上报的设备活动与日志
+# ------------------------------------------------------------------
+
+SNAPSHOT_MAGIC = b"QRQLLSN1"
+SNAPSHOT_U64 = struct.Struct("<Q")
+SNAPSHOT_SEQ, SNAPSHOT_LEN, SNAPSHOT_DATA = 8, 16, 24  # 文件头：魔数、序号、内容长度
+WORKER_POLL_INTERVAL = 0.1
+WORKER_REPORT_INTERVAL = 1.0
+WORKER_RESTART_DELAY = 1.0
+
+class SnapshotFile:
+    """主进程写、工作进程读的共享内存快照文件。写入前序号加一（奇数表示写入中），写完再加一；
+    读者只在复制内容前后读到同一个偶数序号时采用（seqlock），跨进程无需加锁。内容变大时写者扩展文件，读者发现越界后重新映射"""
+
+    def __init__(self, path: str, create: bool = False):
+        self.path, self.writable = path, create
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600) if create else os.open(path, os.O_RDONLY)
+        if create: os.ftruncate(self._fd, mmap.PAGESIZE)
+        self._map = None
+        self._remap()
+        if create: self._map[:SNAPSHOT_DATA] = SNAPSHOT_MAGIC + bytes(SNAPSHOT_DATA - len(SNAPSHOT_MAGIC))
+
+    def _remap(self):
+        if self._map is not None: self._map.close()
+        self._map = mmap.mmap(self._fd, os.fstat(self._fd).st_size, access=mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ)
+
+    def _get(self, offset: int) -> int: return SNAPSHOT_U64.unpack_from(self._map, offset)[0]
+
+    def seq(self) -> int: return self._get(SNAPSHOT_SEQ)
+
+    def write(self, data: bytes) -> int:
+        size = SNAPSHOT_DATA + len(data)
+        if size > len(self._map):
+            # 按页对齐、至少翻倍扩展，减少读者重新映射的次数；文件只增不减，读者手里的旧映射始终有效
+            size = max(size, 2 * len(self._map))
+            os.ftruncate(self._fd, (size + mmap.PAGESIZE - 1) // mmap.PAGESIZE * mmap.PAGESIZE)
+            self._remap()
+        seq = self.seq() + 1
+        SNAPSHOT_U64.pack_into(self._map, SNAPSHOT_SEQ, seq)
+        self._map[SNAPSHOT_DATA:SNAPSHOT_DATA + len(data)] = data
+        SNAPSHOT_U64.pack_into(self._map, SNAPSHOT_LEN, len(data))
+        SNAPSHOT_U64.pack_into(self._map, SNAPSHOT_SEQ, seq + 1)
+        return seq + 1
+
+    def read(self):
+        """返回 (序号, 内容)；遇到写入中或复制期间被改写时重试"""
+        while True:
+            seq = self.seq()
+            if seq % 2 == 0 and seq and self._map[:len(SNAPSHOT_MAGIC)] == SNAPSHOT_MAGIC:
+                length = self._get(SNAPSHOT_LEN)
+                if SNAPSHOT_DATA + length > len(self._map):
+                    self._remap()
+                    continue
+                data = self._map[SNAPSHOT_DATA:SNAPSHOT_DATA + length]
+                if self.seq() == seq: return seq, data
+            time.sleep(0.001)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+class PresenceBatch:
+    """工作进程中代替 PresenceTracker（touch 签名相同）：只累计本周期内各设备的请求，由上报线程定期取走交给主进程合并"""
+
+    def __init__(self, latency_window: int = 128):
+        self.latency_window = latency_window
+        self._lock = Lock()
+        self._devices = {}
+
+    def touch(self, ip: str, path: str, nbytes: int = 0, latency: float = None, now: float = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            d = self._devices.get(ip)
+            if d is None: d = self._devices[ip] = [now, path, 0, 0, deque(maxlen=self.latency_window)]
+            d[0], d[1] = now, path
+            d[2] += 1
+            d[3] += nbytes
+            if latency is not None: d[4].append(latency)
+
+    def drain(self) -> list:
+        """取走并清空累计值：[(ip, last_seen, last_path, requests, bytes, [延迟...]), ...]，即 PresenceTracker.merge 的参数"""
+        with self._lock: devices, self._devices = self._devices, {}
+        return [(ip, t, path, n, nbytes, list(lat)) for ip, (t, path, n, nbytes, lat) in devices.items()]
+
+WORKER_OUTBOX = None  # 工作进程中为发往主进程的管道（单向 Connection）
+_OUTBOX_LOCK = Lock()
+SHARED_SHUTDOWN_CLICK = None  # 工作进程中为各进程共享的 multiprocessing.Value，记录上次点击关闭的时间
+
+def report(msg: tuple):
+    """工作进程向主进程发送一条消息；上报线程与请求线程都会调用，Connection 本身不是线程安全的"""
+    with _OUTBOX_LOCK: WORKER_OUTBOX.send(msg)
+
+def shutdown_process():
+    """退出整个服务；工作进程中转交主进程执行"""
+    if WORKER_OUTBOX is not None: report(("shutdown",))
+    else:
+        close_workers()
+        close_config_db()
+        os._exit(0)
+
+def reuseport_socket(host: str, port: int, backlog: int):
+    """各工作进程各自绑定同一地址，内核按连接的四元组哈希在进程间分配"""
+    sock = socket(AF_INET6 if ":" in host else AF_INET)
+    sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    sock.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+def settings_state() -> dict: return {"boot": BOOT_ID, "close_hw": ENABLE_CLOSE_HW, "logging": ENABLE_LOGGING, "log_headers": ENABLE_LOG_HEADERS}
+
+def apply_settings(state: dict):
+    global BOOT_ID, ENABLE_CLOSE_HW, ENABLE_LOGGING, ENABLE_LOG_HEADERS
+    BOOT_ID, ENABLE_CLOSE_HW, ENABLE_LOGGING, ENABLE_LOG_HEADERS = state["boot"], state["close_hw"], state["logging"], state["log_headers"]
+
+def apply_homework(state: dict):
+    HOMEWORK_STORE.restore(state)
+    # restore 不触发变更通知，在这里清空详情缓存；不预热，由请求按需渲染
+    invalidate_detail_cache()
+
+# 快照分段：名称 -> (版本键, 导出, 换入)。每段一个文件、各自带序号，某段变化时只重写这一段，
+# 工作进程也只解析这一段（资源哈希逐个算完时不必反复解析整份作业配置）。按此顺序写入，变更事件放最后
+SNAPSHOT_SECTIONS = {
+    "settings": (lambda: (BOOT_ID, ENABLE_CLOSE_HW, ENABLE_LOGGING, ENABLE_LOG_HEADERS), settings_state, apply_settings),
+    "homework": (lambda: HOMEWORK_STORE.version, lambda: HOMEWORK_STORE.dump(), apply_homework),
+    # 资源索引用未触发扫描的版本号：启动时先发布、先绑定端口，扫描完成后再发布一次
+    "resources": (lambda: RESOURCE_INDEX._version, lambda: RESOURCE_INDEX.dump(), lambda state: RESOURCE_INDEX.restore(state)),
+    "hashes": (lambda: CONTENT_STORE.version, lambda: CONTENT_STORE.dump(), lambda state: CONTENT_STORE.restore(state)),
+    "sidecars": (lambda: SIDECARS.version, lambda: SIDECARS.dump(), lambda state: SIDECARS.restore(state)),
+    "changes": (lambda: CHANGE_FEED.version, lambda: CHANGE_FEED.dump(), lambda state: CHANGE_FEED.restore(state)),
+}
+
+def snapshot_path(base: str, section: str) -> str: return f"{base}-{section}.snapshot"
+
+def load_snapshot(files: dict, seqs: dict, number: int):
+    """换入序号变化了的段。按与写入相反的顺序读序号：后写的段（变更事件）已更新时，
+    先写的段（作业配置）的新序号也一定可见，长轮询被唤醒的客户端再来取列表时不会拿到旧配置"""
+    current = {name: files[name].seq() for name in reversed(SNAPSHOT_SECTIONS)}
+    for name, (_, _, restore) in SNAPSHOT_SECTIONS.items():
+        if current[name] == seqs.get(name): continue
+        seq, data = files[name].read()
+        try: restore(json.loads(data))
+        except Exception as e:
+            print(f"[worker {number}] 换入快照 {name} 失败: {e}", file=sys.stderr)
+            continue
+        seqs[name] = seq
+
+def worker_report_loop():
+    while True:
+        time.sleep(WORKER_REPORT_INTERVAL)
+        batch = CONNECTED_DEVICES.drain()
+        if batch: report(("presence", batch))
+        records = LOG_QUEUE.drain(len(LOG_QUEUE))
+        if records: report(("log", records))
+
+def worker_main(number: int, snapshot_base: str, outbox, shutdown_click, engine: str, options: dict):
+    """工作进程入口（spawn 方式启动，本模块被重新导入）：换入首个快照、绑定共享端口后处理请求，主进程退出时随之退出"""
+    global CONNECTED_DEVICES, WORKER_OUTBOX, SHARED_SHUTDOWN_CLICK
+    # Ctrl+C 由主进程处理，再统一结束工作进程
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    CONNECTED_DEVICES, WORKER_OUTBOX, SHARED_SHUTDOWN_CLICK = PresenceBatch(), outbox, shutdown_click
+    ppid = os.getppid()
+    files, seqs = {name: SnapshotFile(snapshot_path(snapshot_base, name)) for name in SNAPSHOT_SECTIONS}, {}
+    load_snapshot(files, seqs, number)
+    server = make_server(engine, options, sockets=[reuseport_socket(options["host"], options["port"], options["backlog"])])
+    Thread(target=server.run, daemon=True, name=f"{engine}-{number}").start()
+    Thread(target=worker_report_loop, daemon=True, name="worker-report").start()
+    while os.getppid() == ppid:
+        time.sleep(WORKER_POLL_INTERVAL)
+        load_snapshot(files, seqs, number)
+    os._exit(0)
+
+class WorkerPool:
+    """主进程一侧：写首个快照后启动工作进程；配置、资源索引或设置变化时重写对应的快照段，汇总工作进程的上报，工作进程意外退出时重启"""
+
+    def __init__(self, count: int, engine: str, options: dict):
+        self.count, self.engine, self.options = count, engine, options
+        shm = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        self.base = os.path.join(shm, f"qrqll-{os.getpid()}")
+        self.restarts = 0
+        self._ctx = multiprocessing.get_context("spawn")
+        # 每个工作进程一条单向管道：不像 multiprocessing.Queue 那样带有命名信号量，主进程 os._exit 退出时不会遗留
+        self._inboxes = {}
+        self._shutdown_click = self._ctx.Value("d", 0.0, lock=False)
+        self._procs = []
+        self._files = {}
+        self._keys = {}
+        self._closed = False
+
+    def is_alive(self) -> bool: return not self._closed
+
+    def start(self):
+        self._files = {name: SnapshotFile(snapshot_path(self.base, name), create=True) for name in SNAPSHOT_SECTIONS}
+        self.publish()
+        self._procs = [self._spawn(i) for i in range(self.count)]
+        for target, name in ((self._publish_loop, "snapshot-publish"), (self._inbox_loop, "worker-inbox"), (self._monitor_loop, "worker-monitor")):
+            Thread(target=target, daemon=True, name=name).start()
+
+    def _spawn(self, number: int):
+        inbox, outbox = self._ctx.Pipe(duplex=False)
+        proc = self._ctx.Process(target=worker_main, args=(number, self.base, outbox, self._shutdown_click, self.engine, self.options), name=f"qrqll-worker-{number}", daemon=True)
+        proc.start()
+        # 关掉本进程持有的写端，工作进程退出后读端才会收到 EOF
+        outbox.close()
+        self._inboxes[number] = inbox
+        return proc
+
+    def publish(self):
+        """版本键变化了的段重新导出写入；取键之后发生的修改会在下一轮再次发布"""
+        for name, (key, dump, _) in SNAPSHOT_SECTIONS.items():
+            k = key()
+            if k == self._keys.get(name): continue
+            self._files[name].write(json.dumps(dump(), ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            self._keys[name] = k
+
+    def _publish_loop(self):
+        while not self._closed:
+            time.sleep(WORKER_POLL_INTERVAL)
+            try: self.publish()
+            except Exception as e: print(f"[workers] 发布快照失败: {e}", file=sys.stderr)
+
+    def _inbox_loop(self):
+        while not self._closed:
+            # 超时后重新取管道列表，换上重启的工作进程的新管道
+            inboxes = dict(self._inboxes)
+            for conn in multiprocessing.connection.wait(list(inboxes.values()), 1.0):
+                try: msg = conn.recv()
+                except (EOFError, OSError):
+                    number = next(n for n, c in inboxes.items() if c is conn)
+                    if self._inboxes.get(number) is conn: del self._inboxes[number]
+                    conn.close()
+                    continue
+                if msg[0] == "presence":
+                    for row in msg[1]: CONNECTED_DEVICES.merge(*row)
+                elif msg[0] == "log":
+                    for record in msg[1]: LOG_QUEUE.push(record)
+                elif msg[0] == "shutdown": shutdown_process()
+
+    def _monitor_loop(self):
+        while True:
+            time.sleep(WORKER_RESTART_DELAY)
+            for i, proc in enumerate(self._procs):
+                if self._closed: return
+                if proc.is_alive(): continue
+                print(f"[workers] 工作进程 {i} 已退出（{proc.exitcode}），重新启动", file=sys.stderr)
+                self.restarts += 1
+                self._procs[i] = self._spawn(i)
+
+    def close(self):
+        if self._closed: return
+        self._closed = True
+        for proc in self._procs: proc.terminate()
+        for proc in self._procs: proc.join(5)
+        for f in self._files.values():
+            f.close()
+            try: os.remove(f.path)
+            except OSError: pass
+
+WORKERS: Optional[WorkerPool] = None
+
+def close_workers():
+    if WORKERS is not None: WORKERS.close()
+
+# ------------------------------------------------------------------
+# 启动入口：默认图形界面；--headless 只运行服务端（不加载任何界面库）
+# ------------------------------------------------------------------
+
+# Waitress 参数；值为 None 时使用 Waitress 自身的默认值
+SERVER_DEFAULTS = {
+    "host": "0.0.0.0",
+    "port": 2417,
+    "threads": 16,
+    "connection_limit": 200,
+    "backlog": 1024,
+    "channel_timeout": 120,
+    "asyncore_use_poll": True,
+    "recv_bytes": None,
+    "send_bytes": None,
+    "inbuf_overflow": None,
+    "outbuf_overflow": None,
+    "outbuf_high_watermark": None,
+}
+
+ASYNC_CONNECTION_LIMIT = 5000
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="QRQLL Mock 服务端")
+    p.add_argument("--headless", action="store_true", help="不启动图形界面，只运行服务端")
+    p.add_argument("--config", help="JSON 配置文件，键名同下列参数（下划线形式），命令行参数优先")
+    p.add_argument("--hw", help="启动时加载的作业配置 JSON（与导出格式相同），会覆盖配置库中的作业")
+    p.add_argument("--db", help="配置库路径（SQLite，保存作业配置与设备历史），默认为程序目录下的 qrqll.db")
+    p.add_argument("--no-db", action="store_true", help="不使用配置库，作业配置只保存在内存中")
+    p.add_argument("--engine", choices=["waitress", "asyncio"], help="服务引擎：waitress（默认，线程池）或 asyncio（qrqll_async，空闲长连接只占协程）")
+    p.add_argument("--workers", type=int, help="多进程模式：启动 N 个工作进程共享端口（SO_REUSEPORT，仅 Linux），主进程只负责界面、配置与汇总；默认 0 即单进程")
+    g = p.add_argument_group("Waitress")
+    g.add_argument("--host")
+    g.add_argument("--port", type=int)
+    g.add_argument("--threads", type=int, help="工作线程数（默认 16）")
+    g.add_argument("--connection-limit", type=int, help="最大并发连接数（默认 200）")
+    g.add_argument("--backlog", type=int, help="监听队列长度（默认 1024）")
+    g.add_argument("--channel-timeout", type=int, help="空闲连接超时秒数（默认 120）")
+    g.add_argument("--asyncore-use-poll", action=argparse.BooleanOptionalAction, help="使用 poll() 代替 select()（默认开启，连接数可超过 1024）")
+    g.add_argument("--recv-bytes", type=int, help="每次 recv 的字节数")
+    g.add_argument("--send-bytes", type=int, help="每次 send 的字节数")
+    g.add_argument("--inbuf-overflow", type=int, help="请求体超过该字节数时缓冲到临时文件")
+    g.add_argument("--outbuf-overflow", type=int, help="响应超过该字节数时缓冲到临时文件")
+    g.add_argument("--outbuf-high-watermark", type=int, help="输出缓冲达到该字节数时暂停应用写入")
+    args = p.parse_args(argv)
+
+    options = dict(SERVER_DEFAULTS)
+    hw_path = args.hw
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f: cfg = json.load(f)
+        unknown = set(cfg) - set(SERVER_DEFAULTS) - {"hw", "headless", "engine", "db", "workers"}
+        if unknown: p.error(f"配置文件中有未知的键：{', '.join(sorted(unknown))}")
+        options.update({k: v for k, v in cfg.items() if k in SERVER_DEFAULTS})
+        hw_path = hw_path or cfg.get("hw")
+        args.headless = args.headless or bool(cfg.get("headless"))
+        args.engine = args.engine or cfg.get("engine")
+        args.db = args.db or cfg.get("db")
+        args.workers = args.workers if args.workers is not None else cfg.get("workers")
+    args.engine = args.engine or "waitress"
+    args.workers = args.workers or 0
+    args.db = None if args.no_db else (args.db or os.path.join(APP_DIR, "qrqll.db"))
+    options.update({k: v for k, v in vars(args).items() if k in SERVER_DEFAULTS and v is not None})
+    if args.workers < 0: p.error("--workers 不能为负数")
+    if args.workers and (not sys.platform.startswith("linux") or SO_REUSEPORT is None): p.error("--workers 需要 Linux（SO_REUSEPORT）")
+    # 各工作进程要绑定同一个确定的端口
+    if args.workers and not options["port"]: p.error("--workers 需要指定非 0 的 --port")
+    return args, options, hw_path
+
+def waitress_kwargs(options: dict) -> dict:
+    return {k: v for k, v in options.items() if v is not None}
+
+def load_homework_file(path: str):
+    with open(path, "rb") as f: result = import_homework(HOMEWORK_STORE, f)
+    if result["invalid"] or result["duplicates"]: print(f"{path}: " + format_import_result(result), file=sys.stderr)
+
+CONFIG_DB: Optional[ConfigDB] = None
+
+def open_config_db(path: str):
+    """作业配置在首次访问时从库中加载（库为空时沿用内置默认并写入），设备历史立即载入"""
+    global CONFIG_DB
+    CONFIG_DB = ConfigDB(path, HOMEWORK_STORE, CONNECTED_DEVICES)
+    HOMEWORK_STORE.attach(CONFIG_DB.load_homework)
+    CONNECTED_DEVICES.restore(CONFIG_DB.load_devices())
+
+def close_config_db():
+    if CONFIG_DB is not None: CONFIG_DB.close()
+
+def print_startup_summary(options: dict, hw_path: Optional[str], port: int, engine: str):
+    host = options["host"]
+    addr = get_host_ip() if host in ("0.0.0.0", "::", "") else host
+    print(f"QRQLL Mock 服务端 - http://{addr}:{port}/")
+    print(f"  监听地址   {host}:{port}")
+    print(f"  资源目录   {RESOURCES_DIR}（{len(RESOURCE_INDEX.items())} 个文件）")
+    print(f"  作业配置   {len(HOMEWORK_STORE)} 项" + (f"（来自 {hw_path}）" if hw_path else f"（来自 {CONFIG_DB.path}）" if CONFIG_DB else "（内置默认）"))
+    print(f"  服务引擎   {engine}")
+    print("  服务参数   " + ", ".join(f"{k}={v}" for k, v in options.items() if k not in ("host", "port") and v is not None))
+    sys.stdout.flush()
+
+def start_services(options: dict, hw_path: Optional[str], port: int, engine: str):
+    RESOURCE_INDEX.start()
+    SIDECARS.start()
+    CONTENT_STORE.start()
+    print_startup_summary(options, hw_path, port, engine)
+
+def make_server(engine: str, options: dict, sockets=None):
+    # 长轮询/SSE 每个等待者占一个工作线程，至多占一半，留给普通请求
+    CHANGE_FEED.max_waiters = max(1, options["threads"] // 2)
+    kw = waitress_kwargs(options)
+    # 接管已绑定的 socket 时不能再给 host/port（Waitress 会拒绝）
+    if sockets: kw = dict({k: v for k, v in kw.items() if k not in ("host", "port")}, sockets=sockets)
+    if engine == "asyncio":
+        from qrqll_async import create_server as create_async_server
+        # 空闲连接只占协程，未显式指定时不沿用 Waitress 的连接上限
+        if options["connection_limit"] == SERVER_DEFAULTS["connection_limit"]: kw["connection_limit"] = ASYNC_CONNECTION_LIMIT
+        METRICS.server = create_async_server(app, **kw)
+    else: METRICS.server = create_server(app, **kw)
+    return METRICS.server
+
+def main(argv=None):
+    global WORKERS
+    args, options, hw_path = parse_args(argv)
+    if args.db: open_config_db(args.db)
+    if hw_path: load_homework_file(hw_path)
+    # 先绑定端口开始接受连接（重启间隙平板的 tokenValid 不至于失败），再扫描资源、加载界面；多进程模式下由各工作进程绑定
+    if args.workers:
+        WORKERS = WorkerPool(args.workers, args.engine, options)
+        WORKERS.start()
+        # 被 kill/systemd 停止时同样结束工作进程、删除快照文件
+        signal.signal(signal.SIGTERM, lambda signum, frame: shutdown_process())
+        port, alive, engine = options["port"], WORKERS.is_alive, f"{args.engine} × {args.workers} 个工作进程"
+    else:
+        server = make_server(args.engine, options)
+        server_thread = Thread(target=server.run, daemon=True, name=args.engine)
+        server_thread.start()
+        port, alive, engine = server.effective_port, server_thread.is_alive, args.engine
+    if args.headless:
+        start_services(options, hw_path, port, engine)
+        try:
+            while alive(): time.sleep(1)
+        except KeyboardInterrupt: pass
+        close_workers()
+        close_config_db()
+        return
+    Thread(target=start_services, args=(options, hw_path, port, engine), daemon=True).start()
+    _import_gui()
     enable_high_dpi_awareness()
     root = ttk.Window(themename="litera")
-    gui = MockServerApp(root)
-    gui_instance = gui
+    MockServerApp(root, port=port)
     root.mainloop()
+    close_workers()
+    close_config_db()
+
+if __name__ == "__main__":
+    # 打包成可执行文件时，spawn 出的工作进程经此进入 worker_main 而不是再次启动主程序
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,161 @@
+"""
+服务引擎对比：Waitress 与 asyncio 引擎（qrqll_async）在 100 / 500 / 2000 个并发 keep-alive 连接下的表现
+
+每个连接模拟一台平板：保持长连接，每隔 --interval 秒发一次 pub/alive（大部分时间空闲）。
+服务端运行在独立子进程里，统计其 CPU 时间、常驻内存和线程数；客户端用 asyncio，连接本身不占线程。
+
+用法:
+    python bench/bench_engines.py
+    python bench/bench_engines.py --levels 100,500,2000 --duration 20 --interval 5
+    python bench/bench_engines.py --engines asyncio --levels 5000 --json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import threading
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ALIVE = b"GET /classInApp/serv-teachplatform/pub/alive HTTP/1.1\r\nHost: bench\r\n\r\n"
+
+
+def percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))]
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+# ------------------------------------------------------------------
+# 服务端子进程
+# ------------------------------------------------------------------
+
+def run_server(args):
+    sys.path.insert(0, ROOT)
+    import QRQLL
+
+    logging.getLogger("waitress.queue").setLevel(logging.ERROR)
+    options = dict(QRQLL.SERVER_DEFAULTS, host="127.0.0.1", port=0, threads=args.threads, connection_limit=args.connection_limit)
+    server = QRQLL.make_server(args.serve, options)
+    threading.Thread(target=server.run, daemon=True).start()
+    print(json.dumps({"port": server.effective_port}), flush=True)
+    for line in sys.stdin:
+        cmd = line.strip()
+        if cmd == "stats":
+            print(json.dumps({"cpu": time.process_time(), "rss_mb": rss_mb(), "threads": threading.active_count()}), flush=True)
+        elif cmd == "quit":
+            break
+
+
+# ------------------------------------------------------------------
+# 客户端
+# ------------------------------------------------------------------
+
+async def pad(port, args, end, stats, rnd):
+    await asyncio.sleep(rnd.uniform(0, args.ramp))
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", port), 30)
+    except (OSError, asyncio.TimeoutError):
+        stats["connect_errors"] += 1
+        return
+    stats["connected"] += 1
+    loop = asyncio.get_running_loop()
+    try:
+        while loop.time() < end:
+            t0 = loop.time()
+            writer.write(ALIVE)
+            await writer.drain()
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 30)
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            stats["latency"].append(loop.time() - t0)
+            if not head.startswith(b"HTTP/1.1 200"):
+                stats["errors"] += 1
+            await asyncio.sleep(min(args.interval * rnd.uniform(0.8, 1.2), max(0.0, end - loop.time())))
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        stats["errors"] += 1
+    finally:
+        writer.close()
+
+
+async def drive(port, conns, args):
+    stats = {"connected": 0, "connect_errors": 0, "errors": 0, "latency": []}
+    end = asyncio.get_running_loop().time() + args.duration
+    await asyncio.gather(*(pad(port, args, end, stats, random.Random(i)) for i in range(conns)))
+    return stats
+
+
+def bench(engine, conns, args):
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", engine, "--threads", str(args.threads), "--connection-limit", str(conns + 100)],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        port = json.loads(proc.stdout.readline())["port"]
+
+        def server_stats():
+            proc.stdin.write("stats\n")
+            proc.stdin.flush()
+            return json.loads(proc.stdout.readline())
+
+        s0, t0 = server_stats(), time.perf_counter()
+        stats = asyncio.run(drive(port, conns, args))
+        wall, s1 = time.perf_counter() - t0, server_stats()
+        lat = sorted(stats["latency"])
+        return {
+            "engine": engine, "connections": conns, "connected": stats["connected"], "connect_errors": stats["connect_errors"],
+            "requests": len(lat), "errors": stats["errors"], "rps": round(len(lat) / wall, 1),
+            "p50_ms": round(percentile(lat, 50) * 1000, 2), "p95_ms": round(percentile(lat, 95) * 1000, 2),
+            "p99_ms": round(percentile(lat, 99) * 1000, 2), "max_ms": round(lat[-1] * 1000, 2) if lat else 0.0,
+            "server_cpu_s": round(s1["cpu"] - s0["cpu"], 3), "server_rss_mb": round(s1["rss_mb"], 1), "server_threads": s1["threads"],
+        }
+    finally:
+        proc.stdin.write("quit\n")
+        proc.stdin.flush()
+        proc.wait(timeout=30)
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--engines", default="waitress,asyncio", help="逗号分隔：waitress,asyncio")
+    p.add_argument("--levels", default="100,500,2000", help="逗号分隔的并发连接数")
+    p.add_argument("--duration", type=float, default=20, help="每轮持续秒数")
+    p.add_argument("--interval", type=float, default=5, help="每个连接的心跳间隔（秒）")
+    p.add_argument("--ramp", type=float, default=2, help="连接在该秒数内随机错开建立")
+    p.add_argument("--threads", type=int, default=16, help="服务端工作线程数")
+    p.add_argument("--json", action="store_true", help="只输出 JSON")
+    p.add_argument("--serve", help=argparse.SUPPRESS)
+    p.add_argument("--connection-limit", type=int, default=1000, help=argparse.SUPPRESS)
+    args = p.parse_args()
+    if args.serve:
+        return run_server(args)
+
+    results = [bench(engine, int(n), args) for n in args.levels.split(",") for engine in args.engines.split(",")]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'引擎':<10}{'连接':>7}{'已连上':>8}{'请求':>8}{'错误':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'CPU s':>8}{'RSS MB':>8}{'线程':>6}")
+    for r in results:
+        print(f"{r['engine']:<10}{r['connections']:>7}{r['connected']:>8}{r['requests']:>8}{r['errors'] + r['connect_errors']:>6}"
+              f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['server_cpu_s']:>8}{r['server_rss_mb']:>8}{r['server_threads']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+接口负载构造函数的微基准：在 Flask test_request_context 中调用各 build_* 函数，
+分别用 10 / 1k / 10k / 100k 条作业和同等数量的资源文件，统计每次调用的耗时与内存分配
+
+测量对象:
+    桌面端  build_homework_list_dynamic、build_homework_detail_dynamic、build_file_list_dynamic（teacher_file_list 的条目构造）
+    移动端  build_homework_list_dynamic、build_homework_list_static（需要能导入 kivy/kivymd，否则跳过）
+
+耗时取多轮中位数；内存用 tracemalloc 统计单次调用的峰值字节数和新分配的内存块数。
+
+用法:
+    python bench/bench_payloads.py
+    python bench/bench_payloads.py --sizes 10,1000 --target desktop --json
+    python bench/bench_payloads.py --out bench/payloads.json
+    python bench/bench_payloads.py --baseline bench/payloads.json --tolerance 0.3
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGE_SIZE = 20
+
+
+def synthetic_homework(n: int):
+    return [{
+        "id": str(1867975578577879042 + i),
+        "name": f"作业 {i:06d}",
+        "lessonName": f"课程 {i % 50}",
+        "url": f"https://example.com/lesson/{i}",
+        "scale": 0.5 + (i % 4) * 0.25,
+        "orientation": "landscape" if i % 2 else "portrait",
+    } for i in range(n)]
+
+
+def synthetic_resources(n: int) -> str:
+    """生成 n 个空文件的平铺目录（移动端索引不递归）"""
+    root = tempfile.mkdtemp(prefix="qrqll-bench-")
+    for i in range(n):
+        open(os.path.join(root, f"课件-{i:06d}.pdf"), "wb").close()
+    return root
+
+
+def measure(fn, min_time: float, max_calls: int):
+    """返回 (每次调用耗时中位数 us, 最小值 us, 调用次数, 峰值字节数, 新分配块数)"""
+    fn()  # 预热
+    times, deadline = [], time.perf_counter() + min_time
+    while len(times) < max_calls and (len(times) < 3 or time.perf_counter() < deadline):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(s.count_diff for s in after.compare_to(before, "filename") if s.count_diff > 0)
+    del result
+    return statistics.median(times) * 1e6, min(times) * 1e6, len(times), peak, blocks
+
+
+def desktop_cases(n: int, res_root: str):
+    import QRQLL as m
+    m.HOMEWORK_STORE.replace(synthetic_homework(n))
+    m.RESOURCE_INDEX = m.ResourceIndex(res_root)
+    m.RESOURCE_INDEX.scan()
+    middle = m.HOMEWORK_STORE.items()[n // 2]["id"]
+    ctx = m.app.test_request_context("/classInApp/serv-teachplatform/hw/basicInfo/student/selectPadHomeworkList", base_url="http://192.168.1.10:2417")
+    cases = {
+        "desktop.homework_list[page]": lambda: m.build_homework_list_dynamic(1, PAGE_SIZE),
+        "desktop.homework_list[page]+ok": lambda: m.ok(m.build_homework_list_dynamic(1, PAGE_SIZE)),
+        "desktop.homework_list[all]": lambda: m.build_homework_list_dynamic(1, n),
+        "desktop.homework_detail": lambda: m.build_homework_detail_dynamic(middle),
+        "desktop.file_list[page]": lambda: m.build_file_list_dynamic(1, PAGE_SIZE),
+        "desktop.file_list[page]+ok": lambda: m.ok(m.build_file_list_dynamic(1, PAGE_SIZE)),
+        "desktop.file_list[all]": lambda: m.build_file_list_dynamic(1, n),
+    }
+    return ctx, cases
+
+
+def mobile_cases(n: int, res_root: str):
+    os.environ.setdefault("KIVY_NO_ARGS", "1")
+    os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+    import qrqll_mobile as m
+    m.HOMEWORK_STORE.replace(synthetic_homework(n))
+    ctx = m.app.test_request_context("/api/v1/close_hw/list")
+    cases = {
+        "mobile.homework_list_dynamic[page]": lambda: m.build_homework_list_dynamic(0, PAGE_SIZE),
+        "mobile.homework_list_static": m.build_homework_list_static,
+    }
+    return ctx, cases
+
+
+def run(args):
+    sys.path.insert(0, ROOT)
+    builders = {"desktop": [desktop_cases], "mobile": [mobile_cases], "both": [desktop_cases, mobile_cases]}[args.target]
+    results = []
+    for n in args.sizes:
+        res_root = synthetic_resources(n)
+        try:
+            for build in builders:
+                try:
+                    ctx, cases = build(n, res_root)
+                except ImportError as e:
+                    print(f"跳过 {build.__name__}: {e}", file=sys.stderr)
+                    continue
+                with ctx:
+                    for name, fn in cases.items():
+                        median_us, min_us, calls, peak, blocks = measure(fn, args.min_time, args.max_calls)
+                        results.append({"case": name, "size": n, "median_us": round(median_us, 1), "min_us": round(min_us, 1),
+                                        "calls": calls, "peak_bytes": peak, "alloc_blocks": blocks})
+        finally:
+            shutil.rmtree(res_root, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, tolerance: float):
+    base = {(r["case"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        b = base.get((r["case"], r["size"]))
+        if b is None:
+            continue
+        # 微秒级用例的抖动不算退化
+        if r["median_us"] > b["median_us"] * (1 + tolerance) and r["median_us"] - b["median_us"] > 5:
+            regressions.append(f"{r['case']} n={r['size']}: {r['median_us']} us > 基线 {b['median_us']} us")
+        if r["alloc_blocks"] > b["alloc_blocks"] * (1 + tolerance) + 10:
+            regressions.append(f"{r['case']} n={r['size']}: {r['alloc_blocks']} 块 > 基线 {b['alloc_blocks']} 块")
+    return regressions
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--sizes", default="10,1000,10000,100000", help="逗号分隔的数据规模")
+    p.add_argument("--target", choices=["desktop", "mobile", "both"], default="both")
+    p.add_argument("--min-time", type=float, default=0.3, help="每个用例至少计时的秒数")
+    p.add_argument("--max-calls", type=int, default=2000, help="每个用例最多调用次数")
+    p.add_argument("--out", help="把结果写入 JSON 文件")
+    p.add_argument("--baseline", help="与该 JSON 结果比较，有退化时以非零状态退出")
+    p.add_argument("--tolerance", type=float, default=0.3, help="允许的相对退化幅度")
+    p.add_argument("--json", action="store_true", help="只输出 JSON")
+    args = p.parse_args()
+    args.sizes = [int(s) for s in args.sizes.split(",") if s]
+
+    report = {"python": sys.version.split()[0], "page_size": PAGE_SIZE, "results": run(args)}
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report["results"], json.load(f), args.tolerance)
+        report["regressions"] = regressions
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print(f"{'用例':<38}{'规模':>8}{'中位数 us':>12}{'最小 us':>12}{'次数':>7}{'峰值 KB':>11}{'分配块':>9}")
+        for r in report["results"]:
+            print(f"{r['case']:<38}{r['size']:>8}{r['median_us']:>12}{r['min_us']:>12}{r['calls']:>7}{r['peak_bytes'] / 1024:>11.1f}{r['alloc_blocks']:>9}")
+        for line in regressions:
+            print(f"退化: {line}")
+        if args.baseline:
+            print("基线比较: " + ("失败" if regressions else "通过"))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+/resources 下载基准：N 个并发客户端从 Waitress 拉取同一个大文件，统计吞吐量与服务端 CPU 占用
+
+服务端运行在独立子进程里，CPU 时间只统计服务端自身，不混入客户端线程。
+
+用法:
+    python bench/bench_resources.py --size 1G --clients 50
+    python bench/bench_resources.py --size 1G --clients 50 --mode range --impl both
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import subprocess
+import http.client
+from threading import Thread, Lock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_size(text: str) -> int:
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    text = text.strip().upper().rstrip("B")
+    return int(float(text[:-1]) * units[text[-1]]) if text[-1] in units else int(text)
+
+
+# ------------------------------------------------------------------
+# 服务端子进程
+# ------------------------------------------------------------------
+
+def run_server(args):
+    sys.path.insert(0, ROOT)
+    import QRQLL
+    from flask import send_from_directory
+    from waitress import create_server
+
+    # 旧实现，作为对照组
+    QRQLL.app.add_url_rule("/legacy/<path:filename>", "bench_legacy", lambda filename: send_from_directory(QRQLL.RESOURCES_DIR, filename))
+
+    name = f".bench-{os.getpid()}.bin"
+    path = os.path.join(QRQLL.RESOURCES_DIR, name)
+    block = os.urandom(1 << 20)
+    with open(path, "wb") as f:
+        for _ in range(args.size // len(block)):
+            f.write(block)
+        f.write(block[:args.size % len(block)])
+    QRQLL.RESOURCE_INDEX.touch(name)
+
+    # 压测时排队是预期行为，不刷 "Task queue depth" 警告
+    logging.getLogger("waitress.queue").setLevel(logging.ERROR)
+    server = create_server(QRQLL.app, host="127.0.0.1", port=0, threads=args.threads, connection_limit=max(100, args.clients * 2))
+    Thread(target=server.run, daemon=True).start()
+    print(json.dumps({"port": server.effective_port, "name": name}), flush=True)
+    try:
+        for line in sys.stdin:
+            if line.strip() == "cpu":
+                print(json.dumps({"cpu": time.process_time()}), flush=True)
+            elif line.strip() == "quit":
+                break
+    finally:
+        os.remove(path)
+
+
+# ------------------------------------------------------------------
+# 客户端
+# ------------------------------------------------------------------
+
+def client(port, url, size, args, stats, lock):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+    rnd = random.Random()
+    total = errors = 0
+    for _ in range(args.requests):
+        headers = {}
+        if args.mode == "range":
+            # 模拟拖动进度条：随机位置读一段
+            start = rnd.randrange(0, max(1, size - args.chunk))
+            headers["Range"] = f"bytes={start}-{start + args.chunk - 1}"
+        conn.request("GET", url, headers=headers)
+        resp = conn.getresponse()
+        while True:
+            buf = resp.read(1 << 20)
+            if not buf:
+                break
+            total += len(buf)
+        if resp.status not in (200, 206):
+            errors += 1
+    conn.close()
+    with lock:
+        stats["bytes"] += total
+        stats["errors"] += errors
+
+
+def bench(impl, args):
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", "--size", str(args.size), "--threads", str(args.threads), "--clients", str(args.clients)],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        info = json.loads(proc.stdout.readline())
+        url = f"/{'resources' if impl == 'range' else 'legacy'}/{info['name']}"
+
+        def server_cpu():
+            proc.stdin.write("cpu\n")
+            proc.stdin.flush()
+            return json.loads(proc.stdout.readline())["cpu"]
+
+        stats, lock = {"bytes": 0, "errors": 0}, Lock()
+        cpu0, client_cpu0, t0 = server_cpu(), time.process_time(), time.perf_counter()
+        threads = [Thread(target=client, args=(info["port"], url, args.size, args, stats, lock)) for _ in range(args.clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall, cpu = time.perf_counter() - t0, server_cpu() - cpu0
+        return {
+            "impl": impl, "mode": args.mode, "clients": args.clients, "threads": args.threads, "file_size": args.size,
+            "wall_s": round(wall, 3), "bytes": stats["bytes"], "errors": stats["errors"],
+            "throughput_MBps": round(stats["bytes"] / wall / (1 << 20), 1),
+            "server_cpu_s": round(cpu, 3), "server_cpu_pct": round(cpu / wall * 100, 1),
+            "client_cpu_s": round(time.process_time() - client_cpu0, 3),
+        }
+    finally:
+        proc.stdin.write("quit\n")
+        proc.stdin.flush()
+        proc.wait(timeout=30)
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--size", default="1G", help="测试文件大小，如 256M / 1G")
+    p.add_argument("--clients", type=int, default=50, help="并发客户端数")
+    p.add_argument("--requests", type=int, default=1, help="每个客户端的请求次数")
+    p.add_argument("--threads", type=int, default=8, help="Waitress 工作线程数")
+    p.add_argument("--mode", choices=["full", "range"], default="full", help="full=整文件下载，range=随机区间读取")
+    p.add_argument("--chunk", default="4M", help="range 模式下每次读取的长度")
+    p.add_argument("--impl", choices=["range", "legacy", "both"], default="range", help="range=新的 /resources 实现，legacy=send_from_directory")
+    p.add_argument("--json", action="store_true", help="只输出 JSON")
+    p.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = p.parse_args()
+    args.size = parse_size(str(args.size))
+    args.chunk = parse_size(str(args.chunk))
+    if args.serve:
+        return run_server(args)
+    results = [bench(impl, args) for impl in (["range", "legacy"] if args.impl == "both" else [args.impl])]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(f"[{r['impl']:>6}] {r['mode']} x{r['clients']} ({r['file_size'] >> 20} MB, {r['threads']} threads): "
+              f"{r['throughput_MBps']} MB/s, {r['wall_s']} s, server CPU {r['server_cpu_s']} s ({r['server_cpu_pct']}%), errors {r['errors']}")
+
+
+if __name__ == "__main__":
+    main()
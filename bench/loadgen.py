@@ -0,0 +1,303 @@
+"""
+课堂负载模拟：N 台平板按真实客户端流程访问 Mock 服务端，统计吞吐量、各接口 p50/p95/p99 延迟和错误率
+
+每台平板的流程:
+    1. 登录：j_spring_security_check、tokenValid
+    2. 周期性心跳：pub/alive
+    3. 轮询作业列表，再逐个拉取作业详情（移动端没有详情接口）
+    4. 拉取资源列表，再下载资源文件
+
+默认在本进程内以临时端口启动 QRQLL.py（--target desktop）或 qrqll_mobile.py（--target mobile）的 app，
+并在资源目录中生成测试文件，结束后删除；也可用 --url 压测已在运行的服务端。
+注意客户端线程与服务端同进程共享 GIL，绝对数值偏保守，适合前后对比。
+
+用法:
+    python bench/loadgen.py --pads 60 --duration 30
+    python bench/loadgen.py --target mobile --pads 30 --file-size 4M
+    python bench/loadgen.py --save-baseline bench/loadgen_baseline.json
+    python bench/loadgen.py --baseline bench/loadgen_baseline.json --tolerance 0.25
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import logging
+import argparse
+import http.client
+from threading import Thread, Lock, Event
+from urllib.parse import quote, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_size(text: str) -> int:
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    text = text.strip().upper().rstrip("B")
+    return int(float(text[:-1]) * units[text[-1]]) if text[-1] in units else int(text)
+
+
+def percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+# ------------------------------------------------------------------
+# 客户端流程（桌面端与移动端接口不同）
+# ------------------------------------------------------------------
+
+DESKTOP = {
+    "login": ["/classInApp/serv-manager/j_spring_security_check", "/classInApp/box/auth/tokenValid"],
+    "alive": "/classInApp/serv-teachplatform/pub/alive",
+    "hw_list": "/classInApp/serv-teachplatform/hw/basicInfo/student/selectPadHomeworkList?pageIndex=1&pageSize=20",
+    "hw_ids": lambda body: [hw["homeworkId"] for hw in body["result"]["data"]],
+    "hw_detail": "/classInApp/serv-teachplatform/hw/basicInfo/student/selectPadHomeworkDetail?homeworkId={}",
+    "file_list": "/classInApp/serv-teachplatform/courseware/student/selectShareFileList?pageIndex=1&pageSize=20",
+    "file_urls": lambda body: ["/" + quote(f["fileUrl"]) for f in body["result"]["data"]],
+}
+
+MOBILE = {
+    "login": ["/classInApp/serv-manager/j_spring_security_check", "/classInApp/box/auth/tokenValid"],
+    "alive": "/classInApp/serv-teachplatform/pub/alive",
+    "hw_list": "/api/v1/close_hw/list",
+    "hw_ids": lambda body: [],
+    "hw_detail": None,
+    "file_list": "/api/v1/sync/list",
+    "file_urls": lambda body: ["/api/v1/sync/resource/" + quote(f["name"]) for f in body["result"]],
+}
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = Lock()
+        self.latency = {}
+        self.errors = {}
+        self.bytes = 0
+
+    def add(self, route: str, seconds: float, ok: bool, nbytes: int):
+        with self._lock:
+            self.latency.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+            self.bytes += nbytes
+
+
+class Pad:
+    """一台平板：单个 keep-alive 连接，按心跳/轮询间隔执行流程"""
+
+    def __init__(self, host, port, profile, args, rec: Recorder, stop: Event, seed: int):
+        self.host, self.port, self.profile, self.args, self.rec, self.stop = host, port, profile, args, rec, stop
+        self.rnd = random.Random(seed)
+        self.conn = None
+        self.etags = {}
+        self.cached = {}
+
+    def get(self, route: str, url: str, want_json: bool = False):
+        headers = {"Accept-Encoding": "gzip"} if self.args.gzip else {}
+        if self.args.revalidate and url in self.etags:
+            headers["If-None-Match"] = self.etags[url]
+        t0 = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            self.conn.request("GET", url, headers=headers)
+            resp = self.conn.getresponse()
+            body = resp.read()
+            status = resp.status
+            if resp.getheader("ETag"):
+                self.etags[url] = resp.getheader("ETag")
+        except (OSError, http.client.HTTPException):
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+            self.rec.add(route, time.perf_counter() - t0, False, 0)
+            return None
+        self.rec.add(route, time.perf_counter() - t0, status < 400, len(body))
+        if not want_json or status >= 400:
+            return body if status < 400 else None
+        # 304 时沿用上次解析的结果，与真实客户端的缓存行为一致
+        if status == 304:
+            return self.cached.get(url)
+        if resp.getheader("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        self.cached[url] = json.loads(body)
+        return self.cached[url]
+
+    def cycle(self):
+        p = self.profile
+        hw = self.get("hw_list", p["hw_list"], want_json=True)
+        if isinstance(hw, dict) and p["hw_detail"]:
+            for hid in p["hw_ids"](hw):
+                self.get("hw_detail", p["hw_detail"].format(quote(str(hid))))
+        files = self.get("file_list", p["file_list"], want_json=True)
+        if isinstance(files, dict):
+            urls = p["file_urls"](files)
+            for url in self.rnd.sample(urls, min(self.args.downloads, len(urls))):
+                self.get("download", url)
+
+    def run(self):
+        # 错开开机时间，避免所有平板同一毫秒发起登录
+        if self.stop.wait(self.rnd.uniform(0, self.args.ramp)):
+            return
+        for url in self.profile["login"]:
+            self.get("login", url)
+        now = time.perf_counter()
+        next_alive, next_poll = now, now
+        while not self.stop.is_set():
+            now = time.perf_counter()
+            if now >= next_alive:
+                self.get("alive", self.profile["alive"])
+                next_alive = now + self.args.alive_interval
+            if now >= next_poll:
+                self.cycle()
+                next_poll = time.perf_counter() + self.args.poll_interval * self.rnd.uniform(0.8, 1.2)
+            self.stop.wait(max(0.0, min(next_alive, next_poll) - time.perf_counter()))
+        if self.conn is not None:
+            self.conn.close()
+
+
+# ------------------------------------------------------------------
+# 本地服务端
+# ------------------------------------------------------------------
+
+def start_local_server(args):
+    sys.path.insert(0, ROOT)
+    if args.target == "mobile":
+        # 避免 Kivy 解析本脚本的命令行参数
+        os.environ.setdefault("KIVY_NO_ARGS", "1")
+        import qrqll_mobile as mod
+    else:
+        import QRQLL as mod
+    from waitress import create_server
+
+    paths = []
+    block = os.urandom(min(args.file_size, 1 << 20) or 1)
+    for i in range(args.files):
+        path = os.path.join(mod.RESOURCES_DIR, f"loadgen-{os.getpid()}-{i}.bin")
+        with open(path, "wb") as f:
+            left = args.file_size
+            while left > 0:
+                f.write(block[:left])
+                left -= len(block)
+        mod.RESOURCE_INDEX.touch(path)
+        paths.append(path)
+
+    logging.getLogger("waitress.queue").setLevel(logging.ERROR)
+    server = create_server(mod.app, host="127.0.0.1", port=0, threads=args.threads, connection_limit=max(100, args.pads * 2))
+    Thread(target=server.run, daemon=True).start()
+    return "127.0.0.1", server.effective_port, paths
+
+
+def run(args):
+    if args.url:
+        u = urlsplit(args.url)
+        host, port, paths = u.hostname, u.port or 80, []
+    else:
+        host, port, paths = start_local_server(args)
+    profile = MOBILE if args.target == "mobile" else DESKTOP
+    rec, stop = Recorder(), Event()
+    pads = [Pad(host, port, profile, args, rec, stop, seed=i) for i in range(args.pads)]
+    threads = [Thread(target=p.run, daemon=True) for p in pads]
+    t0 = time.perf_counter()
+    try:
+        for t in threads:
+            t.start()
+        stop.wait(args.duration)
+    finally:
+        stop.set()
+        for t in threads:
+            t.join(timeout=60)
+        wall = time.perf_counter() - t0
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    routes = {}
+    for route, values in sorted(rec.latency.items()):
+        values.sort()
+        errors = rec.errors.get(route, 0)
+        routes[route] = {
+            "count": len(values), "errors": errors, "error_rate": round(errors / len(values), 4),
+            "rps": round(len(values) / wall, 1),
+            "p50_ms": round(percentile(values, 50) * 1000, 2), "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2), "max_ms": round(values[-1] * 1000, 2),
+        }
+    total = sum(r["count"] for r in routes.values())
+    return {
+        "target": args.url or args.target, "pads": args.pads, "duration_s": round(wall, 2), "threads": args.threads,
+        "files": args.files, "file_size": args.file_size,
+        "requests": total, "rps": round(total / wall, 1), "errors": sum(r["errors"] for r in routes.values()),
+        "MBps": round(rec.bytes / wall / (1 << 20), 2), "routes": routes,
+    }
+
+
+def compare(result, baseline, tolerance: float):
+    """与基线比较：吞吐量下降或 p95 上升超过 tolerance、错误率上升即视为退化"""
+    regressions = []
+    if result["rps"] < baseline["rps"] * (1 - tolerance):
+        regressions.append(f"rps {result['rps']} < 基线 {baseline['rps']}")
+    for route, cur in result["routes"].items():
+        base = baseline["routes"].get(route)
+        if base is None:
+            continue
+        if cur["p95_ms"] > base["p95_ms"] * (1 + tolerance) and cur["p95_ms"] - base["p95_ms"] > 1:
+            regressions.append(f"{route} p95 {cur['p95_ms']} ms > 基线 {base['p95_ms']} ms")
+        if cur["error_rate"] > base["error_rate"] + 0.001:
+            regressions.append(f"{route} 错误率 {cur['error_rate']:.2%} > 基线 {base['error_rate']:.2%}")
+    return regressions
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--target", choices=["desktop", "mobile"], default="desktop", help="本进程内启动哪个 app")
+    p.add_argument("--url", help="压测已运行的服务端，如 http://192.168.1.10:2417（此时不生成测试文件）")
+    p.add_argument("--pads", type=int, default=60, help="模拟平板数量")
+    p.add_argument("--duration", type=float, default=30, help="持续秒数")
+    p.add_argument("--ramp", type=float, default=2, help="平板在该秒数内随机错开登录")
+    p.add_argument("--alive-interval", type=float, default=5, help="心跳间隔（秒）")
+    p.add_argument("--poll-interval", type=float, default=10, help="作业/资源轮询间隔（秒）")
+    p.add_argument("--downloads", type=int, default=1, help="每轮轮询下载的文件数")
+    p.add_argument("--files", type=int, default=5, help="本地模式下生成的资源文件数")
+    p.add_argument("--file-size", default="1M", help="每个资源文件大小")
+    p.add_argument("--threads", type=int, default=16, help="本地模式下 Waitress 工作线程数")
+    p.add_argument("--gzip", action="store_true", help="请求时携带 Accept-Encoding: gzip")
+    p.add_argument("--revalidate", action="store_true", help="携带上次的 ETag（If-None-Match）")
+    p.add_argument("--baseline", help="与该基线文件比较，有退化时以非零状态退出")
+    p.add_argument("--tolerance", type=float, default=0.2, help="允许的相对退化幅度")
+    p.add_argument("--save-baseline", help="把本次结果保存为基线")
+    p.add_argument("--json", action="store_true", help="只输出 JSON")
+    args = p.parse_args()
+    args.file_size = parse_size(str(args.file_size))
+
+    result = run(args)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        result["regressions"] = regressions
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+    if args.json:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+    else:
+        print(f"{result['target']}: {result['pads']} 台平板, {result['duration_s']} s, "
+              f"{result['requests']} 个请求 ({result['rps']} req/s, {result['MBps']} MB/s), 错误 {result['errors']}")
+        print(f"  {'接口':<12}{'次数':>8}{'req/s':>9}{'错误率':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for route, r in result["routes"].items():
+            print(f"  {route:<12}{r['count']:>8}{r['rps']:>9}{r['error_rate']:>9.2%}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}")
+        for line in regressions:
+            print(f"退化: {line}")
+        if args.baseline:
+            print("基线比较: " + ("失败" if regressions else "通过"))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+启动耗时基准：用 -X importtime 统计导入 QRQLL 的耗时，并测量 --headless 启动到首个 tokenValid 请求成功的时间
+
+每项取多次运行的中位数（首轮用于生成 .pyc，不计入），与预算文件比较，超出即以非零状态退出，可直接放进 CI。
+
+用法:
+    python bench/startup_bench.py
+    python bench/startup_bench.py --runs 10 --json
+    python bench/startup_bench.py --budget bench/startup_budget.json --top 15
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import http.client
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_budget.json")
+PROBE_PATH = "/classInApp/box/auth/tokenValid"
+
+
+def parse_importtime(stderr: str):
+    """解析 -X importtime 输出，返回 {模块: (自身 us, 累计 us)}"""
+    result = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        result[name.strip()] = (int(self_us), int(cum_us))
+    return result
+
+
+def measure_import():
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import QRQLL"], cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import QRQLL 失败:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_first_response(timeout: float = 30.0) -> float:
+    """从启动进程到 tokenValid 返回 200 的毫秒数"""
+    port = free_port()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "QRQLL.py"), "--headless", "--host", "127.0.0.1", "--port", str(port)],
+                            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - t0 < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"服务端提前退出，返回码 {proc.returncode}")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                conn.request("GET", PROBE_PATH)
+                status = conn.getresponse().status
+                conn.close()
+                if status == 200:
+                    return (time.perf_counter() - t0) * 1000
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError("等待首个响应超时")
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def run(args):
+    measure_import()  # 预热：生成 .pyc
+    imports = [measure_import() for _ in range(args.runs)]
+    first = [measure_first_response() for _ in range(args.runs)]
+    last = imports[-1]
+    top = sorted(last.items(), key=lambda kv: kv[1][0], reverse=True)[:args.top]
+    return {
+        "runs": args.runs,
+        "python": sys.version.split()[0],
+        "import_ms": round(statistics.median(m["QRQLL"][1] for m in imports) / 1000, 1),
+        "first_response_ms": round(statistics.median(first), 1),
+        "modules": len(last),
+        "gui_modules": sorted(n for n in last if n.split(".")[0] in ("tkinter", "ttkbootstrap", "PIL")),
+        "top_self_ms": [{"module": n, "self_ms": round(s / 1000, 1), "cumulative_ms": round(c / 1000, 1)} for n, (s, c) in top],
+    }
+
+
+def check_budget(result, budget):
+    failures = []
+    for key in ("import_ms", "first_response_ms"):
+        if key in budget and result[key] > budget[key]:
+            failures.append(f"{key} = {result[key]} > 预算 {budget[key]}")
+    if "max_modules" in budget and result["modules"] > budget["max_modules"]:
+        failures.append(f"modules = {result['modules']} > 预算 {budget['max_modules']}")
+    forbidden = [n for n in result["gui_modules"] if n.split(".")[0] in budget.get("forbidden_roots", [])]
+    if forbidden:
+        failures.append(f"服务端导入了界面模块: {', '.join(forbidden)}")
+    return failures
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--runs", type=int, default=5, help="每项测量次数，取中位数")
+    p.add_argument("--top", type=int, default=10, help="列出自身耗时最多的前 N 个模块")
+    p.add_argument("--budget", default=DEFAULT_BUDGET, help="预算文件（JSON）；传空字符串则不检查")
+    p.add_argument("--json", action="store_true", help="只输出 JSON")
+    args = p.parse_args()
+
+    result = run(args)
+    budget = {}
+    if args.budget:
+        with open(args.budget, "r", encoding="utf-8") as f:
+            budget = json.load(f)
+    failures = check_budget(result, budget)
+    result["budget"], result["failures"] = budget, failures
+
+    if args.json:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+    else:
+        print(f"import QRQLL      {result['import_ms']} ms（{result['modules']} 个模块，中位数 x{result['runs']}）")
+        print(f"首个 tokenValid   {result['first_response_ms']} ms")
+        print("自身耗时最多的模块:")
+        for m in result["top_self_ms"]:
+            print(f"  {m['self_ms']:>8} ms  {m['cumulative_ms']:>8} ms  {m['module']}")
+        for f in failures:
+            print(f"超出预算: {f}")
+        print("结果: " + ("失败" if failures else "通过"))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,9 @@ package.name = qrqllmobile
 package.domain = org.qrqll.mobile
 source.dir = .
 source.include_exts = py,png,jpg,kv,atlas,ttf,otf,txt,json
+source.exclude_dirs = bench
 version = 1.0.1
-requirements = python3,kivy,kivymd,flask,waitress,pyjnius,android
+requirements = python3,kivy,kivymd,flask,waitress,pyjnius,android,sqlite3
 orientation = portrait
 fullscreen = 0
 author = A6
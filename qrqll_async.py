@@ -0,0 +1,430 @@
+"""
+QRQLL 的 asyncio 服务引擎：接口与 waitress.serve / waitress.create_server 相近的 WSGI 服务器
+
+每个连接只占一个协程，空闲的 keep-alive 连接（平板两次 pub/alive 之间）不占线程；
+只有执行 WSGI 应用、迭代响应体时才借用线程池。文件响应（wsgi.file_wrapper，
+以及带 file/offset/length 的 FileSlice）交给 loop.sendfile，平台支持时走 os.sendfile 零拷贝。
+
+只依赖标准库，桌面端与移动端共用：
+    from qrqll_async import serve
+    serve(app, host="0.0.0.0", port=2417, threads=16)
+
+Waitress 特有的参数（asyncore_use_poll、recv_bytes 等）会被忽略。
+超过 connection_limit 的新连接直接回复 503 并断开。
+"""
+
+import sys
+import socket
+import asyncio
+import logging
+import tempfile
+from email.utils import formatdate
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+logger = logging.getLogger("qrqll.async")
+
+SERVER_SOFTWARE = "qrqll-async"
+MAX_HEADER_BYTES = 64 * 1024
+BODY_SPOOL_BYTES = 1024 * 1024
+# 与 Waitress 的 max_request_body_size 默认值相同，超过时回复 413
+MAX_REQUEST_BODY_SIZE = 1024 * 1024 * 1024
+READ_CHUNK = 256 * 1024
+# 应用返回的普通响应体在工作线程里预先取出的最大字节数，小响应因此只需一次线程切换
+PREFETCH_BYTES = 64 * 1024
+
+
+class FileWrapper:
+    """wsgi.file_wrapper：与 Waitress 一致，从文件当前位置发送 Content-Length 字节；
+    引擎直接用 sendfile 发送，普通迭代时按块读取"""
+
+    def __init__(self, file, block_size: int = READ_CHUNK):
+        self.file = file
+        self.block_size = block_size
+
+    def __iter__(self):
+        while True:
+            data = self.file.read(self.block_size)
+            if not data:
+                return
+            yield data
+
+    def close(self):
+        if hasattr(self.file, "close"):
+            self.file.close()
+
+
+def _file_body(body, content_length):
+    """能走 sendfile 的响应体返回 (文件, 偏移, 长度)，否则返回 None"""
+    if content_length is None:
+        return None
+    content_length = int(content_length)
+    if isinstance(body, FileWrapper) and hasattr(body.file, "fileno"):
+        return body.file, body.file.tell(), content_length
+    f = getattr(body, "file", None)
+    if f is not None and hasattr(f, "fileno") and hasattr(body, "offset") and hasattr(body, "length"):
+        return f, body.offset, body.length
+    return None
+
+
+def _close_result(job):
+    """job 为 _call_app 的 Future：连接已放弃等待，应用返回后关闭其响应体"""
+    if job.cancelled() or job.exception() is not None:
+        return
+    close = getattr(job.result()[0], "close", None)
+    if close is not None:
+        close()
+
+
+def _is_stream(headers) -> bool:
+    """逐条推送的响应（SSE，或声明 X-Accel-Buffering: no）不预取，否则要攒满 PREFETCH_BYTES 才发出响应头"""
+    for k, v in headers:
+        k = k.lower()
+        if (k == "content-type" and v.startswith("text/event-stream")) or (k == "x-accel-buffering" and v.lower() == "no"):
+            return True
+    return False
+
+
+class AsyncServer:
+    """绑定端口（或接管传入的 sockets）后由 run() 在当前线程运行事件循环，close() 可从任意线程调用"""
+
+    def __init__(self, app, host: str = "0.0.0.0", port: int = 8080, threads: int = 16, connection_limit: int = 10000,
+                 backlog: int = 1024, channel_timeout: float = 120, sockets=None, url_scheme: str = "http",
+                 ident: str = SERVER_SOFTWARE, max_request_body_size: int = MAX_REQUEST_BODY_SIZE, **ignored):
+        self.app = app
+        self.threads = threads
+        self.channel_timeout = channel_timeout
+        self.max_request_body_size = max_request_body_size
+        self.url_scheme = url_scheme
+        self.ident = ident
+        self.connection_limit = connection_limit
+        if sockets:
+            self.sockets = list(sockets)
+        else:
+            family = socket.AF_INET6 if ":" in host else socket.AF_INET
+            self.sockets = [socket.create_server((host, port), family=family, backlog=backlog)]
+        self.effective_host, self.effective_port = self.sockets[0].getsockname()[:2]
+        self.connections = 0
+        self.requests = 0
+        self.loop = None
+        self._stop = None
+        self._tasks = set()
+        self._date = (0, "")
+
+    def queue_depth(self) -> int:
+        """已提交给线程池、还没有工作线程接手的任务数（对应 Waitress 任务队列的长度）"""
+        pool = getattr(self, "pool", None)
+        return pool._work_queue.qsize() if pool is not None else 0
+
+    def print_listen(self, format_str):
+        print(format_str.format(self.effective_host, self.effective_port))
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        self.pool = ThreadPoolExecutor(self.threads, thread_name_prefix="qrqll-async")
+        try:
+            self.loop.run_until_complete(self._serve())
+        finally:
+            # 连接协程此时都已结束；仍在执行的应用调用（长轮询、SSE 可能阻塞十几秒）不等待，排队未开始的直接取消
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.loop.close()
+
+    def close(self):
+        if self.loop is not None and self._stop is not None:
+            self.loop.call_soon_threadsafe(self._stop.set)
+
+    async def _serve(self):
+        self._stop = asyncio.Event()
+        servers = []
+        for sock in self.sockets:
+            sock.setblocking(False)
+            servers.append(await asyncio.start_server(self._handle, sock=sock, limit=MAX_HEADER_BYTES))
+        try:
+            await self._stop.wait()
+        finally:
+            for s in servers:
+                s.close()
+            # 先取消并等完所有连接协程（它们的 finally 还要用线程池关闭响应体），再由 run() 关闭线程池和事件循环
+            tasks = list(self._tasks)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _http_date(self) -> str:
+        now = int(self.loop.time())
+        if now != self._date[0]:
+            self._date = (now, formatdate(usegmt=True))
+        return self._date[1]
+
+    # ------------------------------------------------------------------
+    # 连接与请求解析
+    # ------------------------------------------------------------------
+
+    async def _handle(self, reader, writer):
+        if self.connections >= self.connection_limit:
+            # 超过连接上限：直接回 503 并断开，不让已接受的连接挂着等名额
+            await self._simple(writer, "503 Service Unavailable")
+            writer.close()
+            return
+        self.connections += 1
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        sock = writer.get_extra_info("socket")
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        peer = writer.get_extra_info("peername") or ("", 0)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.channel_timeout)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self._simple(writer, "431 Request Header Fields Too Large")
+                    return
+                try:
+                    environ, keep_alive = self._environ(head, peer)
+                except ValueError:
+                    await self._simple(writer, "400 Bad Request")
+                    return
+                error = await self._read_body(reader, writer, environ)
+                if error is not None:
+                    await self._simple(writer, error)
+                    return
+                self.requests += 1
+                if not await self._respond(writer, environ, keep_alive):
+                    return
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception:
+            logger.exception("处理连接时出错")
+        finally:
+            self.connections -= 1
+            self._tasks.discard(task)
+            writer.close()
+
+    def _environ(self, head: bytes, peer):
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, version = lines[0].split(" ", 2)
+        if not version.startswith("HTTP/1."):
+            raise ValueError(version)
+        path, _, query = target.partition("?")
+        if "://" in path:
+            path = "/" + path.split("://", 1)[1].partition("/")[2]
+        environ = {
+            "REQUEST_METHOD": method,
+            "SCRIPT_NAME": "",
+            # WSGI 约定：PATH_INFO 为按 latin-1 解码的原始字节
+            "PATH_INFO": unquote(path, "latin-1"),
+            "QUERY_STRING": query,
+            "SERVER_NAME": str(self.effective_host),
+            "SERVER_PORT": str(self.effective_port),
+            "SERVER_PROTOCOL": version,
+            "SERVER_SOFTWARE": self.ident,
+            "REMOTE_ADDR": str(peer[0]),
+            "REMOTE_PORT": str(peer[1]),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": self.url_scheme,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+            "wsgi.file_wrapper": FileWrapper,
+        }
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(":")
+            if not sep:
+                raise ValueError(line)
+            if "_" in name:
+                # 与 Waitress 相同：含下划线的头名可能用来伪造 CGI 变量，直接丢弃
+                continue
+            key = name.strip().upper().replace("-", "_")
+            value = value.strip()
+            if key in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                environ[key] = value
+            else:
+                key = "HTTP_" + key
+                environ[key] = f"{environ[key]}, {value}" if key in environ else value
+        conn = environ.get("HTTP_CONNECTION", "").lower()
+        keep_alive = "keep-alive" in conn if version == "HTTP/1.0" else "close" not in conn
+        return environ, keep_alive
+
+    async def _read_exactly_into(self, reader, out, n: int):
+        while n > 0:
+            chunk = await asyncio.wait_for(reader.read(min(n, READ_CHUNK)), self.channel_timeout)
+            if not chunk:
+                raise asyncio.IncompleteReadError(b"", n)
+            out.write(chunk)
+            n -= len(chunk)
+
+    async def _read_body(self, reader, writer, environ):
+        """把请求体读入 wsgi.input；成功返回 None，否则返回应回复的状态行（之后关闭连接）。
+        Content-Length 或分块累计超过 max_request_body_size 时不再读取，避免任意客户端占满内存或磁盘"""
+        body = tempfile.SpooledTemporaryFile(BODY_SPOOL_BYTES)
+        environ["wsgi.input"] = body
+        chunked = "chunked" in environ.get("HTTP_TRANSFER_ENCODING", "").lower()
+        length = environ.get("CONTENT_LENGTH", "")
+        try:
+            n = 0 if chunked or not length else int(length)
+            if n < 0:
+                raise ValueError(length)
+            if n > self.max_request_body_size:
+                body.close()
+                return "413 Request Entity Too Large"
+            if (chunked or n) and environ.get("HTTP_EXPECT", "").lower() == "100-continue":
+                writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            if chunked:
+                total = 0
+                while True:
+                    size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                    if size == 0:
+                        while await reader.readuntil(b"\r\n") != b"\r\n":
+                            pass
+                        break
+                    if total + size > self.max_request_body_size:
+                        body.close()
+                        return "413 Request Entity Too Large"
+                    await self._read_exactly_into(reader, body, size)
+                    await reader.readexactly(2)
+                    total += size
+                environ["CONTENT_LENGTH"] = str(total)
+                # 请求体已完整读入：告诉应用可以读到 EOF（Werkzeug 遇到 chunked 时不看 Content-Length）
+                environ["wsgi.input_terminated"] = True
+            elif n:
+                await self._read_exactly_into(reader, body, n)
+        except (ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+            body.close()
+            return "400 Bad Request"
+        body.seek(0)
+        return None
+
+    # ------------------------------------------------------------------
+    # 响应
+    # ------------------------------------------------------------------
+
+    def _call_app(self, environ):
+        """在工作线程里调用应用；普通响应体顺带预取一部分，小响应不必再切换线程"""
+        state = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and state.get("sent"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            state["status"], state["headers"] = status, list(headers)
+            return state.setdefault("written", []).append
+
+        result = self.app(environ, start_response)
+        chunks, size, done = list(state.get("written", [])), 0, False
+        names = {k.lower(): v for k, v in state.get("headers", [])}
+        if "status" not in state or _file_body(result, names.get("content-length")) is None:
+            it = iter(result)
+            state["iter"] = it
+            while size < PREFETCH_BYTES and not ("status" in state and _is_stream(state["headers"])):
+                try:
+                    chunk = next(it)
+                except StopIteration:
+                    done = True
+                    break
+                if chunk:
+                    chunks.append(chunk)
+                    size += len(chunk)
+            names = {k.lower(): v for k, v in state["headers"]}
+        return result, state, chunks, done, names
+
+    async def _respond(self, writer, environ, keep_alive: bool) -> bool:
+        loop = asyncio.get_running_loop()
+        job = self.pool.submit(self._call_app, environ)
+        try:
+            result, state, chunks, done, names = await asyncio.wrap_future(job)
+        except asyncio.CancelledError:
+            # 服务器关闭时应用还在执行：不等它，返回后在工作线程里关闭响应体
+            job.add_done_callback(_close_result)
+            environ["wsgi.input"].close()
+            raise
+        except Exception:
+            logger.exception("应用处理请求时出错")
+            await self._simple(writer, "500 Internal Server Error")
+            return False
+        try:
+            status, headers = state["status"], state["headers"]
+            code = int(status[:3])
+            head_only = environ["REQUEST_METHOD"] == "HEAD"
+            length = names.get("content-length")
+            no_body = head_only or code < 200 or code in (204, 304)
+            chunked = False
+            if length is None and not no_body:
+                if environ["SERVER_PROTOCOL"] == "HTTP/1.1":
+                    chunked = True
+                    headers.append(("Transfer-Encoding", "chunked"))
+                else:
+                    keep_alive = False
+            if "close" in names.get("connection", "").lower():
+                keep_alive = False
+            headers = [(k, v) for k, v in headers if k.lower() != "connection"]
+            headers.append(("Connection", "keep-alive" if keep_alive else "close"))
+            if "date" not in names:
+                headers.append(("Date", self._http_date()))
+            if "server" not in names:
+                headers.append(("Server", self.ident))
+            head = f"HTTP/1.1 {status}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers) + "\r\n"
+            writer.write(head.encode("latin-1"))
+            state["sent"] = True
+            if no_body:
+                await writer.drain()
+                return keep_alive
+
+            file_body = _file_body(result, length) if "iter" not in state else None
+            if file_body is not None:
+                f, offset, count = file_body
+                await writer.drain()
+                if count > 0:
+                    await loop.sendfile(writer.transport, f, offset, count)
+                return keep_alive
+
+            for chunk in chunks:
+                writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk) if chunked else chunk)
+            await writer.drain()
+            it = state["iter"]
+            while not done:
+                job = self.pool.submit(next, it, None)
+                chunk = await asyncio.wrap_future(job)
+                if chunk is None:
+                    break
+                if chunk:
+                    writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk) if chunked else chunk)
+                    await writer.drain()
+            if chunked:
+                writer.write(b"0\r\n\r\n")
+            await writer.drain()
+            return keep_alive
+        finally:
+            close = getattr(result, "close", None)
+            if close is not None:
+                if not job.done():
+                    # 被取消时 next() 可能还在工作线程里执行，生成器不能在别的线程迭代时关闭，等它返回后就地关闭
+                    job.add_done_callback(lambda _: close())
+                else:
+                    await loop.run_in_executor(self.pool, close)
+            environ["wsgi.input"].close()
+
+    async def _simple(self, writer, status: str):
+        body = status.encode("latin-1")
+        writer.write(b"HTTP/1.1 %s\r\nContent-Type: text/plain\r\nContent-Length: %d\r\nConnection: close\r\n\r\n%s" % (body, len(body), body))
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+def create_server(app, **kw) -> AsyncServer:
+    return AsyncServer(app, **kw)
+
+
+def serve(app, **kw):
+    server = create_server(app, **kw)
+    server.print_listen("Serving on http://{}:{}")
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,1353 @@
+"""
+QRQLL 桌面端（QRQLL.py）与移动端（qrqll_mobile.py）共用的核心：作业配置存储与持久化、资源目录索引、
+内容寻址存储、配置导入、请求统计、文件响应体与变更流
+
+这里不依赖界面，也不读 Flask 的请求上下文；两个前端各自创建实例并接到自己的路由上：
+    from qrqll_core import HomeworkStore, ResourceIndex, ConfigDB
+    store = HomeworkStore(default_entries)
+    index = ResourceIndex(resources_dir, recursive=False)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import stat
+import mmap
+import uuid
+import errno
+import bisect
+import codecs
+import hashlib
+import sqlite3
+from queue import Queue
+from itertools import islice
+from collections import deque
+from shutil import copystat
+from threading import Thread, Lock, RLock, Condition, Event
+from types import MappingProxyType
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# ------------------------------------------------------------------
+# 作业配置：写时复制的不可变快照，请求线程无锁读取
+# ------------------------------------------------------------------
+
+class HomeworkSnapshot:
+    """某一版本作业配置的不可变快照：条目为只读映射，发布后不再修改，请求线程拿到引用即可无锁读取"""
+    __slots__ = ("version", "updated_at", "entries", "index")
+
+    def __init__(self, version: int, updated_at: float, index: dict):
+        self.version = version
+        self.updated_at = updated_at
+        self.index = MappingProxyType(index)
+        self.entries = tuple(index.values())
+
+
+class HomeworkStore:
+    """作业配置存储：写时复制——每次修改在锁内基于当前快照构建新的 id 索引，再整体替换快照引用；
+    读取只取当前快照，不加锁也不复制，读不到修改了一半的条目。可挂接 loader 在首次访问时加载持久化的内容"""
+
+    def __init__(self, entries=()):
+        self._lock = RLock()
+        self._listeners = []
+        self._loader = None
+        index = {}
+        for entry in map(self._freeze, entries):
+            index[entry["id"]] = entry
+        self._snapshot = HomeworkSnapshot(0, time.time(), index)
+
+    def __len__(self):
+        return len(self.snapshot().entries)
+
+    def __contains__(self, hw_id):
+        return str(hw_id) in self.snapshot().index
+
+    def __iter__(self):
+        return iter(self.items())
+
+    @staticmethod
+    def _normalize(entry) -> dict:
+        if not isinstance(entry, (dict, MappingProxyType)) or entry.get("id") in (None, ""):
+            raise ValueError("作业条目缺少 id")
+        return dict(entry, id=str(entry["id"]))
+
+    @classmethod
+    def _freeze(cls, entry) -> MappingProxyType:
+        return MappingProxyType(cls._normalize(entry))
+
+    @property
+    def version(self) -> int:
+        return self.snapshot().version
+
+    @property
+    def updated_at(self) -> float:
+        return self.snapshot().updated_at
+
+    def snapshot(self) -> HomeworkSnapshot:
+        """当前快照；同一请求内多处用到配置时应只取一次，版本号、时间与条目才彼此一致"""
+        if self._loader is not None:
+            self._ensure()
+        return self._snapshot
+
+    def attach(self, loader):
+        """改为首次访问时调用 loader(当前条目)，用其返回的条目整体替换当前内容（不触发变更通知）"""
+        with self._lock:
+            self._loader = loader
+
+    def _ensure(self):
+        with self._lock:
+            if self._loader is None:
+                return
+            loader, self._loader = self._loader, None
+            index = {}
+            for e in map(self._freeze, loader(list(self._snapshot.entries))):
+                index[e["id"]] = e
+            snap = self._snapshot
+            self._snapshot = HomeworkSnapshot(snap.version, snap.updated_at, index)
+
+    def _publish(self, index: dict):
+        """调用方持有锁；index 为新构建的字典，发布后不再修改"""
+        self._snapshot = HomeworkSnapshot(self._snapshot.version + 1, time.time(), index)
+
+    def subscribe(self, callback):
+        """callback(action, ids)：action 为 upsert/delete/replace，ids 为涉及的作业 id 列表（replace 时为空），在触发变更的线程中调用"""
+        self._listeners.append(callback)
+
+    def _notify(self, action: str, ids):
+        for cb in list(self._listeners):
+            try:
+                cb(action, ids)
+            except Exception:
+                pass
+
+    def get(self, hw_id) -> Optional[MappingProxyType]:
+        return self.snapshot().index.get(str(hw_id))
+
+    def first(self) -> Optional[MappingProxyType]:
+        entries = self.snapshot().entries
+        return entries[0] if entries else None
+
+    def items(self) -> tuple:
+        """按插入顺序的只读条目（当前快照的元组，无需复制）"""
+        return self.snapshot().entries
+
+    def page(self, start: int, end: int) -> tuple:
+        return self.items()[start:end]
+
+    def upsert(self, entry) -> bool:
+        return self.extend([entry]) == 1
+
+    def extend(self, entries) -> int:
+        """逐条 upsert，返回新增条目数；先全部校验，避免半途失败。已存在的 id 原位覆盖，保持其在列表中的顺序"""
+        entries = [self._freeze(e) for e in entries]
+        with self._lock:
+            self._ensure()
+            index = dict(self._snapshot.index)
+            before = len(index)
+            for e in entries:
+                index[e["id"]] = e
+            count = len(index) - before
+            self._publish(index)
+        self._notify("upsert", [e["id"] for e in entries])
+        return count
+
+    def delete(self, hw_id) -> bool:
+        hw_id = str(hw_id)
+        with self._lock:
+            self._ensure()
+            if hw_id not in self._snapshot.index:
+                return False
+            index = dict(self._snapshot.index)
+            del index[hw_id]
+            self._publish(index)
+        self._notify("delete", [hw_id])
+        return True
+
+    def import_index(self, index: Dict[str, dict], merge: bool = False) -> int:
+        """整体换入已校验、已去重的 {id: 条目}（不再逐条规范化）；merge 时与现有条目合并，已有 id 原位覆盖。
+        新快照构建好后一次性替换，读请求看不到导入了一半的配置；返回新增条目数"""
+        ids = list(index) if merge else []
+        frozen = {k: MappingProxyType(v) for k, v in index.items()}
+        with self._lock:
+            self._ensure()
+            if merge:
+                merged = dict(self._snapshot.index)
+                before = len(merged)
+                merged.update(frozen)
+                added, frozen = len(merged) - before, merged
+            else:
+                added = len(frozen)
+            self._loader = None
+            self._publish(frozen)
+        self._notify("upsert" if merge else "replace", ids)
+        return added
+
+    def replace(self, entries):
+        index = {}
+        for e in map(self._freeze, entries):
+            index[e["id"]] = e
+        with self._lock:
+            self._loader = None
+            self._publish(index)
+        self._notify("replace", [])
+
+    def clear(self):
+        self.replace(())
+
+    def to_list(self) -> list:
+        return [dict(e) for e in self.items()]
+
+    def dump(self) -> dict:
+        snap = self.snapshot()
+        return {"version": snap.version, "updated_at": snap.updated_at, "entries": [dict(e) for e in snap.entries]}
+
+    def restore(self, state: dict):
+        """换入另一进程 dump() 出的配置，沿用其版本号与更新时间，不触发变更通知（多进程模式的工作进程使用）"""
+        index = {}
+        for e in map(self._freeze, state["entries"]):
+            index[e["id"]] = e
+        with self._lock:
+            self._loader = None
+            self._snapshot = HomeworkSnapshot(state["version"], state["updated_at"], index)
+
+
+# ------------------------------------------------------------------
+# 资源目录索引
+# ------------------------------------------------------------------
+
+# 复制、上传中的临时文件与其元数据（均以 . 开头），索引不收录
+PARTIAL_SUFFIX = ".qrqll-part"
+UPLOAD_META_SUFFIX = ".qrqll-upload"
+TEMP_SUFFIXES = (PARTIAL_SUFFIX, UPLOAD_META_SUFFIX)
+
+
+class ResourceIndex:
+    """资源目录内存索引：首次使用时扫描一次，之后由 watchdog 文件监听（不可用时退化为 mtime 轮询）增量维护"""
+
+    def __init__(self, root: str, recursive: bool = True, poll_interval: float = 2.0, full_scan_every: int = 15):
+        self.root = root
+        self.recursive = recursive
+        self.poll_interval = poll_interval
+        self.full_scan_every = full_scan_every
+        self._version = 0
+        self.updated_at = time.time()
+        self._lock = RLock()
+        self._entries: Dict[str, dict] = {}
+        self._dirs: Dict[str, float] = {}
+        self._order: Optional[list] = None
+        self._scanned = False
+        self._listeners = []
+        self._observer = None
+
+    @staticmethod
+    def file_id(rel_path: str) -> str:
+        # 由相对路径派生，文件增删不会改变其他文件的 fileId
+        return "file-" + hashlib.sha1(rel_path.encode("utf-8")).hexdigest()[:16]
+
+    def subscribe(self, callback):
+        """callback(changed, removed)：两个相对路径列表，在触发变更的线程中调用"""
+        self._listeners.append(callback)
+
+    def abspath(self, rel_path: str) -> str:
+        return os.path.join(self.root, *rel_path.split("/"))
+
+    def relpath(self, path: str) -> str:
+        return os.path.relpath(path, self.root).replace("\\", "/")
+
+    def _ensure(self):
+        if not self._scanned:
+            self.scan()
+
+    @property
+    def version(self) -> int:
+        self._ensure()
+        return self._version
+
+    def __len__(self):
+        self._ensure()
+        return len(self._entries)
+
+    def get(self, rel_path: str) -> Optional[dict]:
+        self._ensure()
+        return self._entries.get(rel_path)
+
+    def items(self) -> list:
+        """按相对路径排序的条目列表（共享缓存，调用方不要修改）"""
+        self._ensure()
+        order = self._order
+        if order is None:
+            with self._lock:
+                if self._order is None:
+                    self._order = [self._entries[k] for k in sorted(self._entries)]
+                order = self._order
+        return order
+
+    def page(self, start: int, end: int) -> list:
+        return self.items()[start:end]
+
+    def dump(self) -> dict:
+        """当前索引（不触发扫描，尚未扫描时为空）"""
+        with self._lock:
+            return {"version": self._version, "updated_at": self.updated_at, "entries": list(self._entries.values())}
+
+    def restore(self, state: dict):
+        """换入另一进程 dump() 出的索引，之后不再自行扫描，不触发变更通知"""
+        entries = {e["path"]: e for e in state["entries"]}
+        with self._lock:
+            self._entries, self._order, self._scanned = entries, None, True
+            self._version, self.updated_at = state["version"], state["updated_at"]
+
+    def _make_entry(self, rel_path: str, st) -> dict:
+        return {"fileId": self.file_id(rel_path), "path": rel_path, "name": rel_path.rsplit("/", 1)[-1], "size": st.st_size, "mtime": st.st_mtime, "suffix": os.path.splitext(rel_path)[1].lower().lstrip(".")}
+
+    def _walk(self, rel_dir: str, files: dict, dirs: dict):
+        abs_dir = self.abspath(rel_dir) if rel_dir else self.root
+        try:
+            dirs[rel_dir] = os.stat(abs_dir).st_mtime
+            with os.scandir(abs_dir) as it:
+                for de in it:
+                    rel = f"{rel_dir}/{de.name}" if rel_dir else de.name
+                    try:
+                        if de.is_dir():
+                            if self.recursive:
+                                self._walk(rel, files, dirs)
+                        elif de.is_file() and not de.name.endswith(TEMP_SUFFIXES):
+                            files[rel] = de.stat()
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+
+    def _apply(self, rel_dir: str, files: dict, dirs: dict):
+        """用 rel_dir 子树的扫描结果替换索引中对应部分，只对真正变化的条目通知"""
+        prefix = f"{rel_dir}/" if rel_dir else ""
+        changed, removed = [], []
+        with self._lock:
+            for rel in [k for k in self._entries if k.startswith(prefix)]:
+                if rel not in files:
+                    del self._entries[rel]
+                    removed.append(rel)
+            for rel, st in files.items():
+                old = self._entries.get(rel)
+                if old is None or old["size"] != st.st_size or old["mtime"] != st.st_mtime:
+                    self._entries[rel] = self._make_entry(rel, st)
+                    changed.append(rel)
+            for d in [k for k in self._dirs if k == rel_dir or k.startswith(prefix)]:
+                if d not in dirs:
+                    del self._dirs[d]
+            self._dirs.update(dirs)
+            self._scanned = True
+            if changed or removed:
+                self._order = None
+                self._version += 1
+                self.updated_at = time.time()
+        if changed or removed:
+            self._notify(changed, removed)
+
+    def _notify(self, changed, removed):
+        for cb in list(self._listeners):
+            try:
+                cb(changed, removed)
+            except Exception:
+                pass
+
+    def scan(self, rel_dir: str = ""):
+        files, dirs = {}, {}
+        self._walk(rel_dir, files, dirs)
+        self._apply(rel_dir, files, dirs)
+
+    def touch(self, path: str):
+        """单个文件被本程序增删改后立即同步索引（接受绝对路径或相对路径）"""
+        # 统一按规范化的相对路径收录（sub/../a、./a、a//b 都落到同一条目），根目录外的路径忽略
+        rel = self.relpath(path if os.path.isabs(path) else self.abspath(path))
+        if rel == "." or rel == ".." or rel.startswith("../"):
+            return
+        if not self.recursive and "/" in rel:
+            return
+        if rel.endswith(TEMP_SUFFIXES):
+            return
+        abs_path = self.abspath(rel)
+        if os.path.isdir(abs_path):
+            return self.scan(rel) if self.recursive else None
+        try:
+            st = os.stat(abs_path)
+        except OSError:
+            st = None
+        with self._lock:
+            old = self._entries.get(rel)
+            if st is None:
+                if old is None:
+                    return
+                del self._entries[rel]
+            elif old is not None and old["size"] == st.st_size and old["mtime"] == st.st_mtime:
+                return
+            else:
+                self._entries[rel] = self._make_entry(rel, st)
+            self._order = None
+            self._version += 1
+            self.updated_at = time.time()
+        self._notify([] if st is None else [rel], [rel] if st is None else [])
+
+    def start(self):
+        """建立初始索引并启动后台监听"""
+        self.scan()
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            Observer = None
+        if Observer is not None:
+            index = self
+
+            class _Handler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    if event.event_type in ("opened", "closed_no_write"):
+                        return
+                    for p in (event.src_path, getattr(event, "dest_path", "")):
+                        rel = index.relpath(p) if p else "."
+                        if rel == "." or rel.startswith(".."):
+                            continue
+                        # 目录级事件（新建/删除/改名）直接重扫其父目录
+                        if event.is_directory:
+                            index.scan(rel.rpartition("/")[0])
+                        else:
+                            index.touch(rel)
+            try:
+                self._observer = Observer()
+                self._observer.schedule(_Handler(), self.root, recursive=self.recursive)
+                self._observer.daemon = True
+                self._observer.start()
+                return
+            except Exception:
+                self._observer = None
+        Thread(target=self._poll_loop, daemon=True).start()
+
+    def _poll_loop(self):
+        # 目录 mtime 变化说明有文件增删/改名，只重扫该目录；原地覆盖写不改目录 mtime，靠定期全量扫描兜底
+        rounds = 0
+        while True:
+            time.sleep(self.poll_interval)
+            rounds += 1
+            if rounds % self.full_scan_every == 0:
+                self.scan()
+                continue
+            for rel_dir, mtime in list(self._dirs.items()):
+                try:
+                    cur = os.stat(self.abspath(rel_dir) if rel_dir else self.root).st_mtime
+                except OSError:
+                    cur = None
+                if cur != mtime:
+                    self.scan(rel_dir)
+
+
+# ------------------------------------------------------------------
+# 配置持久化
+# ------------------------------------------------------------------
+
+class ConfigDB:
+    """SQLite（WAL）持久化作业配置（桌面端另存设备历史）。只存当前状态，启动加载耗时只与条目数有关、与编辑历史长短无关；
+    变更由后台写线程合并后在单个事务中落盘（synchronous=FULL，提交即持久），单条编辑只写一行"""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS homework (id TEXT PRIMARY KEY, seq INTEGER NOT NULL, data TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS homework_seq ON homework (seq)",
+        "CREATE TABLE IF NOT EXISTS devices (ip TEXT PRIMARY KEY, first_seen REAL, last_seen REAL, last_path TEXT, requests INTEGER, bytes INTEGER)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    )
+
+    def __init__(self, path: str, store: HomeworkStore, devices=None, device_interval: float = 30.0):
+        """devices 为提供 changes 计数与 history() 的设备表（桌面端的 PresenceTracker），每 device_interval 秒有变化时落盘一次"""
+        self.path = path
+        self.store = store
+        self.devices = devices
+        self.device_interval = device_interval
+        self._db_lock = Lock()
+        self._pending_lock = Lock()
+        self._dirty = set()
+        self._replace = False
+        self._device_changes = None
+        self._wake = Event()
+        self._closed = False
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        with self._conn:
+            for sql in self.SCHEMA:
+                self._conn.execute(sql)
+        store.subscribe(self.on_homework_change)
+        self._thread = Thread(target=self._run, daemon=True, name="config-db")
+        self._thread.start()
+
+    def load_homework(self, default: list) -> list:
+        """作为 HomeworkStore 的 loader：库为空（首次运行）时写入并返回 default"""
+        with self._db_lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'homework'").fetchone() is None:
+                with self._conn:
+                    self._write_all(default)
+                    self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('homework', '1')")
+                return default
+            return [json.loads(data) for (data,) in self._conn.execute("SELECT data FROM homework ORDER BY seq")]
+
+    def load_devices(self) -> list:
+        with self._db_lock:
+            return self._conn.execute("SELECT ip, first_seen, last_seen, last_path, requests, bytes FROM devices").fetchall()
+
+    def on_homework_change(self, action: str, ids):
+        with self._pending_lock:
+            if action == "replace":
+                self._replace, self._dirty = True, set()
+            elif not self._replace:
+                self._dirty.update(ids)
+        self._wake.set()
+
+    def _write_all(self, entries):
+        self._conn.execute("DELETE FROM homework")
+        self._conn.executemany("INSERT INTO homework VALUES (?, ?, ?)",
+                               ((e["id"], i, json.dumps(dict(e), ensure_ascii=False)) for i, e in enumerate(entries)))
+
+    @staticmethod
+    def _appended(snap: HomeworkSnapshot, dirty) -> list:
+        """新增（含删除后重新加入）的条目总在列表末尾：从末尾起连续的脏条目按内存顺序返回，落盘时依次取新的 seq，
+        重启后 ORDER BY seq 读出的顺序与内存一致；其余脏条目原位更新，seq 不变"""
+        tail = []
+        for e in reversed(snap.entries):
+            if e["id"] not in dirty:
+                break
+            tail.append(e["id"])
+        tail.reverse()
+        return tail
+
+    def flush(self):
+        with self._pending_lock:
+            replace, dirty = self._replace, self._dirty
+            self._replace, self._dirty = False, set()
+        history = None
+        if self.devices is not None and self.devices.changes != self._device_changes:
+            history = self.devices.history()
+        if not (replace or dirty or history):
+            return
+        # 按内存中的当前状态落盘而不是重放动作，变更通知乱序到达也不会写出旧值；先取数据再拿库锁
+        snap = self.store.snapshot()
+        entries = snap.entries if replace else None
+        appended = self._appended(snap, dirty)
+        current = [(hw_id, snap.index.get(hw_id)) for hw_id in dirty.difference(appended)]
+        try:
+            with self._db_lock, self._conn:
+                if replace:
+                    self._write_all(entries)
+                for hw_id, entry in current:
+                    if entry is None:
+                        self._conn.execute("DELETE FROM homework WHERE id = ?", (hw_id,))
+                    else:
+                        self._conn.execute(
+                            "INSERT INTO homework VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM homework), ?) "
+                            "ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+                            (hw_id, json.dumps(dict(entry), ensure_ascii=False)))
+                for hw_id in appended:
+                    self._conn.execute(
+                        "INSERT INTO homework VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM homework), ?) "
+                        "ON CONFLICT(id) DO UPDATE SET seq = excluded.seq, data = excluded.data",
+                        (hw_id, json.dumps(dict(snap.index[hw_id]), ensure_ascii=False)))
+                if replace or dirty:
+                    self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('homework', '1')")
+                if history:
+                    self._conn.execute("DELETE FROM devices")
+                    self._conn.executemany("INSERT INTO devices VALUES (?, ?, ?, ?, ?, ?)", history[1])
+        except sqlite3.Error as e:
+            # 写入失败时把变更放回队列，下次再试
+            print(f"[ConfigDB] 写入 {self.path} 失败: {e}", file=sys.stderr)
+            with self._pending_lock:
+                if replace:
+                    self._replace, self._dirty = True, set()
+                elif not self._replace:
+                    self._dirty |= dirty
+            return
+        if history:
+            self._device_changes = history[0]
+
+    def _run(self):
+        interval = self.device_interval if self.devices is not None else None
+        while not self._closed:
+            self._wake.wait(interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join(5)
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+
+# ------------------------------------------------------------------
+# 内容寻址存储：后台计算每个资源的 SHA-256，内容相同的大文件合并为同一对象的硬链接
+# 对象存放在 <root>/objects/<前两位>/<其余>；哈希按 (设备, inode, 大小, mtime) 缓存在 <root>/hashes.db
+# ------------------------------------------------------------------
+
+# 小文件（常被原地编辑的网页、文本）不合并：硬链接的多个名字共享内容，改一个会牵连其他。
+# 被多个名字共用的对象设为只读，交给外部程序打开前先换成独立副本（detach）
+DEDUP_MIN_SIZE = 1024 * 1024
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+COPY_CHUNK = 8 * 1024 * 1024
+FICLONE = 0x40049409  # Linux ioctl：reflink 克隆（btrfs/xfs 等）
+
+
+def _copy_reflink(fsrc, fdst) -> bool:
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        return False
+    return True
+
+
+def _copy_file_range(fsrc, fdst, size: int, progress=None) -> bool:
+    """内核内复制；第一块就不被支持（跨文件系统、老内核等）时返回 False 交给普通复制"""
+    if not hasattr(os, "copy_file_range"):
+        return False
+    fin, fout, copied = fsrc.fileno(), fdst.fileno(), 0
+    while copied < size:
+        try:
+            n = os.copy_file_range(fin, fout, min(COPY_CHUNK, size - copied))
+        except OSError:
+            if copied:
+                raise
+            return False
+        if n == 0:
+            break
+        copied += n
+        if progress:
+            progress(n)
+    return True
+
+
+def make_writable(path: str):
+    """去重后被共用的资源是只读的；Windows 上只读文件不能删除或被替换，删除/覆盖前先恢复写权限"""
+    if os.name != "nt":
+        return
+    try:
+        os.chmod(path, stat.S_IMODE(os.stat(path).st_mode) | stat.S_IWUSR)
+    except OSError:
+        pass
+
+
+def fast_copy(src: str, dst: str, progress=None):
+    """依次尝试 reflink、copy_file_range、分块读写；先写同目录临时文件再原子改名，并保留时间戳等元数据。
+    progress(字节数) 每复制一段调用一次，抛出异常即中止复制"""
+    tmp = os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}.{uuid.uuid4().hex[:8]}{PARTIAL_SUFFIX}")
+    try:
+        with open(src, "rb") as fsrc, open(tmp, "wb") as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            if _copy_reflink(fsrc, fdst):
+                if progress:
+                    progress(size)
+            elif not _copy_file_range(fsrc, fdst, size, progress):
+                buf = bytearray(min(COPY_CHUNK, max(size, 1)))
+                view = memoryview(buf)
+                while True:
+                    n = fsrc.readinto(buf)
+                    if not n:
+                        break
+                    fdst.write(view[:n])
+                    if progress:
+                        progress(n)
+        copystat(src, tmp)
+        make_writable(dst)
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class ContentStore:
+    """为资源索引中的文件维护内容哈希并去重；文件系统不支持硬链接（FAT/exFAT 移动硬盘、外置 SD 卡等）时只计算哈希（用于 ETag 和列表）"""
+
+    def __init__(self, index: ResourceIndex, root: str = None):
+        self.index = index
+        self.root = root
+        self.objects = os.path.join(root, "objects") if root else None
+        self.linkable = True
+        self.version = 0
+        self._hashes: Dict[str, tuple] = {}  # 相对路径 -> (size, mtime, sha256)
+        self._lock = Lock()
+        self._db = None
+        self._queue = Queue()
+        self._started = False
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.objects, digest[:2], digest[2:])
+
+    def lookup(self, entry: dict) -> Optional[str]:
+        """哈希已算出且与条目当前的大小、mtime 一致时返回十六进制 SHA-256"""
+        h = self._hashes.get(entry["path"])
+        if h is None or h[0] != entry["size"] or h[1] != entry["mtime"]:
+            return None
+        return h[2]
+
+    def dump(self) -> dict:
+        return {"version": self.version, "hashes": dict(self._hashes)}
+
+    def restore(self, state: dict):
+        self._hashes, self.version = {k: tuple(v) for k, v in state["hashes"].items()}, state["version"]
+
+    def start(self, root: str = None):
+        """root 可以到启动时才给出（移动端的 user_data_dir 要等 App 创建后才知道）"""
+        if self._started:
+            return
+        if root:
+            self.root, self.objects = root, os.path.join(root, "objects")
+        os.makedirs(self.objects, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.root, "hashes.db"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS hashes (dev INTEGER NOT NULL, ino INTEGER NOT NULL, size INTEGER NOT NULL, "
+                             "mtime REAL NOT NULL, sha256 TEXT NOT NULL, PRIMARY KEY (dev, ino))")
+        self._started = True
+        self.index.subscribe(lambda changed, removed: [self._queue.put(rel) for rel in changed + removed])
+        for e in self.index.items():
+            self._queue.put(e["path"])
+        self._queue.put(None)  # 首轮同步完成后回收孤立对象
+        Thread(target=self._worker, daemon=True).start()
+
+    def _worker(self):
+        while True:
+            rel = self._queue.get()
+            try:
+                if rel is None:
+                    self._collect()
+                else:
+                    self._sync(rel)
+            except Exception:
+                pass
+
+    def _cached(self, st) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT size, mtime, sha256 FROM hashes WHERE dev = ? AND ino = ?", (st.st_dev, st.st_ino)).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime:
+            return None
+        return row[2]
+
+    def _remember(self, st, digest: str):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)", (st.st_dev, st.st_ino, st.st_size, st.st_mtime, digest))
+
+    def _forget(self, st):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM hashes WHERE dev = ? AND ino = ?", (st.st_dev, st.st_ino))
+
+    @staticmethod
+    def _hash_file(path: str) -> str:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def ingest(self, src: str, dest: str, digest: str):
+        """把已知哈希的新文件（上传完成的临时文件）放到 dest；对象库里已有相同内容时直接链接过去，省掉一份空间"""
+        if self._started and self.linkable:
+            try:
+                ost = os.stat(self.object_path(digest))
+                if ost.st_size >= DEDUP_MIN_SIZE and self._cached(ost) == digest:
+                    self._replace_with_link(self.object_path(digest), dest)
+                    self._protect(self.object_path(digest))
+                    os.remove(src)
+                    return
+            except OSError:
+                pass
+        os.replace(src, dest)
+        if self._started:
+            # 记下哈希，后台合并时不必再读一遍文件
+            self._remember(os.stat(dest), digest)
+
+    @staticmethod
+    def _replace_with_link(obj: str, path: str):
+        tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{uuid.uuid4().hex[:8]}{PARTIAL_SUFFIX}")
+        os.link(obj, tmp)
+        try:
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def _sync(self, rel: str):
+        entry = self.index.get(rel)
+        old = self._hashes.get(rel)
+        if entry is None:
+            if old is not None:
+                del self._hashes[rel]
+                self.version += 1
+                self._release(old[2])
+            return
+        path = self.index.abspath(rel)
+        st = os.stat(path)
+        # 索引还没跟上文件的最新状态，等下一次变更通知
+        if (st.st_size, st.st_mtime) != (entry["size"], entry["mtime"]):
+            return
+        digest = self._cached(st)
+        if digest is None:
+            digest = self._hash_file(path)
+            cur = os.stat(path)
+            if (cur.st_ino, cur.st_size, cur.st_mtime) != (st.st_ino, st.st_size, st.st_mtime):
+                return
+            self._remember(st, digest)
+        if self.linkable and st.st_size >= DEDUP_MIN_SIZE:
+            st = self._link(path, st, digest) or st
+        self._hashes[rel] = (st.st_size, st.st_mtime, digest)
+        if old is None or old[2] != digest:
+            self.version += 1
+        if old is not None and old[2] != digest:
+            self._release(old[2])
+
+    def _link(self, path: str, st, digest: str):
+        """把 path 并入对象库：对象不存在时以 path 为对象，已存在时把 path 换成对象的硬链接；返回换成链接后 path 的 stat"""
+        obj = self.object_path(digest)
+        try:
+            ost = os.stat(obj)
+        except FileNotFoundError:
+            ost = None
+        if ost is not None and (ost.st_dev, ost.st_ino) == (st.st_dev, st.st_ino):
+            return None
+        if ost is not None and self._cached(ost) != digest:
+            # 对象经某个名字被原地改写过，内容已不可信，丢弃后由当前文件重建
+            os.remove(obj)
+            ost = None
+        try:
+            if ost is None:
+                os.makedirs(os.path.dirname(obj), exist_ok=True)
+                os.link(path, obj)
+                return None
+            cur = os.stat(path)
+            if (cur.st_ino, cur.st_size, cur.st_mtime) != (st.st_ino, st.st_size, st.st_mtime):
+                return None
+            self._replace_with_link(obj, path)
+            self._protect(obj)
+            return ost
+        except OSError as e:
+            # FAT/exFAT 移动硬盘、跨设备等不支持硬链接：之后只算哈希
+            if e.errno in (errno.EXDEV, errno.EPERM, errno.EACCES, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP):
+                self.linkable = False
+            return None
+
+    @staticmethod
+    def _protect(obj: str):
+        """对象被两个及以上资源名共用时设为只读（外部程序原地改写会失败，而不是悄悄改掉其他名字的内容），只剩一个名字时恢复可写"""
+        try:
+            st = os.stat(obj)
+        except OSError:
+            return
+        mode = stat.S_IMODE(st.st_mode)
+        mode = mode & ~0o222 if st.st_nlink > 2 else mode | stat.S_IWUSR
+        if mode != stat.S_IMODE(st.st_mode):
+            os.chmod(obj, mode)
+
+    def detach(self, path: str):
+        """把与其他名字共用内容的 path 换成独立的可写副本；交给外部程序打开前调用，之后的原地编辑只影响这一个名字。
+        副本保留 mtime，索引看不到变化，不会被马上重新合并"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        if st.st_nlink <= 1:
+            return
+        tmp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{uuid.uuid4().hex[:8]}{PARTIAL_SUFFIX}")
+        try:
+            fast_copy(path, tmp)
+            os.chmod(tmp, stat.S_IMODE(st.st_mode) | stat.S_IWUSR)
+            make_writable(path)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        h = self._hashes.get(self.index.relpath(path))
+        if h is not None:
+            self._protect(self.object_path(h[2]))
+
+    def _release(self, digest: str):
+        """没有任何名字再引用的对象（链接数只剩对象自己）从对象库删除"""
+        obj = self.object_path(digest)
+        try:
+            st = os.stat(obj)
+        except OSError:
+            return
+        if st.st_nlink > 1:
+            self._protect(obj)
+            return
+        os.remove(obj)
+        self._forget(st)
+
+    def _collect(self):
+        """回收程序未运行期间被删掉名字的对象"""
+        for bucket in os.scandir(self.objects):
+            if not bucket.is_dir():
+                continue
+            for de in os.scandir(bucket.path):
+                try:
+                    if de.is_file() and de.stat().st_nlink <= 1:
+                        self._release(bucket.name + de.name)
+                except OSError:
+                    pass
+
+
+# ------------------------------------------------------------------
+# 作业配置导入：流式解析顶层 JSON 数组，逐条校验并按 id 去重，
+# 全部完成后一次性换入作业存储（几十 MB 的配置不必整体读入内存）
+# ------------------------------------------------------------------
+
+IMPORT_CHUNK = 1024 * 1024
+IMPORT_MAX_ENTRY = 16 * 1024 * 1024  # 单个条目的最大长度，超过视为格式错误，避免缓冲区无限增长
+IMPORT_MAX_ERRORS = 20
+HW_ORIENTATIONS = ("landscape", "portrait")
+HW_SCALE_MIN, HW_SCALE_MAX = 0.1, 5.0
+
+
+def iter_json_array(fp, progress=None, chunk_size: int = IMPORT_CHUNK):
+    """逐个产出二进制流中顶层 JSON 数组的元素，内存中只保留当前块和未解析完的尾部；每读入一块调用 progress(字节数)"""
+    decoder, utf8 = json.JSONDecoder(), codecs.getincrementaldecoder("utf-8-sig")()
+    skip_ws = re.compile(r"[ \t\r\n]*").match
+    buf, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buf, pos, eof
+        data = fp.read(chunk_size)
+        eof = not data
+        if data and progress:
+            progress(len(data))
+        buf, pos = buf[pos:] + utf8.decode(data, final=eof), 0
+
+    def next_char() -> str:
+        nonlocal pos
+        while True:
+            pos = skip_ws(buf, pos).end()
+            if pos < len(buf):
+                return buf[pos]
+            if eof:
+                raise ValueError("JSON 不完整：缺少结尾的 ]")
+            fill()
+
+    fill()
+    if next_char() != "[":
+        raise ValueError("作业配置须为 JSON 数组")
+    pos += 1
+    if next_char() == "]":
+        return
+    while True:
+        next_char()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # 数字等标量可能恰好被块边界截断，读到缓冲区末尾时先补一块再解析
+                if end < len(buf) or eof:
+                    break
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise ValueError(f"JSON 格式错误：{e}") from None
+                if len(buf) - pos > IMPORT_MAX_ENTRY:
+                    raise ValueError(f"JSON 格式错误或单个条目超过 {IMPORT_MAX_ENTRY // 1048576} MB：{e}") from None
+            fill()
+        pos = end
+        yield value
+        ch = next_char()
+        pos += 1
+        if ch == "]":
+            return
+        if ch != ",":
+            raise ValueError(f"JSON 格式错误：数组元素之间应为逗号，实为 {ch!r}")
+
+
+def validate_homework(entry) -> dict:
+    """校验一条作业并规范化（id 转为字符串、scale 转为浮点数、键名驻留）；不合法时抛出 ValueError"""
+    if not isinstance(entry, dict):
+        raise ValueError("条目须为 JSON 对象")
+    # 逐条解析时每个条目各有一份键名字符串，驻留后所有条目共用
+    entry = {sys.intern(k): v for k, v in entry.items()}
+    hw_id = entry.get("id")
+    if isinstance(hw_id, bool) or not isinstance(hw_id, (str, int)) or not str(hw_id).strip():
+        raise ValueError("缺少 id")
+    entry["id"] = str(hw_id)
+    url = entry.get("url")
+    if not isinstance(url, str) or not url.startswith(("http://", "https://")):
+        raise ValueError(f"id={hw_id}：url 须以 http:// 或 https:// 开头")
+    if "scale" in entry:
+        try:
+            scale = float(entry["scale"]) if not isinstance(entry["scale"], bool) else None
+        except (TypeError, ValueError):
+            scale = None
+        if scale is None or not HW_SCALE_MIN <= scale <= HW_SCALE_MAX:
+            raise ValueError(f"id={hw_id}：scale 须为 {HW_SCALE_MIN}~{HW_SCALE_MAX} 之间的数字")
+        entry["scale"] = scale
+    if entry.get("orientation", "landscape") not in HW_ORIENTATIONS:
+        raise ValueError(f"id={hw_id}：orientation 须为 landscape 或 portrait")
+    for key in ("name", "lessonName"):
+        if not isinstance(entry.get(key, ""), str):
+            raise ValueError(f"id={hw_id}：{key} 须为字符串")
+    return entry
+
+
+def import_homework(store: HomeworkStore, fp, merge: bool = False, strict: bool = False, progress=None) -> dict:
+    """从二进制流导入作业配置；同一 id 出现多次时后者覆盖前者。strict 时遇到不合法条目即中止（不做任何修改），
+    否则跳过并记录原因。全部解析完才一次性换入 store，merge 为 False 时整体替换现有配置。返回导入统计"""
+    incoming, errors, total, invalid = {}, [], 0, 0
+    for i, entry in enumerate(iter_json_array(fp, progress)):
+        total += 1
+        try:
+            entry = validate_homework(entry)
+        except ValueError as e:
+            if strict:
+                raise ValueError(f"第 {i + 1} 项：{e}") from None
+            invalid += 1
+            if len(errors) < IMPORT_MAX_ERRORS:
+                errors.append(f"第 {i + 1} 项：{e}")
+            continue
+        incoming[entry["id"]] = entry
+    added = store.import_index(incoming, merge)
+    return {"total": total, "imported": len(incoming), "added": added,
+            "duplicates": total - invalid - len(incoming), "invalid": invalid, "errors": errors}
+
+
+def format_import_result(r: dict) -> str:
+    lines = [f"共 {r['total']} 项，导入 {r['imported']} 项（新增 {r['added']}）"]
+    if r["duplicates"]:
+        lines.append(f"重复 id {r['duplicates']} 项，已按最后出现的为准")
+    if r["invalid"]:
+        lines.append(f"跳过不合法条目 {r['invalid']} 项：\n" + "\n".join(r["errors"]) + ("\n..." if r["invalid"] > len(r["errors"]) else ""))
+    return "\n".join(lines)
+
+
+# ------------------------------------------------------------------
+# 监控：WSGI 层统计每个路由的请求数、耗时与响应大小直方图、状态码、在途请求、服务队列深度、资源发送字节数，
+# 以 Prometheus 文本格式导出。文件响应体原样交还服务器（不影响 sendfile），只接管其 close 以记录完成时间
+# ------------------------------------------------------------------
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 16777216, 268435456)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def prom_escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prom_labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{prom_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def prom_histogram(name: str, help_text: str, buckets: tuple, rows) -> list:
+    """rows: (路由, 各桶计数（含 +Inf 桶）, 总和, 次数)"""
+    out = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for route, counts, total, count in rows:
+        acc = 0
+        for bound, n in zip(buckets + ("+Inf",), counts):
+            acc += n
+            out.append(f"{name}_bucket{prom_labels(route=route, le=bound)} {acc}")
+        out.append(f"{name}_sum{prom_labels(route=route)} {total}")
+        out.append(f"{name}_count{prom_labels(route=route)} {count}")
+    return out
+
+
+def bucket_quantile(buckets, counts, q: float) -> Optional[float]:
+    """由直方图各桶计数估算分位数（取所在桶的上界，落在最后一个桶外时返回最大桶上界）"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank, acc = q * total, 0
+    for bound, n in zip(buckets, counts):
+        acc += n
+        if acc >= rank:
+            return bound
+    return buckets[-1]
+
+
+class RouteStats:
+    __slots__ = ("count", "errors", "seconds", "bytes", "latency", "sizes")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sizes = [0] * (len(SIZE_BUCKETS) + 1)
+
+
+class RequestMetrics:
+    """请求统计；路由取 Flask 的 URL 规则（应用在请求开始时写入 environ["qrqll.route"]），标签数量因此有上限"""
+
+    def __init__(self, resource_prefix: str):
+        self.resource_prefix = resource_prefix
+        self.started_at = time.time()
+        self.in_flight = 0
+        self.resource_bytes = 0
+        self.server = None
+        self._lock = Lock()
+        self._routes: Dict[str, RouteStats] = {}
+        self._status: Dict[tuple, int] = {}
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def end(self, route: str, method: str, status: int, seconds: float, nbytes: int, path: str):
+        with self._lock:
+            self.in_flight -= 1
+            s = self._routes.get(route)
+            if s is None:
+                s = self._routes[route] = RouteStats()
+            s.count += 1
+            s.seconds += seconds
+            s.bytes += nbytes
+            if status >= 500:
+                s.errors += 1
+            s.latency[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            s.sizes[bisect.bisect_left(SIZE_BUCKETS, nbytes)] += 1
+            key = (route, method, status)
+            self._status[key] = self._status.get(key, 0) + 1
+            if status < 400 and path.startswith(self.resource_prefix):
+                self.resource_bytes += nbytes
+
+    def summary(self) -> list:
+        """每个路由一项：count/errors/bytes/平均与 P95 耗时（秒），供界面展示"""
+        with self._lock:
+            return [{"route": r, "count": s.count, "errors": s.errors, "bytes": s.bytes, "avg": s.seconds / s.count if s.count else None,
+                     "p95": bucket_quantile(LATENCY_BUCKETS, s.latency, 0.95)} for r, s in self._routes.items()]
+
+    def gauges(self) -> list:
+        """[(名称, 说明, 值)]；服务引擎不提供的项不列出"""
+        result = [("qrqll_http_requests_in_flight", "正在处理的请求数（含尚未发送完的响应）", self.in_flight)]
+        if self.server is not None:
+            for name, help_text, value in (("qrqll_server_queue_depth", "等待工作线程的请求数", server_queue_depth(self.server)),
+                                           ("qrqll_server_connections", "打开的连接数", server_connections(self.server))):
+                if value is not None:
+                    result.append((name, help_text, value))
+        return result
+
+    def render(self) -> str:
+        with self._lock:
+            routes = sorted((r, s.count, s.seconds, s.bytes, list(s.latency), list(s.sizes)) for r, s in self._routes.items())
+            status = sorted(self._status.items())
+            resource_bytes = self.resource_bytes
+        out = ["# HELP qrqll_http_requests_total 按路由、方法、状态码统计的请求数", "# TYPE qrqll_http_requests_total counter"]
+        out += [f"qrqll_http_requests_total{prom_labels(route=r, method=m, status=c)} {n}" for (r, m, c), n in status]
+        out += prom_histogram("qrqll_http_request_duration_seconds", "从收到请求到响应体发送完毕的耗时", LATENCY_BUCKETS,
+                              ((r, lat, sec, n) for r, n, sec, _, lat, _ in routes))
+        out += prom_histogram("qrqll_http_response_size_bytes", "响应体字节数", SIZE_BUCKETS,
+                              ((r, sizes, nbytes, n) for r, n, _, nbytes, _, sizes in routes))
+        out += ["# HELP qrqll_resource_bytes_total 资源文件发送的字节数", "# TYPE qrqll_resource_bytes_total counter",
+                f"qrqll_resource_bytes_total {resource_bytes}"]
+        for name, help_text, value in self.gauges():
+            out += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+        out += ["# HELP qrqll_start_time_seconds 进程启动时间", "# TYPE qrqll_start_time_seconds gauge", f"qrqll_start_time_seconds {self.started_at}"]
+        return "\n".join(out) + "\n"
+
+
+class MeteredBody:
+    """普通响应体：迭代时累计字节数，close 时记录完成"""
+
+    def __init__(self, body, done):
+        self.body = body
+        self.done = done
+        self.bytes = 0
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.bytes += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            close = getattr(self.body, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self.done(self.bytes)
+
+
+class MetricsMiddleware:
+    def __init__(self, wsgi_app, metrics: RequestMetrics):
+        self.wsgi_app = wsgi_app
+        self.metrics = metrics
+
+    @staticmethod
+    def is_file_body(body, environ) -> bool:
+        # 服务器靠类型（Waitress）或 file/offset/length 属性（qrqll_async）识别可 sendfile 的响应体，不能再包一层
+        wrapper = environ.get("wsgi.file_wrapper")
+        return isinstance(body, FileSlice) or (isinstance(wrapper, type) and isinstance(body, wrapper))
+
+    def __call__(self, environ, start_response):
+        metrics = self.metrics
+        start = time.perf_counter()
+        state = {}
+
+        def metered_start_response(status, headers, exc_info=None):
+            state["status"] = int(status[:3])
+            state["length"] = next((v for k, v in headers if k.lower() == "content-length"), None)
+            return start_response(status, headers, exc_info)
+
+        def done(nbytes: int):
+            if state.get("done"):
+                return
+            state["done"] = True
+            metrics.end(environ.get("qrqll.route") or UNMATCHED_ROUTE, environ.get("REQUEST_METHOD", ""), state.get("status", 500),
+                        time.perf_counter() - start, nbytes, environ.get("PATH_INFO", ""))
+
+        metrics.begin()
+        try:
+            body = self.wsgi_app(environ, metered_start_response)
+        except BaseException:
+            done(0)
+            raise
+        if environ.get("REQUEST_METHOD") != "HEAD" and self.is_file_body(body, environ):
+            close = body.close
+
+            def metered_close():
+                try:
+                    close()
+                finally:
+                    done(int(state.get("length") or 0))
+            body.close = metered_close
+            return body
+        return MeteredBody(body, done)
+
+
+def server_queue_depth(server) -> Optional[int]:
+    """等待工作线程的请求数：Waitress 为任务队列长度，qrqll_async 为线程池中排队的任务数"""
+    dispatcher = getattr(server, "task_dispatcher", None)
+    if dispatcher is not None:
+        return len(dispatcher.queue)
+    return server.queue_depth() if hasattr(server, "queue_depth") else None
+
+
+def server_connections(server) -> Optional[int]:
+    channels = getattr(server, "active_channels", None)
+    return len(channels) if channels is not None else getattr(server, "connections", None)
+
+
+# ------------------------------------------------------------------
+# 文件响应体：FileSlice 保留 file/offset/length 供服务引擎 sendfile，否则用 mmap 切片
+# ------------------------------------------------------------------
+
+FILE_BLOCK_SIZE = 256 * 1024
+
+
+class FileSlice:
+    """文件区间响应体；保留 fileno/offset/length 供支持 sendfile 的服务引擎零拷贝发送"""
+
+    def __init__(self, f, offset: int, length: int):
+        self.file, self.offset, self.length = f, offset, length
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def __iter__(self):
+        if self.length <= 0:
+            return
+        with mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for pos in range(self.offset, self.offset + self.length, FILE_BLOCK_SIZE):
+                    yield bytes(view[pos:min(pos + FILE_BLOCK_SIZE, self.offset + self.length)])
+            finally:
+                view.release()
+
+    def close(self):
+        self.file.close()
+
+
+class MultipartRanges:
+    """multipart/byteranges 响应体。带 close() 的可迭代对象而不是生成器：direct_passthrough 时响应体原样交给服务器，
+    从未迭代过（HEAD、客户端提前断开）的生成器被 close 时不会执行 finally，文件要等到垃圾回收才关闭"""
+
+    def __init__(self, f, parts, tail: bytes):
+        self._f, self.parts, self.tail = f, parts, tail
+
+    def __iter__(self):
+        body = FileSlice(self._f, 0, 0)
+        for i, (head, a, b) in enumerate(self.parts):
+            yield (b"\r\n" if i else b"") + head
+            body.offset, body.length = a, b - a
+            yield from body
+        yield self.tail
+
+    def close(self):
+        self._f.close()
+
+
+# ------------------------------------------------------------------
+# 变更流：作业配置与资源目录的每次变更记一条事件并递增全局版本号，长轮询 / SSE 等待者阻塞在 Condition 上
+# ------------------------------------------------------------------
+
+CHANGES_MAX_IDS = 100
+
+
+class ChangeFeed:
+    """全局版本号 + 最近事件环形缓冲；等待者在 Condition 上阻塞，同时等待的数量有上限"""
+
+    def __init__(self, maxlen: int = 1024, max_waiters: int = 8):
+        self._cond = Condition()
+        self._events = deque(maxlen=maxlen)
+        self._waiters = 0
+        self.version = 0
+        self.max_waiters = max_waiters
+
+    def publish(self, source: str, action: str, ids=()):
+        ids = list(ids)
+        with self._cond:
+            self.version += 1
+            self._events.append({
+                "version": self.version, "source": source, "action": action, "ids": ids[:CHANGES_MAX_IDS],
+                "truncated": len(ids) > CHANGES_MAX_IDS, "time": round(time.time(), 3),
+            })
+            self._cond.notify_all()
+
+    def dump(self) -> dict:
+        with self._cond:
+            return {"version": self.version, "events": list(self._events)}
+
+    def restore(self, state: dict):
+        """换入另一进程 dump() 出的事件，唤醒等待者"""
+        with self._cond:
+            self._events.clear()
+            self._events.extend(state["events"])
+            self.version = state["version"]
+            self._cond.notify_all()
+
+    def _since(self, since: Optional[int]) -> Optional[list]:
+        # 事件版本号连续，可直接按下标切片；since 未知或已滚出缓冲区时返回 None
+        first = self._events[0]["version"] if self._events else self.version + 1
+        if since is None or since > self.version or since < first - 1:
+            return None
+        return list(islice(self._events, since - first + 1, None))
+
+    def wait(self, since: Optional[int], timeout: float):
+        """返回 (当前版本, 新于 since 的事件, 是否因等待者已满而未等待)；事件为 None 表示客户端应全量刷新。
+        since 已是最新时阻塞至多 timeout 秒"""
+        with self._cond:
+            if since == self.version and timeout > 0:
+                if self._waiters >= self.max_waiters:
+                    return self.version, [], True
+                self._waiters += 1
+                try:
+                    self._cond.wait_for(lambda: self.version != since, timeout)
+                finally:
+                    self._waiters -= 1
+            return self.version, self._since(since), False
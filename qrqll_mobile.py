@@ -4,13 +4,23 @@ KivyMD 桌面/Android 客户端，Flask 服务端内嵌
 """
 
 import os
-import sys
+import re
 import json
 import time
+import shutil
+import uuid
+import hashlib
+import mimetypes
 from threading import Thread, Lock
 from typing import Dict, Optional
 from datetime import datetime
+from types import MappingProxyType
 from socket import socket, AF_INET, SOCK_DGRAM
+from urllib.parse import quote
+from qrqll_core import (
+    HomeworkSnapshot, HomeworkStore, PARTIAL_SUFFIX, UPLOAD_META_SUFFIX, ResourceIndex, ConfigDB, ContentStore,
+    import_homework, RequestMetrics, MetricsMiddleware, FILE_BLOCK_SIZE, FileSlice, MultipartRanges, ChangeFeed,
+)
 
 # ============================================================
 # Kivy 配置 — 在 kivy.core.text 导入前设置全部渲染参数
@@ -41,7 +51,6 @@ if _FONT_PATH:
 # ============================================================
 import werkzeug.urls
 if not hasattr(werkzeug.urls, "url_quote"):
-    from urllib.parse import quote
     werkzeug.urls.url_quote = quote
 
 # ============================================================
@@ -60,21 +69,21 @@ from kivy.lang import Builder
 from kivy.metrics import dp
 from kivy.utils import platform as kivy_platform
 from kivy.core.window import Window
+from kivy.properties import StringProperty, ObjectProperty
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 
 from kivymd.app import MDApp
 from kivymd.uix.bottomnavigation import (
     MDBottomNavigation, MDBottomNavigationItem
 )
 from kivymd.uix.boxlayout import MDBoxLayout
-from kivymd.uix.list import (
-    MDList, TwoLineIconListItem, IconLeftWidget
-)
-from kivymd.uix.button import MDRaisedButton, MDFlatButton, MDIconButton
+from kivymd.uix.list import TwoLineIconListItem
+from kivymd.uix.button import MDRaisedButton, MDFlatButton
 from kivymd.uix.dialog import MDDialog
 from kivymd.uix.textfield import MDTextField
 from kivymd.uix.label import MDLabel
 from kivymd.uix.card import MDCard
-from kivymd.uix.scrollview import MDScrollView
 from kivymd.uix.toolbar import MDTopAppBar
 from kivymd.uix.selectioncontrol import MDSwitch
 from kivymd.uix.gridlayout import MDGridLayout
@@ -85,14 +94,16 @@ Window.softinput_mode = "below_target"
 # Flask 服务端
 # ============================================================
 
-HOMEWORK_DATA = [
+HOMEWORK_STORE = HomeworkStore([
     {"id": "1867975578577879042", "name": "百度搜索（横屏版）", "lessonName": "搜索", "url": "https://baidu.com", "scale": 0.5, "orientation": "landscape"},
     {"id": "1867975578577879043", "name": "百度搜索（竖屏版）", "lessonName": "搜索", "url": "https://baidu.com", "scale": 0.5, "orientation": "portrait"},
-]
+])
 ENABLE_CLOSE_HW = False
 ENABLE_LOGGING = False
 ENABLE_LOG_HEADERS = False
 LAST_SHUTDOWN_CLICK = 0
+# "waitress" 或 "asyncio"（qrqll_async：空闲长连接只占协程），下次启动服务器时生效
+SERVER_ENGINE = "waitress"
 _server_thread: Optional[Thread] = None
 _server_running = False
 _server_lock = Lock()
@@ -105,11 +116,67 @@ def get_resources_dir() -> str:
     return res_dir
 
 RESOURCES_DIR = get_resources_dir()
+RESOURCE_INDEX = ResourceIndex(RESOURCES_DIR, recursive=False)
+CONFIG_DB_NAME = "qrqll.db"
+CONFIG_DB: Optional[ConfigDB] = None
+
+
+def open_config_db(data_dir: str):
+    """作业配置在首次访问时从库中加载（库为空时沿用内置默认并写入）
+
+    库放在应用的 user_data_dir 下：Android 上程序目录不保证可写，升级时也会被替换
+    """
+    global CONFIG_DB
+    if CONFIG_DB is None:
+        os.makedirs(data_dir, exist_ok=True)
+        path = os.path.join(data_dir, CONFIG_DB_NAME)
+        CONFIG_DB = ConfigDB(path, HOMEWORK_STORE)
+        HOMEWORK_STORE.attach(CONFIG_DB.load_homework)
+
+
+def close_config_db():
+    if CONFIG_DB is not None:
+        CONFIG_DB.close()
+
+
+# 内容寻址存储（qrqll_core.ContentStore）：对象与哈希缓存放在 user_data_dir/.qrqll_cache，App 启动时才知道路径
+CONTENT_STORE_NAME = ".qrqll_cache"
+CONTENT_STORE = ContentStore(RESOURCE_INDEX)
+
+
+from flask import Flask, abort, jsonify, request
+from werkzeug.http import parse_range_header
+from werkzeug.security import safe_join
+from flask.json.provider import DefaultJSONProvider
+from waitress import create_server
+
+
+class SnapshotJSONProvider(DefaultJSONProvider):
+    """作业条目是只读映射（MappingProxyType），序列化时按普通字典处理"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, MappingProxyType):
+            return dict(o)
+        return DefaultJSONProvider.default(o)
+
+
+# ------------------------------------------------------------------
+# 监控：qrqll_core.MetricsMiddleware 在 WSGI 层统计每个路由的请求数、耗时、响应大小与状态码，以 Prometheus 文本格式从 /metrics 导出
+# ------------------------------------------------------------------
+
+METRICS = RequestMetrics("/api/v1/sync/resource/")
 
-from flask import Flask, jsonify, request, send_from_directory
-from waitress import serve
 
 app = Flask(__name__)
+app.json = SnapshotJSONProvider(app)
+app.wsgi_app = MetricsMiddleware(app.wsgi_app, METRICS)
+
+
+@app.before_request
+def mark_route():
+    if request.url_rule is not None:
+        request.environ["qrqll.route"] = request.url_rule.rule
 
 
 @app.after_request
@@ -134,27 +201,67 @@ def get_param(name: str, default: str = "") -> str:
     return request.args.get(name, default) if request.args.get(name) is not None else request.form.get(name, default)
 
 
-def build_homework_list_dynamic(page_index: int, page_size: int):
+# 进程启动标识，避免重启后版本号从 0 重新计数时与旧 ETag 撞车
+BOOT_ID = format(int(time.time() * 1000), "x")
+
+
+def is_not_modified(etag: str, last_modified: float = None) -> bool:
+    if request.method not in ("GET", "HEAD"):
+        return False
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified is not None and request.if_modified_since:
+        return int(last_modified) <= request.if_modified_since.timestamp()
+    return False
+
+
+def conditional_response(etag: str, last_modified: float, build):
+    """条件请求命中时在构建响应体之前直接返回 304；build 为生成完整响应的回调"""
+    resp = app.response_class(status=304) if is_not_modified(etag, last_modified) else build()
+    if resp.status_code in (200, 206, 304):
+        resp.set_etag(etag)
+        resp.last_modified = int(last_modified)
+        resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+def resource_etag(entry: dict) -> str:
+    # 内容哈希已算出时按内容给 ETag：同一内容换名、重新上传都不会让客户端缓存失效
+    digest = CONTENT_STORE.lookup(entry)
+    if digest:
+        return f"sha256-{digest}"
+    return f"{entry['fileId']}-{entry['size']:x}-{int(entry['mtime'] * 1e6):x}"
+
+
+def homework_list_response(page_index: int, page_size: int):
+    # ETag 与响应体取自同一快照，版本号和内容不会错开
+    snap = HOMEWORK_STORE.snapshot()
+    etag = f"hw-{BOOT_ID}-{snap.version}-{page_index}-{page_size}"
+    if page_size > 0:
+        return conditional_response(etag, snap.updated_at, lambda: build_homework_list_dynamic(page_index, page_size, snap))
+    return conditional_response(etag, snap.updated_at, lambda: build_homework_list_static(snap))
+
+
+def build_homework_list_dynamic(page_index: int, page_size: int, snap: HomeworkSnapshot = None):
+    snap = snap or HOMEWORK_STORE.snapshot()
     start = page_index * page_size
     end = start + page_size
-    items = HOMEWORK_DATA[start:end]
-    return ok({"total": len(HOMEWORK_DATA), "pageIndex": page_index, "pageSize": page_size, "results": items})
+    return ok({"total": len(snap.entries), "pageIndex": page_index, "pageSize": page_size, "results": snap.entries[start:end]})
 
 
-def build_homework_list_static():
-    return ok({"results": HOMEWORK_DATA, "total": len(HOMEWORK_DATA)})
+def build_homework_list_static(snap: HomeworkSnapshot = None):
+    snap = snap or HOMEWORK_STORE.snapshot()
+    return ok({"results": snap.entries, "total": len(snap.entries)})
 
 
 def close_homework(homework_id: str):
-    old_len = len(HOMEWORK_DATA)
-    HOMEWORK_DATA[:] = [hw for hw in HOMEWORK_DATA if hw.get("id") != homework_id]
-    return ok(message="删除成功" if len(HOMEWORK_DATA) < old_len else "未找到该作业")
+    return ok(message="删除成功" if HOMEWORK_STORE.delete(homework_id) else "未找到该作业")
 
 
 def close_homework_all():
     global ENABLE_CLOSE_HW
     if ENABLE_CLOSE_HW:
-        HOMEWORK_DATA.clear()
+        HOMEWORK_STORE.clear()
         return ok(message="已关闭所有作业")
     return ok(message="close_homework 功能未启用")
 
@@ -172,6 +279,334 @@ def get_host_ip() -> str:
         return "127.0.0.1"
 
 
+# ------------------------------------------------------------------
+# 资源文件发送：单/多区间 Range（206），优先交给服务器的 wsgi.file_wrapper
+# （Waitress 会在 I/O 线程里直接从文件推送，不占用工作线程），否则用 mmap 切片
+# ------------------------------------------------------------------
+
+MAX_RANGES = 16
+
+
+def parse_byte_ranges(size: int):
+    """返回 [(start, end_exclusive), ...]；无 Range 头或应忽略时返回 None，全部不可满足时返回 []"""
+    header = request.headers.get("Range")
+    if not header:
+        return None
+    rng = parse_range_header(header)
+    if rng is None or rng.units != "bytes" or len(rng.ranges) > MAX_RANGES:
+        return None
+    result = []
+    for start, stop in rng.ranges:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            result.append((start, stop))
+    return result
+
+
+def if_range_matches(etag: str, mtime: float) -> bool:
+    if_range = request.if_range
+    if if_range.etag:
+        return if_range.etag == etag
+    if if_range.date:
+        return int(mtime) <= if_range.date.timestamp()
+    return True
+
+
+def send_file_ranges(path: str, etag: str, mimetype: str = None, download_name: str = None):
+    f = open(path, "rb")
+    try:
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        mimetype = mimetype or mimetypes.guess_type(path)[0] or "application/octet-stream"
+        ranges = parse_byte_ranges(size) if "Range" in request.headers and if_range_matches(etag, st.st_mtime) else None
+        headers = {"Accept-Ranges": "bytes"}
+        if download_name:
+            headers["Content-Disposition"] = f'attachment; filename="{download_name.replace(chr(34), "")}"' if download_name.isascii() else f"attachment; filename*=UTF-8''{quote(download_name)}"
+        if ranges == []:
+            f.close()
+            headers["Content-Range"] = f"bytes */{size}"
+            return app.response_class(status=416, headers=headers)
+        if ranges and len(ranges) > 1:
+            boundary = uuid.uuid4().hex
+            parts = [(f"--{boundary}\r\nContent-Type: {mimetype}\r\nContent-Range: bytes {a}-{b - 1}/{size}\r\n\r\n".encode("ascii"), a, b) for a, b in ranges]
+            tail = f"\r\n--{boundary}--\r\n".encode("ascii")
+            length = sum(len(h) + (b - a) for h, a, b in parts) + 2 * (len(parts) - 1) + len(tail)
+            headers["Content-Length"] = str(length)
+            return app.response_class(MultipartRanges(f, parts, tail), status=206, headers=headers, mimetype=f"multipart/byteranges; boundary={boundary}", direct_passthrough=True)
+        start, stop = ranges[0] if ranges else (0, size)
+        if ranges:
+            headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        headers["Content-Length"] = str(stop - start)
+        wrapper = request.environ.get("wsgi.file_wrapper")
+        # Waitress 与 qrqll_async 的 file_wrapper 按当前读写位置和 Content-Length 截取，其余实现会一直读到文件末尾
+        if wrapper is not None and (stop == size or request.environ.get("SERVER_SOFTWARE", "").startswith(("waitress", "qrqll-async"))):
+            f.seek(start)
+            body = wrapper(f, FILE_BLOCK_SIZE)
+        else:
+            body = FileSlice(f, start, stop - start)
+        return app.response_class(body, status=206 if ranges else 200, headers=headers, mimetype=mimetype, direct_passthrough=True)
+    except Exception:
+        f.close()
+        raise
+
+
+# ------------------------------------------------------------------
+# 分块续传上传：init → PUT 分块（带 offset）→ commit
+# 数据直接追加写入 RESOURCES_DIR 下的隐藏临时文件，边写边算 SHA-256，commit 时原子改名
+# ------------------------------------------------------------------
+
+UPLOAD_CHUNK = 8 * 1024 * 1024  # 建议客户端每个分块的大小；断线后从最后一个完整写入的分块续传
+UPLOAD_BLOCK = 256 * 1024
+UPLOAD_EXPIRE = 24 * 3600
+_UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class UploadError(Exception):
+    def __init__(self, status: int, message: str, upload=None):
+        super().__init__(message)
+        self.status = status
+        self.upload = upload
+
+
+def safe_filename(name: str) -> str:
+    """只保留文件名部分（去掉任何目录），去掉控制字符和 Windows 保留字符；拒绝空名和以 . 开头的名字"""
+    name = (name or "").replace("\\", "/").rsplit("/", 1)[-1].strip()
+    name = "".join(ch for ch in name if ch >= " " and ch not in '<>:"|?*')
+    if not name or name.startswith("."):
+        raise ValueError("文件名不合法")
+    return name
+
+
+class ChunkedUpload:
+    __slots__ = ("id", "name", "size", "sha256", "offset", "hasher", "lock", "updated_at")
+
+    def __init__(self, upload_id: str, name: str, size: int, sha256: Optional[str], offset: int = 0):
+        self.id, self.name, self.size, self.sha256, self.offset = upload_id, name, size, sha256, offset
+        self.hasher = None
+        self.lock = Lock()
+        self.updated_at = time.time()
+
+    def to_dict(self) -> dict:
+        return {"uploadId": self.id, "name": self.name, "size": self.size, "offset": self.offset, "chunkSize": UPLOAD_CHUNK}
+
+
+class UploadManager:
+    """管理进行中的分块上传。元数据另存为同名的小文件，应用重启后按临时文件的实际长度续传
+    （首次续写前重新读一遍已写部分来恢复哈希状态）；不同文件可并发上传，同一上传同时只允许一个写入"""
+
+    def __init__(self, root: str, expire: float = UPLOAD_EXPIRE):
+        self.root = root
+        self.expire = expire
+        self._lock = Lock()
+        self._uploads: Dict[str, ChunkedUpload] = {}
+        self._loaded = False
+
+    def _paths(self, upload_id: str):
+        base = os.path.join(self.root, "." + upload_id)
+        return base + PARTIAL_SUFFIX, base + UPLOAD_META_SUFFIX
+
+    def _load(self):
+        # 首次使用时收集上次运行遗留的未完成上传
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            names = [n for n in os.listdir(self.root) if n.startswith(".") and n.endswith(UPLOAD_META_SUFFIX)]
+        except OSError:
+            return
+        for n in names:
+            upload_id = n[1:-len(UPLOAD_META_SUFFIX)]
+            part, meta = self._paths(upload_id)
+            try:
+                with open(meta, "r", encoding="utf-8") as f:
+                    m = json.load(f)
+                up = ChunkedUpload(upload_id, m["name"], int(m["size"]), m.get("sha256"), os.path.getsize(part))
+                up.updated_at = os.path.getmtime(part)
+            except (OSError, ValueError, KeyError):
+                continue
+            self._uploads[upload_id] = up
+
+    def cleanup(self):
+        """删除超过 expire 秒没有写入的上传"""
+        now = time.time()
+        with self._lock:
+            self._load()
+            stale = [up for up in self._uploads.values() if now - up.updated_at > self.expire and not up.lock.locked()]
+            for up in stale:
+                del self._uploads[up.id]
+        for up in stale:
+            self._remove_files(up.id)
+
+    def _remove_files(self, upload_id: str):
+        for p in self._paths(upload_id):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+    def init(self, name: str, size, sha256: Optional[str] = None) -> ChunkedUpload:
+        """新建上传；同名、同大小（且哈希相同）的未完成上传直接返回，客户端从其 offset 续传"""
+        try:
+            name = safe_filename(name)
+        except ValueError as e:
+            raise UploadError(400, str(e))
+        if isinstance(size, bool) or not isinstance(size, int) or size < 0:
+            raise UploadError(400, "size 须为非负整数")
+        if sha256 is not None:
+            sha256 = str(sha256).lower()
+            if not _SHA256_RE.match(sha256):
+                raise UploadError(400, "sha256 须为 64 位十六进制字符串")
+        self.cleanup()
+        with self._lock:
+            for up in self._uploads.values():
+                if up.name == name and up.size == size and up.sha256 == sha256:
+                    return up
+        if shutil.disk_usage(self.root).free < size:
+            raise UploadError(507, "存储空间不足")
+        up = ChunkedUpload(uuid.uuid4().hex, name, size, sha256)
+        part, meta = self._paths(up.id)
+        open(part, "wb").close()
+        tmp = meta + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"name": name, "size": size, "sha256": sha256}, f, ensure_ascii=False)
+        os.replace(tmp, meta)
+        with self._lock:
+            self._uploads[up.id] = up
+        return up
+
+    def get(self, upload_id: str) -> ChunkedUpload:
+        with self._lock:
+            self._load()
+            up = self._uploads.get(upload_id) if _UPLOAD_ID_RE.match(upload_id) else None
+        if up is None:
+            raise UploadError(404, "上传不存在或已过期")
+        return up
+
+    def _acquire(self, up: ChunkedUpload):
+        if not up.lock.acquire(blocking=False):
+            raise UploadError(409, "该上传正在写入", up)
+        if up.id not in self._uploads:
+            up.lock.release()
+            raise UploadError(404, "上传不存在或已过期")
+
+    def _ensure_hasher(self, up: ChunkedUpload, f):
+        if up.hasher is not None:
+            return
+        h = hashlib.sha256()
+        f.seek(0)
+        remaining = up.offset
+        while remaining:
+            block = f.read(min(UPLOAD_BLOCK, remaining))
+            if not block:
+                break
+            h.update(block)
+            remaining -= len(block)
+        up.hasher = h
+
+    def write(self, up: ChunkedUpload, offset: int, stream, length: Optional[int] = None) -> int:
+        """从 offset 处写入一个分块，返回新的 offset；offset 与已写入的长度不一致时返回 409 及当前 offset"""
+        self._acquire(up)
+        try:
+            if offset != up.offset:
+                raise UploadError(409, f"offset 应为 {up.offset}", up)
+            if length is not None and offset + length > up.size:
+                raise UploadError(413, "分块超出声明的文件大小", up)
+            part, _ = self._paths(up.id)
+            with open(part, "r+b") as f:
+                self._ensure_hasher(up, f)
+                # 上次写入中途失败时文件可能比已确认的 offset 长，先截掉
+                f.truncate(up.offset)
+                f.seek(up.offset)
+                while True:
+                    block = stream.read(UPLOAD_BLOCK)
+                    if not block:
+                        break
+                    if up.offset + len(block) > up.size:
+                        raise UploadError(413, "分块超出声明的文件大小", up)
+                    f.write(block)
+                    up.hasher.update(block)
+                    up.offset += len(block)
+                f.flush()
+                os.fsync(f.fileno())
+            up.updated_at = time.time()
+            return up.offset
+        except OSError as e:
+            # 写入失败后哈希状态与文件内容可能不一致，下次续写前按文件重新计算
+            up.hasher = None
+            try:
+                up.offset = min(up.offset, os.path.getsize(self._paths(up.id)[0]))
+            except OSError:
+                pass
+            raise UploadError(500, f"写入失败：{e}", up)
+        finally:
+            up.lock.release()
+
+    def commit(self, up: ChunkedUpload, sha256: Optional[str] = None) -> dict:
+        """校验长度与 SHA-256 后原子改名为目标文件，返回 {name, size, sha256, path}；校验失败时丢弃这次上传"""
+        self._acquire(up)
+        try:
+            if up.offset != up.size:
+                raise UploadError(409, f"尚未传完：{up.offset}/{up.size}", up)
+            part, meta = self._paths(up.id)
+            with open(part, "rb") as f:
+                self._ensure_hasher(up, f)
+            digest = up.hasher.hexdigest()
+            expected = (sha256 or up.sha256 or "").lower()
+            if expected and expected != digest:
+                with self._lock:
+                    self._uploads.pop(up.id, None)
+                self._remove_files(up.id)
+                raise UploadError(422, "SHA-256 校验失败，请重新上传")
+            dest = os.path.join(self.root, up.name)
+            CONTENT_STORE.ingest(part, dest, digest)
+            with self._lock:
+                self._uploads.pop(up.id, None)
+            self._remove_files(up.id)
+            return {"name": up.name, "size": up.size, "sha256": digest, "path": dest}
+        finally:
+            up.lock.release()
+
+    def abort(self, up: ChunkedUpload):
+        self._acquire(up)
+        try:
+            with self._lock:
+                self._uploads.pop(up.id, None)
+            self._remove_files(up.id)
+        finally:
+            up.lock.release()
+
+
+UPLOADS = UploadManager(RESOURCES_DIR)
+
+
+def save_uploaded_file(file) -> str:
+    """multipart 上传：先写入隐藏临时文件再原子改名，返回安全化后的文件名"""
+    name = safe_filename(file.filename)
+    dest = os.path.join(RESOURCES_DIR, name)
+    tmp = os.path.join(RESOURCES_DIR, f".{uuid.uuid4().hex}{PARTIAL_SUFFIX}")
+    try:
+        file.save(tmp)
+        os.replace(tmp, dest)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    RESOURCE_INDEX.touch(dest)
+    return name
+
+
+def upload_error_response(e: UploadError):
+    resp = ok(e.upload.to_dict() if e.upload is not None else None, message=str(e))
+    resp.status_code = e.status
+    return resp
+
+
 # ------------------------------------------------------------------
 # API 路由
 # ------------------------------------------------------------------
@@ -191,59 +626,192 @@ def api_homework_list():
         ps = int(request.args.get("pageSize", 0))
     except ValueError:
         pi = ps = 0
-    if ps > 0:
-        return build_homework_list_dynamic(pi, ps)
-    return build_homework_list_static()
+    return homework_list_response(pi, ps)
 
 
 @app.route("/api/v1/sync/resource", methods=["POST"])
 def api_resource_upload():
     if "resource" not in request.files:
         return ok(message="未上传文件")
-    file = request.files["resource"]
-    dest = os.path.join(get_resources_dir(), file.filename)
-    file.save(dest)
-    return ok(message=f"文件已保存: {file.filename}")
+    try:
+        name = save_uploaded_file(request.files["resource"])
+    except ValueError as e:
+        return ok(message=str(e))
+    return ok(message=f"文件已保存: {name}")
 
 
 @app.route("/api/v1/sync/list", methods=["GET"])
 def api_resource_list():
-    try:
-        files = os.listdir(get_resources_dir())
-    except Exception:
-        files = []
-    items = []
-    for f in files:
-        fpath = os.path.join(get_resources_dir(), f)
-        items.append({"name": f, "size": os.path.getsize(fpath) if os.path.isfile(fpath) else 0})
-    return ok(items)
+    etag = f"res-{BOOT_ID}-{RESOURCE_INDEX.version}-{CONTENT_STORE.version}"
+    return conditional_response(etag, RESOURCE_INDEX.updated_at, lambda: ok([
+        {"name": e["name"], "size": e["size"], "sha256": CONTENT_STORE.lookup(e)} for e in RESOURCE_INDEX.items()
+    ]))
 
 
 @app.route("/api/v1/sync/resource/<filename>", methods=["GET"])
 def api_resource_download(filename: str):
-    return send_from_directory(get_resources_dir(), filename, as_attachment=True)
+    path = safe_join(RESOURCES_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    # 索引键用 safe_join 规范化后的相对路径，URL 里的 ./、../、// 写法不会产生多余条目
+    rel = RESOURCE_INDEX.relpath(path)
+    entry = RESOURCE_INDEX.get(rel)
+    if entry is None:
+        RESOURCE_INDEX.touch(rel)
+        entry = RESOURCE_INDEX.get(rel)
+        if entry is None:
+            abort(404)
+    etag = resource_etag(entry)
+    return conditional_response(etag, entry["mtime"], lambda: send_file_ranges(path, etag, download_name=entry["name"]))
 
 
 @app.route("/api/v1/config/course/key/closeHW/", methods=["GET"])
 def api_close_hw_push():
     pi = int(request.args.get("pageIndex", 0))
     ps = int(request.args.get("pageSize", 0))
-    return build_homework_list_dynamic(pi, ps) if ps > 0 else build_homework_list_static()
+    return homework_list_response(pi, ps)
 
 
 @app.route("/api/v1/config/course/set", methods=["POST"])
 def api_course_set():
-    data = request.json or {}
-    for item in data:
-        HOMEWORK_DATA.append(item)
-    return ok(HOMEWORK_DATA, message="配置已更新")
+    # 边接收边解析；任一条目不合法则整批不生效
+    try:
+        import_homework(HOMEWORK_STORE, request.stream, merge=True, strict=True)
+    except ValueError as e:
+        return ok(message=str(e))
+    return ok(HOMEWORK_STORE.items(), message="配置已更新")
 
 
 @app.route("/api/v1/sync/resource/batch", methods=["POST"])
 def api_resource_batch_upload():
+    skipped = []
     for f in request.files.getlist("resource"):
-        f.save(os.path.join(get_resources_dir(), f.filename))
-    return ok(message="批量上传完成")
+        try:
+            save_uploaded_file(f)
+        except ValueError:
+            skipped.append(f.filename)
+    return ok(message="批量上传完成" + (f"，跳过不合法的文件名: {', '.join(skipped)}" if skipped else ""))
+
+
+@app.route("/api/v1/sync/upload", methods=["POST"])
+def api_upload_init():
+    data = request.get_json(silent=True) or {}
+    try:
+        up = UPLOADS.init(data.get("name"), data.get("size"), data.get("sha256"))
+    except UploadError as e:
+        return upload_error_response(e)
+    return ok(up.to_dict())
+
+
+@app.route("/api/v1/sync/upload/<upload_id>", methods=["GET", "PUT", "DELETE"])
+def api_upload_chunk(upload_id: str):
+    try:
+        up = UPLOADS.get(upload_id)
+        if request.method == "GET":
+            return ok(up.to_dict())
+        if request.method == "DELETE":
+            UPLOADS.abort(up)
+            return ok(message="已取消上传")
+        try:
+            offset = int(request.args.get("offset", ""))
+        except ValueError:
+            raise UploadError(400, "缺少 offset 参数", up)
+        UPLOADS.write(up, offset, request.stream, request.content_length)
+        return ok(up.to_dict())
+    except UploadError as e:
+        return upload_error_response(e)
+
+
+@app.route("/api/v1/sync/upload/<upload_id>/commit", methods=["POST"])
+def api_upload_commit(upload_id: str):
+    data = request.get_json(silent=True) or {}
+    try:
+        result = UPLOADS.commit(UPLOADS.get(upload_id), data.get("sha256"))
+    except UploadError as e:
+        return upload_error_response(e)
+    RESOURCE_INDEX.touch(result.pop("path"))
+    return ok(result, message=f"文件已保存: {result['name']}")
+
+
+# ------------------------------------------------------------------
+# 变更流：作业配置与资源目录的每次变更记一条事件并递增全局版本号
+# 客户端带上已知版本长轮询 /api/v1/changes（或以 Accept: text/event-stream 订阅 SSE），
+# 版本落后时立即返回，否则阻塞到下一次变更或超时
+# ------------------------------------------------------------------
+
+CHANGES_DEFAULT_WAIT = 25
+CHANGES_MAX_WAIT = 60
+CHANGES_HEARTBEAT = 15
+CHANGES_STREAM_MAX = 300  # SSE 连接持续这么久后让客户端重连，释放工作线程
+CHANGES_RETRY_MS = 5000
+
+
+CHANGE_FEED = ChangeFeed(maxlen=256, max_waiters=2)
+HOMEWORK_STORE.subscribe(lambda action, ids: CHANGE_FEED.publish("homework", action, ids))
+
+
+def on_resource_change(changed, removed):
+    if changed:
+        CHANGE_FEED.publish("resources", "upsert", changed)
+    if removed:
+        CHANGE_FEED.publish("resources", "delete", removed)
+
+
+RESOURCE_INDEX.subscribe(on_resource_change)
+
+
+def change_cursor() -> Optional[int]:
+    """客户端已知的版本：SSE 重连时取 Last-Event-ID（boot-version），否则取 since/boot 参数；来自上一次启动的版本视为未知"""
+    last = request.headers.get("Last-Event-ID", "")
+    if last:
+        boot, _, since = last.rpartition("-")
+    else:
+        boot, since = get_param("boot"), get_param("since")
+    if boot and boot != BOOT_ID:
+        return None
+    try:
+        return int(since)
+    except ValueError:
+        return None
+
+
+def sse_event(name: str, data, version: int) -> str:
+    return f"id: {BOOT_ID}-{version}\nevent: {name}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+def change_stream(since: Optional[int]):
+    yield f"retry: {CHANGES_RETRY_MS}\n\n"
+    deadline = time.monotonic() + CHANGES_STREAM_MAX
+    while time.monotonic() < deadline:
+        version, events, busy = CHANGE_FEED.wait(since, CHANGES_HEARTBEAT)
+        # 等待者已满：结束本次连接，客户端按 retry 间隔重连
+        if busy:
+            return
+        if events is None:
+            yield sse_event("reset", {"boot": BOOT_ID, "version": version}, version)
+        elif events:
+            for e in events:
+                yield sse_event("change", e, e["version"])
+        else:
+            yield ": ping\n\n"
+        since = version
+
+
+@app.route("/api/v1/changes", methods=["GET"])
+def api_changes():
+    since = change_cursor()
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        return app.response_class(change_stream(since), mimetype="text/event-stream",
+                                  headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    try:
+        timeout = min(max(float(get_param("timeout", CHANGES_DEFAULT_WAIT)), 0), CHANGES_MAX_WAIT)
+    except ValueError:
+        timeout = CHANGES_DEFAULT_WAIT
+    version, events, busy = CHANGE_FEED.wait(since, timeout)
+    resp = ok({"boot": BOOT_ID, "version": version, "reset": events is None, "events": events or [],
+               "retry": CHANGES_RETRY_MS if busy else 0})
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
 
 
 @app.route("/api/v1/shutdown", methods=["POST"])
@@ -251,10 +819,16 @@ def api_shutdown():
     func = request.environ.get("werkzeug.server.shutdown")
     if func:
         func()
+    close_config_db()
     os._exit(0)
     return ok(message="服务器已关闭")
 
 
+@app.route("/metrics", methods=["GET"])
+def api_metrics():
+    return app.response_class(METRICS.render(), mimetype="text/plain; version=0.0.4", headers={"Cache-Control": "no-store"})
+
+
 @app.route("/", defaults={"path": ""})
 @app.route("/<path:path>")
 def catch_all(path):
@@ -264,7 +838,19 @@ def catch_all(path):
 def _run_server():
     global _server_running
     _server_running = True
-    serve(app, host="0.0.0.0", port=2417)
+    threads = 16 if SERVER_ENGINE == "asyncio" else 4
+    # 长轮询/SSE 每个等待者占一个工作线程，至多占一半，留给普通请求
+    CHANGE_FEED.max_waiters = threads // 2
+    if SERVER_ENGINE == "asyncio":
+        from qrqll_async import create_server as create_async_server
+        METRICS.server = create_async_server(app, host="0.0.0.0", port=2417, threads=threads)
+    else:
+        METRICS.server = create_server(app, host="0.0.0.0", port=2417, threads=threads)
+    METRICS.server.print_listen("Serving on http://{}:{}")
+    try:
+        METRICS.server.run()
+    finally:
+        METRICS.server = None
     _server_running = False
 
 
@@ -299,6 +885,74 @@ def _toast(msg):
         print(f"[提示] {msg}")
 
 
+# ============================================================
+# 虚拟化列表（RecycleView 只为可见行创建控件，滚动时复用）
+# ============================================================
+
+Builder.load_string("""
+<ListRow>:
+    IconLeftWidget:
+        icon: root.icon
+""")
+
+
+class ListRow(TwoLineIconListItem):
+    """RecycleView 复用的列表行：图标、行键和点击回调都是属性，由 data 逐项赋值"""
+    icon = StringProperty("file")
+    row_key = StringProperty("")
+    callback = ObjectProperty(None, allownone=True)
+
+    def on_release(self):
+        if self.callback is not None:
+            self.callback(self.row_key)
+
+
+def _build_recycle_list():
+    rv = RecycleView(viewclass="ListRow")
+    layout = RecycleBoxLayout(
+        orientation="vertical",
+        default_size=(None, dp(72)),
+        default_size_hint=(1, None),
+        size_hint_y=None,
+    )
+    layout.bind(minimum_height=layout.setter("height"))
+    rv.add_widget(layout)
+    return rv
+
+
+class RecycleRows:
+    """RecycleView 的数据模型：按 key 与上次内容比较，
+    顺序不变时只替换有变化的行（只刷新这些行），增删或换序时整体替换 data"""
+
+    def __init__(self, rv):
+        self.rv = rv
+        self._keys = []
+        self._rows = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def sync(self, rows):
+        """rows: 按显示顺序排列的 (key, data 字典) 序列"""
+        keys, new = [], {}
+        for key, row in rows:
+            keys.append(key)
+            new[key] = row
+        if keys == self._keys:
+            data = self.rv.data
+            for i, key in enumerate(keys):
+                if new[key] != self._rows[key]:
+                    data[i] = new[key]
+        else:
+            self.rv.data = [new[k] for k in keys]
+        self._keys, self._rows = keys, new
+
+
+def _set_placeholder(label, visible):
+    label.height = dp(80) if visible else 0
+    label.opacity = 1 if visible else 0
+
+
 # ============================================================
 # KivyMD App
 # ============================================================
@@ -312,6 +966,8 @@ class QRQLLMobileApp(MDApp):
         self.dialog = None
 
     def build(self):
+        # 界面构建时就要读作业列表，先挂上配置库
+        open_config_db(self.user_data_dir)
         self.theme_cls.primary_palette = "Blue"
         self.theme_cls.theme_style = "Light"
 
@@ -374,11 +1030,15 @@ class QRQLLMobileApp(MDApp):
         btn_row.add_widget(MDRaisedButton(text="添加文件", icon="file-plus", on_release=self.on_add_resource))
         btn_row.add_widget(MDRaisedButton(text="刷新列表", icon="refresh", on_release=self.on_refresh_resources))
         box.add_widget(btn_row)
-        scroll = MDScrollView()
-        self.resources_list_widget = MDList()
-        scroll.add_widget(self.resources_list_widget)
-        box.add_widget(scroll)
+        self.resources_empty_label = MDLabel(text="没有资源文件\n通过电脑传输文件到 resources 目录", halign="center", theme_text_color="Secondary", size_hint_y=None, height=0, opacity=0)
+        box.add_widget(self.resources_empty_label)
+        rv = _build_recycle_list()
+        self.resources_rows = RecycleRows(rv)
+        box.add_widget(rv)
         Clock.schedule_once(lambda dt: self.refresh_resources_list(), 0.5)
+        # 同一帧内的多次索引变更合并为一次刷新
+        self._resources_trigger = Clock.create_trigger(lambda dt: self.refresh_resources_list())
+        RESOURCE_INDEX.subscribe(lambda changed, removed: self._resources_trigger())
         return box
 
     def on_add_resource(self, instance):
@@ -393,37 +1053,39 @@ class QRQLLMobileApp(MDApp):
             root.destroy()
             if fpath:
                 import shutil
-                shutil.copy2(fpath, os.path.join(get_resources_dir(), os.path.basename(fpath)))
-                self.refresh_resources_list()
+                dest = os.path.join(RESOURCES_DIR, os.path.basename(fpath))
+                shutil.copy2(fpath, dest)
+                RESOURCE_INDEX.touch(dest)
                 _toast(f"已添加: {os.path.basename(fpath)}")
         except Exception as e:
             _toast(f"添加失败: {e}")
 
     def on_refresh_resources(self, instance):
+        RESOURCE_INDEX.scan()
         self.refresh_resources_list()
         _toast("已刷新")
 
+    def resource_row(self, e):
+        size = e["size"]
+        sz = f"{size/1024:.1f} KB" if size < 1024*1024 else f"{size/1024/1024:.1f} MB"
+        return e["path"], {
+            "text": e["name"],
+            "secondary_text": sz,
+            "icon": "file",
+            "row_key": e["name"],
+            "callback": self.on_delete_resource,
+        }
+
     def refresh_resources_list(self):
-        self.resources_list_widget.clear_widgets()
-        try:
-            files = sorted(os.listdir(get_resources_dir()))
-        except Exception:
-            files = []
-        if not files:
-            self.resources_list_widget.add_widget(MDLabel(text="没有资源文件\n通过电脑传输文件到 resources 目录", halign="center", theme_text_color="Secondary", size_hint_y=None, height=dp(80)))
-            return
-        for fname in files:
-            fpath = os.path.join(get_resources_dir(), fname)
-            size = os.path.getsize(fpath) if os.path.isfile(fpath) else 0
-            sz = f"{size/1024:.1f} KB" if size < 1024*1024 else f"{size/1024/1024:.1f} MB"
-            item = TwoLineIconListItem(text=fname, secondary_text=sz, on_release=lambda x, fn=fname: self.on_delete_resource(fn))
-            item.add_widget(IconLeftWidget(icon="file"))
-            self.resources_list_widget.add_widget(item)
+        entries = RESOURCE_INDEX.items()
+        _set_placeholder(self.resources_empty_label, not entries)
+        self.resources_rows.sync(self.resource_row(e) for e in entries)
 
     def on_delete_resource(self, fname):
         try:
-            os.remove(os.path.join(get_resources_dir(), fname))
-            self.refresh_resources_list()
+            dest = os.path.join(RESOURCES_DIR, fname)
+            os.remove(dest)
+            RESOURCE_INDEX.touch(dest)
             _toast(f"已删除: {fname}")
         except Exception as e:
             _toast(f"删除失败: {e}")
@@ -437,10 +1099,11 @@ class QRQLLMobileApp(MDApp):
         btn_row.add_widget(MDRaisedButton(text="导出 JSON", icon="file-export", on_release=self.on_export_homework))
         btn_row.add_widget(MDRaisedButton(text="导入 JSON", icon="file-import", on_release=self.on_import_homework))
         box.add_widget(btn_row)
-        scroll = MDScrollView()
-        self.hw_list_widget = MDList()
-        scroll.add_widget(self.hw_list_widget)
-        box.add_widget(scroll)
+        self.hw_empty_label = MDLabel(text="没有上网配置\n点击「添加上网」新建", halign="center", theme_text_color="Secondary", size_hint_y=None, height=0, opacity=0)
+        box.add_widget(self.hw_empty_label)
+        rv = _build_recycle_list()
+        self.hw_rows = RecycleRows(rv)
+        box.add_widget(rv)
         Clock.schedule_once(lambda dt: self.refresh_hw_list(), 0.5)
         return box
 
@@ -450,9 +1113,10 @@ class QRQLLMobileApp(MDApp):
     def on_export_homework(self, instance):
         try:
             if kivy_platform == "android":
-                p = os.path.join(get_resources_dir(), "homework_config.json")
+                p = os.path.join(RESOURCES_DIR, "homework_config.json")
                 with open(p, "w", encoding="utf-8") as f:
-                    json.dump(HOMEWORK_DATA, f, ensure_ascii=False, indent=2)
+                    json.dump(HOMEWORK_STORE.to_list(), f, ensure_ascii=False, indent=2)
+                RESOURCE_INDEX.touch(p)
                 _toast("已导出到 resources 目录")
                 return
             from tkinter import Tk, filedialog
@@ -462,7 +1126,7 @@ class QRQLLMobileApp(MDApp):
             root.destroy()
             if fp:
                 with open(fp, "w", encoding="utf-8") as f:
-                    json.dump(HOMEWORK_DATA, f, ensure_ascii=False, indent=2)
+                    json.dump(HOMEWORK_STORE.to_list(), f, ensure_ascii=False, indent=2)
                 _toast("已导出")
         except Exception as e:
             _toast(f"导出失败: {e}")
@@ -478,35 +1142,45 @@ class QRQLLMobileApp(MDApp):
             fp = filedialog.askopenfilename(filetypes=[("JSON", "*.json")])
             root.destroy()
             if fp:
-                with open(fp, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                HOMEWORK_DATA.clear()
-                HOMEWORK_DATA.extend(data)
-                self.refresh_hw_list()
-                _toast(f"已导入 {len(data)} 项")
+                _toast("正在导入...")
+                Thread(target=self._import_homework_file, args=(fp,), daemon=True).start()
         except Exception as e:
             _toast(f"导入失败: {e}")
 
-    def refresh_hw_list(self):
-        self.hw_list_widget.clear_widgets()
-        if not HOMEWORK_DATA:
-            self.hw_list_widget.add_widget(MDLabel(text="没有上网配置\n点击「添加上网」新建", halign="center", theme_text_color="Secondary", size_hint_y=None, height=dp(80)))
+    def _import_homework_file(self, fp):
+        # 解析与校验在后台线程完成，最后一次性换入，界面不会卡住
+        try:
+            with open(fp, "rb") as f:
+                r = import_homework(HOMEWORK_STORE, f)
+        except (OSError, ValueError) as e:
+            # except 块结束后 e 会被删除，回调执行时才取会 NameError，先格式化好
+            err = f"导入失败: {e}"
+            Clock.schedule_once(lambda dt: _toast(err))
             return
-        for idx, hw in enumerate(HOMEWORK_DATA):
-            ori = hw.get("orientation", "portrait")
-            item = TwoLineIconListItem(
-                text=hw.get("name", "未命名"),
-                secondary_text=f"{hw.get('url','')} | {'横屏' if ori=='landscape' else '竖屏'} x{hw.get('scale',1.0)}",
-                on_release=lambda x, i=idx: self.on_edit_homework(i),
-            )
-            item.add_widget(IconLeftWidget(icon="rotate-3d" if ori == "landscape" else "cellphone"))
-            self.hw_list_widget.add_widget(item)
-
-    def on_edit_homework(self, idx):
-        self.show_hw_editor(idx, HOMEWORK_DATA[idx])
-
-    def show_hw_editor(self, idx, hw=None):
-        is_new = idx is None
+        msg = f"已导入 {r['imported']} 项" + (f"，跳过 {r['invalid']} 项不合法条目" if r["invalid"] else "")
+        Clock.schedule_once(lambda dt: (self.refresh_hw_list(), _toast(msg)))
+
+    def homework_row(self, hw):
+        ori = hw.get("orientation", "portrait")
+        return hw["id"], {
+            "text": hw.get("name", "未命名"),
+            "secondary_text": f"{hw.get('url','')} | {'横屏' if ori=='landscape' else '竖屏'} x{hw.get('scale',1.0)}",
+            "icon": "rotate-3d" if ori == "landscape" else "cellphone",
+            "row_key": hw["id"],
+            "callback": self.on_edit_homework,
+        }
+
+    def refresh_hw_list(self):
+        _set_placeholder(self.hw_empty_label, not len(HOMEWORK_STORE))
+        self.hw_rows.sync(self.homework_row(hw) for hw in HOMEWORK_STORE.items())
+
+    def on_edit_homework(self, hw_id):
+        hw = HOMEWORK_STORE.get(hw_id)
+        if hw:
+            self.show_hw_editor(hw_id, hw)
+
+    def show_hw_editor(self, hw_id, hw=None):
+        is_new = hw_id is None
         hw = hw or {"name": "", "url": "", "scale": 0.5, "orientation": "landscape"}
         if self.dialog:
             self.dialog.dismiss()
@@ -528,13 +1202,13 @@ class QRQLLMobileApp(MDApp):
             title="编辑上网配置" if not is_new else "添加上网配置",
             type="custom", content_cls=ct,
             buttons=[
-                MDFlatButton(text="删除" if not is_new else "取消", on_release=lambda x: self._hw_delete(idx) if not is_new else self.dialog.dismiss()),
-                MDFlatButton(text="保存", on_release=lambda x: self._hw_save(idx, is_new, nf.text.strip(), uf.text.strip(), sf.text.strip())),
+                MDFlatButton(text="删除" if not is_new else "取消", on_release=lambda x: self._hw_delete(hw_id) if not is_new else self.dialog.dismiss()),
+                MDFlatButton(text="保存", on_release=lambda x: self._hw_save(hw_id, is_new, nf.text.strip(), uf.text.strip(), sf.text.strip())),
             ],
         )
         self.dialog.open()
 
-    def _hw_save(self, idx, is_new, name, url, scale_str):
+    def _hw_save(self, hw_id, is_new, name, url, scale_str):
         if not name or not url:
             _toast("名称和 URL 不能为空")
             return
@@ -542,21 +1216,19 @@ class QRQLLMobileApp(MDApp):
             scale = max(0.1, min(1.0, float(scale_str)))
         except ValueError:
             scale = 0.5
-        entry = {"id": f"hw_{datetime.now().strftime('%Y%m%d%H%M%S')}", "name": name, "lessonName": name, "url": url, "scale": scale, "orientation": self._cur_ori}
-        if is_new:
-            HOMEWORK_DATA.append(entry)
-        else:
-            entry["id"] = HOMEWORK_DATA[idx]["id"]
-            HOMEWORK_DATA[idx] = entry
+        entry = {"id": f"hw_{datetime.now().strftime('%Y%m%d%H%M%S%f')}", "name": name, "lessonName": name, "url": url, "scale": scale, "orientation": self._cur_ori}
+        if not is_new:
+            entry["id"] = hw_id
+        HOMEWORK_STORE.upsert(entry)
         if self.dialog:
             self.dialog.dismiss()
         self.refresh_hw_list()
         _toast("已保存")
 
-    def _hw_delete(self, idx):
-        if 0 <= idx < len(HOMEWORK_DATA):
-            name = HOMEWORK_DATA[idx]["name"]
-            del HOMEWORK_DATA[idx]
+    def _hw_delete(self, hw_id):
+        hw = HOMEWORK_STORE.get(hw_id)
+        if hw and HOMEWORK_STORE.delete(hw_id):
+            name = hw["name"]
             if self.dialog:
                 self.dialog.dismiss()
             self.refresh_hw_list()
@@ -592,6 +1264,12 @@ class QRQLLMobileApp(MDApp):
         self.log_switch.bind(active=lambda i, v: globals().update(ENABLE_LOGGING=v))
         lgr.add_widget(self.log_switch)
         box.add_widget(lgr)
+        egr = MDBoxLayout(orientation="horizontal", size_hint_y=None, height=dp(48), spacing=dp(8))
+        egr.add_widget(MDLabel(text="asyncio 引擎（重启服务器生效）", size_hint_x=0.7))
+        self.engine_switch = MDSwitch(active=SERVER_ENGINE == "asyncio", size_hint_x=0.3)
+        self.engine_switch.bind(active=lambda i, v: globals().update(SERVER_ENGINE="asyncio" if v else "waitress"))
+        egr.add_widget(self.engine_switch)
+        box.add_widget(egr)
         box.add_widget(MDLabel(text="QRQLL Mobile v1.0\n基于 QRQLL V2.3 移植\n使用 KivyMD 构建", halign="center", theme_text_color="Secondary", size_hint_y=None, height=dp(80)))
         box.add_widget(MDBoxLayout())
         Clock.schedule_once(lambda dt: self.refresh_settings(), 0.5)
@@ -621,10 +1299,12 @@ class QRQLLMobileApp(MDApp):
         self.refresh_settings()
 
     def on_start(self):
+        store_dir = os.path.join(self.user_data_dir, CONTENT_STORE_NAME)
+        Thread(target=lambda: (RESOURCE_INDEX.start(), CONTENT_STORE.start(store_dir)), daemon=True).start()
         Clock.schedule_once(lambda dt: Thread(target=start_server, daemon=True).start(), 2.0)
 
     def on_stop(self):
-        pass
+        close_config_db()
 
 
 if __name__ == "__main__":